@@ -12,6 +12,7 @@ from .movie_agent import MovieAgent
 from .movie_reviews_agent import MovieReviewsAgent
 from .implementation_agent import ImplementationAgent
 from .planning_agent import PlanningAgent
+from .reviewer_agent import ReviewerAgent
 from .supervisor_agent import SupervisorAgent
 
 # Expose the main classes and agents for easy access
@@ -25,6 +26,7 @@ __all__ = [
     'MovieReviewsAgent',
     'ImplementationAgent',
     'PlanningAgent',
+    'ReviewerAgent',
     'SupervisorAgent',
 ]
 
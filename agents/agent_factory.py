@@ -7,9 +7,9 @@ class AgentFactory:
         cls._agents[agent_class.__name__] = agent_class
     
     @classmethod
-    def create_agent(cls, agent_type: str):
-        """Create an agent instance"""
+    def create_agent(cls, agent_type: str, **kwargs):
+        """Create an agent instance, passing any keyword arguments to its constructor"""
         agent_class = cls._agents.get(agent_type)
         if agent_class:
-            return agent_class()
+            return agent_class(**kwargs)
         return None 
\ No newline at end of file
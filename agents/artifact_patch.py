@@ -0,0 +1,150 @@
+"""
+Patch-style edits for artifact files, so agents can change a few lines without
+regenerating the whole file.
+"""
+import hashlib
+import re
+import threading
+from typing import Dict, List
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class PatchConflictError(Exception):
+    """Raised when a patch doesn't apply to the artifact's current contents"""
+    pass
+
+def content_hash(text: str) -> str:
+    """Short hash of an artifact's contents, shown to the model for conflict detection."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+def check_base_hash(current: str, base_hash: str) -> None:
+    """Raise PatchConflictError if the artifact changed since the model read it.
+
+    An empty base_hash skips the check.
+    """
+    if base_hash and base_hash != content_hash(current):
+        raise PatchConflictError(
+            f"artifact has changed since hash {base_hash} (now {content_hash(current)}); "
+            "re-read the artifact and recreate the edit"
+        )
+
+def _split(text: str) -> tuple[List[str], bool]:
+    return text.split("\n") if text else [], text.endswith("\n")
+
+def _join(lines: List[str], trailing_newline: bool) -> str:
+    text = "\n".join(lines)
+    if trailing_newline and not text.endswith("\n"):
+        text += "\n"
+    return text
+
+def _find_block(lines: List[str], block: List[str], expected: int) -> int:
+    """Index where block occurs in lines, preferring the one closest to expected, or -1."""
+    if not block:
+        return min(max(expected, 0), len(lines))
+    positions = [
+        i for i in range(len(lines) - len(block) + 1)
+        if lines[i] == block[0] and lines[i:i + len(block)] == block
+    ]
+    return min(positions, key=lambda i: abs(i - expected)) if positions else -1
+
+def apply_unified_diff(original: str, diff: str) -> str:
+    """Apply a unified diff to the artifact contents.
+
+    Hunks are located by their context and removed lines, so line numbers in the
+    hunk headers may be off as long as the context still matches.
+
+    Raises:
+        PatchConflictError: The diff has no hunks or a hunk's context doesn't match
+    """
+    lines, trailing_newline = _split(original)
+    if trailing_newline:
+        lines.pop()
+
+    hunks = []
+    for line in diff.splitlines():
+        if match := HUNK_HEADER.match(line):
+            hunks.append((int(match.group(1)), [], []))
+        elif hunks and not line.startswith("\\"):
+            _, old_block, new_block = hunks[-1]
+            marker, text = (line[0], line[1:]) if line else (" ", "")
+            if marker in (" ", "-"):
+                old_block.append(text)
+            if marker in (" ", "+"):
+                new_block.append(text)
+    if not hunks:
+        raise PatchConflictError("diff contains no @@ hunks")
+
+    offset = 0
+    for number, (old_start, old_block, new_block) in enumerate(hunks, 1):
+        # A zero-length old range means "insert after line old_start"
+        expected = old_start - 1 + offset if old_block else old_start + offset
+        position = _find_block(lines, old_block, expected)
+        if position < 0:
+            raise PatchConflictError(f"hunk {number} does not match the artifact's current contents")
+        lines[position:position + len(old_block)] = new_block
+        offset += len(new_block) - len(old_block)
+
+    return _join(lines, trailing_newline)
+
+def apply_search_replace(original: str, search: str, replace: str) -> str:
+    """Replace the single occurrence of search with replace.
+
+    Raises:
+        PatchConflictError: search is empty, missing or ambiguous
+    """
+    if not search:
+        raise PatchConflictError("search text is empty")
+    occurrences = original.count(search)
+    if occurrences != 1:
+        problem = "not found" if occurrences == 0 else f"found {occurrences} times; include more surrounding text"
+        raise PatchConflictError(f"search text {problem}")
+    return original.replace(search, replace, 1)
+
+def apply_line_edit(original: str, start_line: int, end_line: int, contents: str) -> str:
+    """Replace lines start_line..end_line (1-based, inclusive) with contents.
+
+    An end_line of start_line - 1 inserts before start_line without removing anything.
+
+    Raises:
+        PatchConflictError: The range is outside the artifact
+    """
+    lines, trailing_newline = _split(original)
+    if trailing_newline:
+        lines.pop()
+    if start_line < 1 or end_line < start_line - 1 or end_line > len(lines):
+        raise PatchConflictError(f"line range {start_line}-{end_line} is outside the artifact's {len(lines)} lines")
+    replacement = contents[:-1].split("\n") if contents.endswith("\n") else contents.split("\n") if contents else []
+    lines[start_line - 1:end_line] = replacement
+    return _join(lines, trailing_newline)
+
+class PatchStats:
+    """Output tokens saved by patch edits compared to rewriting the whole artifact."""
+
+    def __init__(self):
+        self.edits = 0
+        self.conflicts = 0
+        self.patch_tokens = 0
+        self.rewrite_tokens = 0
+        self._lock = threading.Lock()
+
+    def record_edit(self, patch_tokens: int, rewrite_tokens: int):
+        with self._lock:
+            self.edits += 1
+            self.patch_tokens += patch_tokens
+            self.rewrite_tokens += rewrite_tokens
+
+    def record_conflict(self):
+        with self._lock:
+            self.conflicts += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "edits": self.edits,
+                "conflicts": self.conflicts,
+                "patch_tokens": self.patch_tokens,
+                "rewrite_tokens": self.rewrite_tokens,
+                "tokens_saved": self.rewrite_tokens - self.patch_tokens,
+            }
+
+PATCH_STATS = PatchStats()
@@ -1,14 +1,140 @@
 from typing import AsyncGenerator, Callable
 import litellm
-from enum import Enum
 import asyncio
 import json
 import os
 import base64
 import io
 from PIL import Image
+from .tools import (
+    side_effecting, build_tool_schema, build_dispatch_table, function_error,
+    ToolCallAssembler, StreamingCallParser
+)
+from .task_graph import TaskGraph, DONE
+from .messages import MessageList, as_dicts
+from .usage import count_message_tokens, count_text_tokens
+from .event_bus import BusSink, TOOL_RESULT, DELEGATION_START, DELEGATION_END
+from .stream_pipeline import (
+    StreamPipeline, TagParser, ProviderSource, QueueSink,
+    StopAfterTags, ActionTailStage, UsageStage, CacheStage, TraceStage
+)
+from .tracing import LLM, TOOL, CHAIN, summarize_messages
+from .budget import BudgetDecision
+from .ledger import (
+    RequestLedger, canonical_json, delegation_key, repeating_cycle,
+    REPEATED_CALL_NOTE, REPEATED_DELEGATION_NOTE
+)
+from .artifact_patch import (
+    PatchConflictError, PATCH_STATS, content_hash, check_base_hash,
+    apply_unified_diff, apply_search_replace, apply_line_edit
+)
+import re
+import hashlib
+
+# Tags that hand the turn over to the agent loop
+ACTION_TAGS = ("function_call", "delegate_agent", "delegate_plan")
+# Tags of the notices that end a run early; the summary turn answering one is final
+WRAP_UP_TAGS = ("loop_detected", "budget_exceeded")
 
 class BaseAgent:
+    # When enabled, function calls are started as soon as their closing tag is
+    # parsed instead of waiting for the model to finish its response.
+    speculative_dispatch = False
+
+    # Optional object with a blocking run(messages) method that warms data
+    # caches in parallel with the first model call of each react_to. One is
+    # shared by every agent of a session; only agents with uses_prefetcher run it.
+    prefetcher = None
+    uses_prefetcher = False
+
+    # Names of the methods the model may call. Each class compiles them into a
+    # dispatch table when it is created; nothing else is callable by the model.
+    functions: tuple = ()
+    _dispatch_table: dict = {}
+
+    # When enabled (and the model supports it), functions are passed as native
+    # tool schemas instead of being described in the system prompt. Tool calls
+    # are converted to <function_call> tags, so the XML protocol keeps working
+    # and is used as the fallback for models without tool support.
+    native_tools = False
+
+    # Optional ModelRouter that picks the model per turn instead of self.model.
+    # Delegated agents inherit it.
+    router = None
+
+    # Optional HedgePolicy that races a second request when the first token is
+    # slow. Delegated agents inherit it.
+    hedging = None
+
+    # Optional ResponseCache shared by the agents of a session; delegated agents
+    # inherit it. Responses are only cached for classes that set cache_responses.
+    response_cache = None
+    cache_responses = False
+
+    # Delegations run as tasks of a TaskGraph. Agents nested deeper than
+    # max_delegation_depth can't delegate further. Plans submitted with a
+    # <delegate_plan> tag run independent tasks concurrently, and their progress
+    # is saved under task_state_dir so an interrupted plan resumes when resubmitted
+    # in the same run (same artifacts_dir, checkpoint_path and agent).
+    max_delegation_depth = 3
+    delegation_retries = 1
+    delegation_timeout = 900
+    max_plan_concurrency = 3
+    task_state_dir = os.path.join(".cache", "tasks")
+
+    # Optional CheckpointStore. When set together with checkpoint_path (the run
+    # id for the top-level agent), the message history is saved after every model
+    # turn and tool result, and delegated agents are checkpointed below that path.
+    # A react_to on a restored history continues where the run stopped.
+    checkpoints = None
+    checkpoint_path = None
+
+    # Directory the artifact functions read and write. Delegated agents share
+    # their parent's, so each session (or batch job) can get its own workspace.
+    artifacts_dir = "artifacts"
+
+    # Optional UsageMeter that records the token usage of every model turn.
+    # Delegated agents inherit it.
+    usage = None
+
+    # Optional TokenBudget with per-turn, per-agent, per-delegation and session
+    # limits, checked before every model turn. Delegated agents share it.
+    budget = None
+
+    # Guards against runaway react loops within a user request. Identical
+    # read-only function calls and delegations reuse their earlier results, and an
+    # agent wraps up after max_react_iterations turns with actions, or when the
+    # same cycle of up to max_loop_period turns repeats loop_repeats times in a row.
+    max_react_iterations = 25
+    max_loop_period = 3
+    loop_repeats = 3
+
+    # Tags after which the agent's turn ends, for agents that are told to stop
+    # after an action. The response is cut off when one closes: by provider stop
+    # sequences where the model supports them, and otherwise by closing the
+    # stream. Anything after the tag is left out of the history.
+    stop_after_tags: tuple = ()
+    use_stop_sequences = True
+
+    # Optional EventBus. Every agent of the run publishes its tokens, tags,
+    # results and delegations to it directly, and a delegated agent's tokens are
+    # no longer yielded through its parents. Delegated agents share it.
+    event_bus = None
+
+    # Optional Tracer. When the agent runs inside one of its traces, its model
+    # turns, function calls and delegations are recorded as spans, and
+    # delegated agents record theirs in the same trace.
+    tracer = None
+
+    # Settings a delegated agent takes over from the agent delegating to it
+    inherited_settings = (
+        "router", "hedging", "response_cache", "artifacts_dir", "usage", "budget", "event_bus", "prefetcher"
+    )
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch_table = build_dispatch_table(cls)
+
     def __init__(
         self,
         name: str,
@@ -32,6 +158,25 @@ class BaseAgent:
             "max_tokens": 8192
         }
         self._active_tasks = set()
+        self.delegation_depth = 0
+        # Where the agent is in the delegation tree, for its events
+        self.agent_path = (type(self).__name__,)
+        self._turn_index = 0
+        # filename -> (hashes this agent's own edits replaced, hash it last wrote)
+        self._artifact_versions = {}
+        # Budget scope of the current react_to, and the delegation scope it's opened in
+        self._budget_scope = None
+        self._budget_parent = None
+        # Calls and delegations of the current user request, shared with delegated agents
+        self._ledger = None
+        # Trace of the current run, and the span this agent's spans go under (None for the root)
+        self._trace = None
+        self._trace_parent = None
+        self._prefetch_task = None
+        # Whether this agent (or one it delegated to) started a side-effecting call
+        self._side_effects_run = False
+        # Checkpoint names of delegations that started side-effecting calls
+        self._side_effecting_delegations = set()
 
     async def react_to(
         self,
@@ -49,56 +194,145 @@ class BaseAgent:
         # Store messages for function access
         self._current_messages = messages
 
+        # A checkpointed run may stop after a model turn; pick up its unfinished actions
+        resumed = self._unfinished_turn(messages)
+        if resumed is None and messages and messages[-1]["role"] == "assistant":
+            # Restored from a checkpoint of a run that had already finished
+            return
+        await self._checkpoint(messages)
+
+        if self.budget is not None:
+            self._budget_scope = self.budget.open_run(type(self).__name__, self._budget_parent)
+
+        # The agent handling the user's message starts the request's ledger
+        if self.delegation_depth == 0:
+            self._ledger = RequestLedger()
+            trace = self.tracer.current() if self.tracer is not None else None
+            self._trace = trace if trace is not None and trace.recording else None
+        turn_signatures = []
+
+        # Warm caches for likely function calls while the first model call runs
+        self._start_prefetch(messages)
+
         while True:
             function_calls = []  # Array to store function calls
             agent_delegation_request = None  # Single delegation request
+            plan_request = None  # Plan of concurrent delegations
+            rejected_call = None  # Error for a function call that can't be valid
             
             async def handle_tag(tag_name: str, stream: AsyncGenerator[str, None]):
-                nonlocal function_calls, agent_delegation_request
+                nonlocal function_calls, agent_delegation_request, plan_request, rejected_call
                 
                 # Create a forwarding stream for on_tag_start
                 queue = await self._create_stream(tag_name, on_tag_start)
                 
+                # Function calls are parsed and validated while they stream
+                call_parser = StreamingCallParser(self._dispatch_table) if tag_name == "function_call" else None
+                
                 # Consume and forward tokens
-                content = ""
+                parts = []
                 async for token in stream:
-                    content += token
+                    parts.append(token)
                     await queue.put(token)
+                    if call_parser is not None and not call_parser.feed(token):
+                        # Stop here; react_to aborts the response and asks for a correction
+                        break
+                content = "".join(parts)
                 
                 # Signal end of stream
                 await queue.put(None)
                 
-                # If this is a function call, store it
+                # If this is a function call, store it with its parsed JSON
                 if tag_name == "function_call":
+                    call = call_parser.close()
+                    if call is None:
+                        rejected_call = rejected_call or call_parser.error
+                        return
                     # Strip the function_call tags from content before storing
                     content = content.replace("<function_call>", "").replace("</function_call>", "").strip()
-                    function_calls.append(content)
+                    speculative = self._dispatch_speculatively(content, call) if self.speculative_dispatch else None
+                    function_calls.append((content, call, speculative))
                 # If this is an agent delegation, store it
                 elif tag_name == "delegate_agent":
                     # Strip the delegate_agent tags from content before storing
                     content = content.replace("<delegate_agent>", "").replace("</delegate_agent>", "").strip()
                     agent_delegation_request = content
+                # If this is a delegation plan, store it
+                elif tag_name == "delegate_plan":
+                    plan_request = content.replace("<delegate_plan>", "").replace("</delegate_plan>", "").strip()
 
-            # Get the next response and accumulate the full message
-            full_response = ""
-            async for token in self.next_response(
-                messages,
-                on_tag_start=handle_tag,
-                on_message_start=on_message_start
-            ):
-                full_response += token
-                yield token
-            
-            # Store the complete response in message history
-            messages.append({
-                "role": "assistant",
-                "content": full_response
-            })
+            if resumed is not None:
+                # Re-run the actions of the checkpointed turn instead of calling the model
+                full_response, completed_results = resumed
+                resumed = None
+                for tag_name, content in self._parse_actions(full_response):
+                    if tag_name == "function_call":
+                        function_calls.append((content, None, None))
+                    elif tag_name == "delegate_agent":
+                        agent_delegation_request = content
+                    elif tag_name == "delegate_plan":
+                        plan_request = content
+                function_calls = function_calls[completed_results:]
+            else:
+                # Wrap up a run that is going in circles
+                stop_reason = self._loop_guard(turn_signatures)
+                if stop_reason is not None:
+                    async for token in self._wrap_up(messages, "loop_detected", stop_reason, on_tag_start, on_message_start):
+                        yield token
+                    break
+
+                # Wrap up instead of starting a turn the budget can't afford
+                budget_decision = self._check_budget(messages)
+                if budget_decision is not None and budget_decision.stop:
+                    async for token in self._wrap_up(
+                        messages, "budget_exceeded", budget_decision.reason, on_tag_start, on_message_start,
+                        summarize=budget_decision.summarize
+                    ):
+                        yield token
+                    break
+
+                # Get the next response and accumulate the full message
+                response_parts = []
+                response_stream = self.next_response(
+                    messages,
+                    on_tag_start=handle_tag,
+                    on_message_start=on_message_start,
+                    budget_decision=budget_decision
+                )
+                try:
+                    async for token in response_stream:
+                        response_parts.append(token)
+                        yield token
+                        # Don't let the model keep generating after a call that can't be valid
+                        if rejected_call is not None:
+                            print(f"[CALL DEBUG] Stopped {type(self).__name__}'s response at a rejected function call")
+                            break
+                finally:
+                    await response_stream.aclose()
+                full_response = "".join(response_parts)
+                
+                # Let the tag handlers for this response finish collecting calls
+                await self._drain_active_tasks()
+                
+                # Store the complete response in message history
+                messages.append({
+                    "role": "assistant",
+                    "content": full_response
+                })
+                await self._checkpoint(messages)
+
+            # Delegated agents are checkpointed under the turn that started them
+            self._turn_index = max(i for i, message in enumerate(messages) if message["role"] == "assistant")
+            turn_signatures.append(self._turn_signature(function_calls, agent_delegation_request, plan_request))
             
             # After response is complete, execute any collected function calls
-            for function_call in function_calls:                
-                # Execute the function call
-                result = await self._execute_function(function_call)
+            for function_call, call, speculative in function_calls:
+                # Join a speculatively started call, or start it now. Identical read-only
+                # calls made earlier in the request return the earlier result.
+                pending, repeated = speculative or self._start_call(function_call, call)
+                result = await pending
+                if repeated:
+                    result += REPEATED_CALL_NOTE
                 
                 # Stream the result as a tagged event
                 tagged_result = f"<function_result>{result}</function_result>"
@@ -110,6 +344,19 @@ class BaseAgent:
                     "role": "user",
                     "content": tagged_result
                 })
+                await self._checkpoint(messages)
+
+            # Ask for a corrected call in place of a rejected one
+            if rejected_call is not None:
+                result = f"{rejected_call} The response was stopped at this call. Send the corrected function call."
+                tagged_result = f"<function_result>{result}</function_result>"
+                await self._stream_tagged_content("function_result", result, on_tag_start)
+                yield tagged_result
+                messages.append({
+                    "role": "user",
+                    "content": tagged_result
+                })
+                await self._checkpoint(messages)
 
             # Handle agent delegation if requested
             if agent_delegation_request:
@@ -117,97 +364,410 @@ class BaseAgent:
                 try:
                     # Parse the delegation request
                     delegation = json.loads(agent_delegation_request)
-                    
-                    agent_name = delegation.get("name")
-                    instructions = delegation.get("instructions")
-                    attachments = delegation.get("attachments", [])
-                    
-                    # Create the delegated agent
-                    from .agent_factory import AgentFactory
+                    key = delegation_key(delegation)
 
-                    delegated_agent = AgentFactory.create_agent(agent_name)
-                    
-                    if not delegated_agent:
-                        delegation_result = f"ERROR: Could not create agent of type {agent_name}. Do not retry delegation."
+                    # A delegation repeated within the request (even one that failed) isn't run again
+                    earlier = self._ledger.delegation_result(key) if self._ledger is not None else None
+                    if earlier is not None:
+                        delegation_result = earlier + REPEATED_DELEGATION_NOTE
                     else:
-                        # Create a fresh message list with just the instruction
-                        delegated_messages = [{"role": "user", "content": instructions}]
-                        
-                        # If there are attachments, load them into the message history
-                        for attachment in attachments:
-                            try:
-                                if attachment.endswith(('.jpg', '.jpeg', '.png')):
-                                    with open(os.path.join("artifacts", attachment), "rb") as f:
-                                        image_data = base64.b64encode(f.read()).decode('utf-8')
-                                        # Get the image format from the file extension
-                                        image_format = os.path.splitext(attachment)[1][1:]  # Remove the dot
-                                        
-                                        # Validate the image data
-                                        try:
-                                            # Add as a new message with reference to the file
-                                            delegated_messages.append({
-                                                "role": "user",
-                                                "content": [
-                                                    {
-                                                        "type": "text",
-                                                        "text": f"Reference image from: {attachment}"
-                                                    },
-                                                    {
-                                                        "type": "image_url",
-                                                        "image_url": {
-                                                            "url": f"data:image/{image_format};base64,{image_data}"
-                                                        }
-                                                    }
-                                                ]
-                                            })
-                                        except Exception as e:
-                                            print(f"Invalid image data in {attachment}: {str(e)}")
-                                            continue
-                            except Exception as e:
-                                print(f"Warning: Failed to load attachment {attachment}: {str(e)}")
-                        
-                        # Call react_to with our existing callbacks
-                        async for token in delegated_agent.react_to(
-                            delegated_messages,
-                            on_tag_start=on_tag_start,
-                            on_message_start=None
-                        ):
+                        # Run the delegated agent as a task, forwarding its tokens
+                        graph = TaskGraph(max_concurrency=1)
+                        graph.add(
+                            "delegate",
+                            lambda emit: self._run_delegation(delegation, on_tag_start, emit),
+                            retries=self.delegation_retries,
+                            timeout=self.delegation_timeout
+                        )
+                        async for token in graph.stream():
                             yield token
-                        
-                        # Store the successful result
-                        delegation_result = delegated_messages[-1]["content"]
+
+                        task = graph.tasks["delegate"]
+                        if task.state == DONE:
+                            delegation_result = task.result
+                        else:
+                            delegation_result = f"ERROR: Failed to execute agent delegation: {task.error}. Do not retry delegation."
+                        if self._ledger is not None:
+                            self._ledger.record_delegation(key, delegation_result)
                         
                 except json.JSONDecodeError:
                     delegation_result = "ERROR: Invalid agent delegation format. Do not retry delegation."
                 except Exception as e:
                     delegation_result = f"ERROR: Failed to execute agent delegation: {str(e)}. Do not retry delegation."
-                finally:
-                    # Stream the final result or error as a tagged event
-                    tagged_result = f"<delegate_agent_result>{delegation_result}</delegate_agent_result>"
-                    await self._stream_tagged_content("delegate_agent_result", delegation_result, on_tag_start)
-                    yield tagged_result
+
+                # Stream the final result or error as a tagged event. A cancelled run
+                # records nothing, so a resumed run repeats the delegation.
+                tagged_result = f"<delegate_agent_result>{delegation_result}</delegate_agent_result>"
+                await self._stream_tagged_content("delegate_agent_result", delegation_result, on_tag_start)
+                yield tagged_result
+                
+                # Add only the result to message history
+                messages.append({
+                    "role": "user",
+                    "content": tagged_result
+                })
+                await self._checkpoint(messages)
+
+            # Handle a plan of delegations if requested
+            if plan_request:
+                plan_result = ""
+                try:
+                    # Independent tasks run concurrently, each forwarding its tokens
+                    plan = json.loads(plan_request)
+                    graph = self._build_plan_graph(plan, on_tag_start)
+                    async for token in graph.stream():
+                        yield token
+                    results = graph.results()
+                    plan_result = json.dumps(results, indent=2)
+
+                    # Later repeats of these delegations within the request reuse their results
+                    if self._ledger is not None:
+                        for index, task in enumerate(plan["tasks"]):
+                            self._ledger.record_delegation(delegation_key(task), results[str(task.get("id", index))])
                     
-                    # Add only the result to message history
-                    messages.append({
-                        "role": "user",
-                        "content": tagged_result
-                    })
+                    # Keep the state of unfinished plans so resubmitting them resumes
+                    if graph.state_path and all(task.state == DONE for task in graph.tasks.values()):
+                        os.remove(graph.state_path)
+                        
+                except json.JSONDecodeError:
+                    plan_result = "ERROR: Invalid delegation plan format. Do not retry the plan."
+                except Exception as e:
+                    plan_result = plan_result or f"ERROR: Failed to execute delegation plan: {str(e)}. Do not retry the plan."
+
+                tagged_result = f"<delegate_plan_result>{plan_result}</delegate_plan_result>"
+                await self._stream_tagged_content("delegate_plan_result", plan_result, on_tag_start)
+                yield tagged_result
+                
+                messages.append({
+                    "role": "user",
+                    "content": tagged_result
+                })
+                await self._checkpoint(messages)
 
-            if not function_calls and not agent_delegation_request:
+            if not function_calls and not agent_delegation_request and not plan_request and rejected_call is None:
                 break
                 
             function_calls.clear()  # Clear the array after processing
             agent_delegation_request = None
+            plan_request = None
 
-        pending = [t for t in self._active_tasks if not t.done()]
-        if pending:
-            await asyncio.gather(*pending, return_exceptions=True)
+        await self._finish_prefetch()
+
+        await self._drain_active_tasks()
+
+    async def _run_delegation(self, delegation: dict, on_tag_start, emit, task_id: str = "delegate") -> str:
+        """Run a delegated agent to completion, emitting its tokens (unless it publishes them to an event bus).
+
+        Args:
+            delegation: {"name", "instructions", "attachments"} request
+            on_tag_start: Tag callback passed on to the delegated agent
+            emit: Receives the delegated agent's tokens
+            task_id: Task the delegation runs as, which names its checkpoint
+
+        Returns:
+            The delegated agent's final message, or an error message for the model
+        """
+        agent_name = delegation.get("name")
+        if self.delegation_depth + 1 > self.max_delegation_depth:
+            return f"ERROR: Maximum delegation depth ({self.max_delegation_depth}) reached, {agent_name} was not started. Complete the task yourself."
+
+        # Create the delegated agent
+        from .agent_factory import AgentFactory
+
+        # Delegated agents share this agent's model, generation settings and inherited_settings
+        delegated_agent = AgentFactory.create_agent(agent_name, litellm_model=self.model, model_kwargs=self.model_kwargs)
+        if not delegated_agent:
+            return f"ERROR: Could not create agent of type {agent_name}. Do not retry delegation."
+
+        for setting in self.inherited_settings:
+            # A setting this agent doesn't have leaves the delegated agent's own
+            if getattr(self, setting) is not None:
+                setattr(delegated_agent, setting, getattr(self, setting))
+        delegated_agent.delegation_depth = self.delegation_depth + 1
+        delegated_agent.agent_path = self.agent_path + (f"{agent_name}:{task_id}",)
+        delegated_agent._ledger = self._ledger
+        delegated_agent._trace = self._trace
+        if self.budget is not None:
+            delegated_agent._budget_parent = self.budget.open_delegation(
+                f"{task_id}-{agent_name}", self._budget_scope or self.budget.session
+            )
+
+        # Resume the delegated agent's checkpoint if this delegation was interrupted
+        delegated_messages = None
+        delegation_name = f"{self._turn_index}-{task_id}-{agent_name}"
+        if self.checkpoints is not None and self.checkpoint_path:
+            delegated_agent.checkpoints = self.checkpoints
+            delegated_agent.checkpoint_path = f"{self.checkpoint_path}/{delegation_name}"
+            delegated_messages = MessageList(self.checkpoints.load(delegated_agent.checkpoint_path) or ())
+
+        if not delegated_messages and delegation_name in self._side_effecting_delegations:
+            # A retry with nothing to resume from would repeat the writes of the failed attempt
+            return f"ERROR: {agent_name} failed after it had written artifacts or images, so it was not restarted. Check the artifacts and complete the task yourself."
+
+        if not delegated_messages:
+            # Create a fresh message list with just the instruction, plus any attachments
+            delegated_messages = MessageList([{"role": "user", "content": delegation.get("instructions")}])
+            delegated_messages.extend(self._load_attachments(delegation.get("attachments", [])))
+
+        bus = self.event_bus
+        if bus is not None:
+            bus.publish(DELEGATION_START, delegated_agent.agent_path, None, delegation.get("instructions") or "")
+
+        span = self._start_span(agent_name, CHAIN, {"instructions": delegation.get("instructions")}, {"task_id": task_id})
+        delegated_agent._trace_parent = span
+
+        # Call react_to with our existing callbacks. With an event bus the delegated
+        # agent publishes its own tokens, so they aren't passed up through this agent.
+        try:
+            async for token in delegated_agent.react_to(
+                delegated_messages,
+                on_tag_start=on_tag_start,
+                on_message_start=None
+            ):
+                if bus is None:
+                    await emit(token)
+        except BaseException as e:
+            self._end_span(span, error=repr(e))
+            raise
+        finally:
+            if delegated_agent._side_effects_run:
+                self._side_effects_run = True
+                self._side_effecting_delegations.add(delegation_name)
+
+        result = delegated_messages[-1]["content"]
+        self._end_span(span, {"result": result})
+        if bus is not None:
+            bus.publish(DELEGATION_END, delegated_agent.agent_path, None, result)
+        return result
+
+    def _start_span(self, name: str, kind: str, inputs: dict = None, metadata: dict = None):
+        """Start a span under this agent's parent span, when the run is traced."""
+        if self._trace is None:
+            return None
+        return self._trace.start_span(name, kind, self._trace_parent, inputs, metadata)
+
+    def _end_span(self, span, outputs: dict = None, error: str = None) -> None:
+        if span is not None:
+            self._trace.end_span(span, outputs, error)
+
+    async def _checkpoint(self, messages: list) -> None:
+        """Save the message history when checkpointing is enabled."""
+        if self.checkpoints is None or not self.checkpoint_path:
+            return
+        try:
+            # Writes (and fsyncs) off the event loop; a copy keeps the list stable meanwhile
+            await asyncio.to_thread(self.checkpoints.save, self.checkpoint_path, list(messages))
+        except OSError as e:
+            print(f"Warning: Failed to checkpoint {self.checkpoint_path}: {str(e)}")
+
+    def _check_budget(self, messages: list) -> BudgetDecision | None:
+        """Check the budget for the next model turn, or return None when no budget is set."""
+        if self.budget is None:
+            return None
+        prompt_tokens = (
+            count_text_tokens(self.model, self.system_prompt)
+            + count_text_tokens(self.model, self._get_artifacts_content())
+            + count_message_tokens(self.model, [m for m in messages if m["role"] != "system"])
+        )
+        decision = self.budget.check(self._budget_scope, prompt_tokens, self.model_kwargs.get("max_tokens"))
+        if decision.stop:
+            self.budget.stops += 1
+            print(f"[BUDGET DEBUG] {type(self).__name__} stopping: {decision.reason}")
+        elif decision.downgrade:
+            self.budget.downgraded_turns += 1
+            print(f"[BUDGET DEBUG] {type(self).__name__} switching to {self.budget.fallback_model} near its budget")
+        return decision
+
+    def _loop_guard(self, turn_signatures: list) -> str | None:
+        """Return why the run should wrap up before another model turn, or None to continue."""
+        reason = None
+        if len(turn_signatures) >= self.max_react_iterations:
+            reason = f"The limit of {self.max_react_iterations} turns for this request is reached"
+        elif period := repeating_cycle(turn_signatures, self.max_loop_period, self.loop_repeats):
+            reason = f"The same {'action' if period == 1 else f'{period} turns of actions'} repeated {self.loop_repeats} times"
+        if reason is not None:
+            print(f"[LOOP DEBUG] {type(self).__name__} stopping: {reason}")
+        return reason
+
+    @staticmethod
+    def _turn_signature(function_calls: list, delegation_request: str | None, plan_request: str | None) -> tuple:
+        """The normalized actions of a turn, for detecting repeating cycles."""
+        actions = [("function_call", canonical_json(call)) for call, _, _ in function_calls]
+        if delegation_request:
+            actions.append(("delegate_agent", canonical_json(delegation_request)))
+        if plan_request:
+            actions.append(("delegate_plan", canonical_json(plan_request)))
+        return tuple(actions)
+
+    async def _wrap_up(
+        self,
+        messages: list,
+        tag_name: str,
+        reason: str,
+        on_tag_start: Callable[[str, AsyncGenerator[str, None]], None],
+        on_message_start: Callable[[AsyncGenerator[str, None]], None],
+        summarize: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """End the run early, with a final turn that summarizes its progress.
+
+        Args:
+            messages: The conversation history
+            tag_name: Tag the stop notice is sent to the model in (e.g. "budget_exceeded")
+            reason: Why the run stops
+            on_tag_start: Callback for tag processing; tags in the summary are shown but not acted on
+            on_message_start: Callback for message processing
+            summarize: False to stop with a fixed notice instead of another model turn
+        """
+        messages.append({
+            "role": "user",
+            "content": f"<{tag_name}>{reason}. Do not call functions or delegate. "
+                       f"Briefly summarize what has been done and what is left to do.</{tag_name}>"
+        })
+        if summarize:
+            # The summary uses the budget's cheaper model and completion cap when there is a budget
+            budget_decision = None
+            if self.budget is not None:
+                budget_decision = BudgetDecision(
+                    downgrade=self.budget.fallback_model is not None,
+                    max_tokens=self.budget.summary_tokens
+                )
+            summary_parts = []
+            async for token in self.next_response(
+                messages,
+                on_tag_start=on_tag_start,
+                on_message_start=on_message_start,
+                budget_decision=budget_decision
+            ):
+                summary_parts.append(token)
+                yield token
+            await self._drain_active_tasks()
+            summary = "".join(summary_parts)
+        else:
+            summary = f"Stopped: {reason}."
+            queue = await self._create_stream(None, on_message_start)
+            await queue.put(summary)
+            await queue.put(None)
+            yield summary
+
+        messages.append({"role": "assistant", "content": summary})
+        await self._checkpoint(messages)
+
+    @staticmethod
+    def _parse_actions(response: str) -> list:
+        """Return the (tag name, content) of the actions in a complete response."""
+        return [
+            (match.group(1), match.group(2).strip())
+            for match in re.finditer(r"<(function_call|delegate_agent|delegate_plan)>(.*?)</\1>", response, re.DOTALL)
+        ]
+
+    def _unfinished_turn(self, messages: list) -> tuple[str, int] | None:
+        """Find a model turn whose actions weren't all completed before the run stopped.
+
+        Returns:
+            (the turn's response, number of its function results already in the
+            history), or None if the last turn finished
+        """
+        last_turn = next((i for i in range(len(messages) - 1, -1, -1) if messages[i]["role"] == "assistant"), None)
+        if last_turn is None:
+            return None
+        # A wrap-up summary ends the run, even if it mentions actions
+        notice = messages[last_turn - 1]["content"] if last_turn > 0 else None
+        if isinstance(notice, str) and notice.startswith(tuple(f"<{tag}>" for tag in WRAP_UP_TAGS)):
+            return None
+        results = messages[last_turn + 1:]
+        if not all(isinstance(m["content"], str) and m["content"].startswith("<function_result>") for m in results):
+            return None
+
+        actions = self._parse_actions(messages[last_turn]["content"])
+        function_calls = sum(1 for tag_name, _ in actions if tag_name == "function_call")
+        # A rejected call adds a result of its own
+        if len(results) >= function_calls and len(actions) == function_calls:
+            return None
+        return messages[last_turn]["content"], len(results)
+
+    def _load_attachments(self, attachments: list) -> list:
+        """Build user messages for the image attachments of a delegation."""
+        attachment_messages = []
+        for attachment in attachments:
+            try:
+                if attachment.endswith(('.jpg', '.jpeg', '.png')):
+                    with open(os.path.join(self.artifacts_dir, attachment), "rb") as f:
+                        image_data = base64.b64encode(f.read()).decode('utf-8')
+                    # Get the image format from the file extension
+                    image_format = os.path.splitext(attachment)[1][1:]  # Remove the dot
+                    
+                    # Add as a new message with reference to the file
+                    attachment_messages.append({
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": f"Reference image from: {attachment}"
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/{image_format};base64,{image_data}"
+                                }
+                            }
+                        ]
+                    })
+            except Exception as e:
+                print(f"Warning: Failed to load attachment {attachment}: {str(e)}")
+        return attachment_messages
+
+    def _build_plan_graph(self, plan: dict, on_tag_start) -> TaskGraph:
+        """Build the task graph for a <delegate_plan> request.
+
+        Args:
+            plan: {"tasks": [{"id", "name", "instructions", "attachments", "depends_on", "retries", "timeout"}]}
+            on_tag_start: Tag callback passed on to the delegated agents
+
+        Raises:
+            ValueError: The plan has no tasks
+            TaskGraphError: The plan's dependencies are invalid
+        """
+        tasks = plan.get("tasks") if isinstance(plan, dict) else None
+        if not tasks:
+            raise ValueError("plan has no tasks")
+
+        # Plan state belongs to the run: the same plan submitted for another
+        # workspace or session starts from scratch
+        scope = {
+            "plan": plan,
+            "artifacts_dir": os.path.abspath(self.artifacts_dir),
+            "checkpoint_path": self.checkpoint_path,
+            "agent_path": self.agent_path,
+        }
+        plan_hash = hashlib.sha256(json.dumps(scope, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        graph = TaskGraph(
+            max_concurrency=self.max_plan_concurrency,
+            state_path=os.path.join(self.task_state_dir, f"{plan_hash}.json")
+        )
+        for index, task in enumerate(tasks):
+            earlier = self._ledger.delegation_result(delegation_key(task)) if self._ledger is not None else None
+            if earlier is not None:
+                # Already delegated earlier in the request
+                async def run(emit, result=earlier + REPEATED_DELEGATION_NOTE):
+                    return result
+            else:
+                def run(emit, task=task, task_id=str(task.get("id", index))):
+                    return self._run_delegation(task, on_tag_start, emit, task_id=f"plan-{task_id}")
+            graph.add(
+                str(task.get("id", index)),
+                run,
+                depends_on=tuple(str(dependency) for dependency in task.get("depends_on", [])),
+                retries=task.get("retries", self.delegation_retries),
+                timeout=task.get("timeout", self.delegation_timeout)
+            )
+        return graph
 
     async def next_response(
         self,
         messages: list,
         on_tag_start: Callable[[str, AsyncGenerator[str, None]], None],
-        on_message_start: Callable[[AsyncGenerator[str, None]], None]
+        on_message_start: Callable[[AsyncGenerator[str, None]], None],
+        budget_decision: BudgetDecision = None
     ) -> AsyncGenerator[str, None]:
         """Get next response as a stream, processing any XML tags encountered.
         The returned stream includes all tokens from the response, including XML tags.
@@ -221,128 +781,302 @@ class BaseAgent:
             on_message_start: Callback function with parameters:
                 - message_stream (AsyncGenerator[str, None]): Async generator that yields
                   tokens from the regular message content (excluding tags)
+            budget_decision: Model and completion cap the budget allows for this turn
         
         Yields:
             All tokens from the response stream (unfiltered)
         """
-        class StreamMode(Enum):
-            NORMAL = "normal"
-            COLLECTING_TAG = "collecting_tag"
-            IN_TAG = "in_tag"
-
-        # Create a copy and remove all system messages
-        messages = [msg for msg in messages if msg["role"] != "system"]
+        # Pick the model tier for this turn when routing is enabled
+        if budget_decision is not None and budget_decision.downgrade:
+            tier, model = None, self.budget.fallback_model
+        else:
+            tier = self.router.select_tier(type(self).__name__, messages) if self.router is not None else None
+            model = self.router.models_for(tier)[0] if tier else self.model
+        native_tools = self._uses_native_tools(model)
+        
+        # Create a copy in litellm's format and remove all system messages
+        messages = as_dicts(msg for msg in messages if msg["role"] != "system")
         
         # Insert system messages
-        messages.insert(0, {"role": "system", "content": self.system_prompt})
+        messages.insert(0, {"role": "system", "content": self._native_system_prompt() if native_tools else self.system_prompt})
         
         # Add artifacts content as a system message if any exist
         artifacts_content = self._get_artifacts_content()
         if artifacts_content:
             messages.insert(1, {"role": "system", "content": artifacts_content})
 
-        response = await litellm.acompletion(
-            model=self.model,
-            messages=messages,
-            stream=True,
-            **self.model_kwargs
+        request_kwargs = dict(self.model_kwargs)
+        if native_tools:
+            request_kwargs["tools"] = self.tool_schemas()
+        if budget_decision is not None and budget_decision.max_tokens is not None:
+            request_kwargs["max_tokens"] = budget_decision.max_tokens
+        stop_sequences = self._stop_sequences(model) if not native_tools else []
+        if stop_sequences:
+            stop = request_kwargs.get("stop") or []
+            request_kwargs["stop"] = ([stop] if isinstance(stop, str) else list(stop)) + stop_sequences
+
+        # Replay an identical earlier turn instead of calling the model
+        cache_key = None
+        cached_text = None
+        if self.response_cache is not None and self.cache_responses:
+            cache_key = self.response_cache.key(model, messages, request_kwargs)
+            if cache_key is not None:
+                cached_text = self.response_cache.get(cache_key)
+
+        # Budget use goes into the request metadata, so it shows up in traces
+        if self.budget is not None and self._budget_scope is not None:
+            request_kwargs["metadata"] = {"agent": type(self).__name__, "budget": self.budget.snapshot(self._budget_scope)}
+
+        # The response goes through the tag parser, then the stages, then the
+        # sinks that forward message text and tags to the callbacks
+        stop_stage = StopAfterTags(self.stop_after_tags)
+        stages = [stop_stage]
+        # The span lives until its trace is exported, so it keeps a summary of the messages
+        recording = self._trace is not None and self._trace.recording
+        span = self._start_span(
+            f"{type(self).__name__} turn", LLM, {"messages": summarize_messages(messages)} if recording else None,
+            {"model": model, "tier": tier, "cached": cached_text is not None}
         )
+        if cached_text is not None:
+            source = self._replay(cached_text)
+            stages.append(TraceStage(self._trace, span))
+        else:
+            try:
+                response = await self._open_response(tier, model, messages, request_kwargs)
+            except Exception as e:
+                self._end_span(span, error=repr(e))
+                raise
+            source = ProviderSource(
+                response,
+                tool_calls=ToolCallAssembler() if native_tools else None,
+                restore_stop=self._unclosed_stop_tag if stop_sequences else None
+            )
+            used_model = getattr(self, "last_model", model) if tier is not None else model
+            # Turns cut short (e.g. at a rejected function call) still count the tokens they used
+            stages += [
+                ActionTailStage(self.usage, model, ACTION_TAGS),
+                UsageStage(type(self).__name__, used_model, messages, source, self.usage, self.budget, self._budget_scope),
+                CacheStage(self.response_cache, cache_key, model, source),
+                TraceStage(self._trace, span, source),
+            ]
+        sinks = [QueueSink(self._create_stream, on_tag_start, on_message_start)]
+        if self.event_bus is not None:
+            sinks.append(BusSink(self.event_bus, self.agent_path))
+        pipeline = StreamPipeline(source, TagParser(), stages, sinks)
 
-        message_queue = None
-        tag_queue = None
-        mode = StreamMode.NORMAL
-        current_tag = []
-        current_tag_name = None
-        tag_chunk_buffer = ""
-        full_tag_buffer = ""
+        async for token in pipeline:
+            yield token
+
+        if pipeline.result.stopped_by is stop_stage:
+            print(f"[STOP DEBUG] Stopped {type(self).__name__}'s response after its {stop_stage.tag} tag")
+
+    async def _replay(self, cached_text: str) -> AsyncGenerator[str, None]:
+        for token in self.response_cache.replay(cached_text):
+            yield token
+
+    def _stop_sequences(self, model: str) -> list:
+        """Provider stop sequences for the agent's stop_after_tags, if the model supports them."""
+        if not self.stop_after_tags or not self.use_stop_sequences:
+            return []
+        try:
+            supported = "stop" in (litellm.get_supported_openai_params(model=model) or [])
+        except Exception:
+            supported = False
+        return [f"</{tag_name}>" for tag_name in self.stop_after_tags] if supported else []
+
+    def _unclosed_stop_tag(self, response: str) -> str | None:
+        """The closing tag a stop sequence cut from the end of a response, if it cut one."""
+        for tag_name in self.stop_after_tags:
+            start = response.rfind(f"<{tag_name}>")
+            if start >= 0 and response.find(f"</{tag_name}>", start) < 0:
+                return f"</{tag_name}>"
+        return None
+
+    async def _open_response(self, tier: str | None, model: str, messages: list, request_kwargs: dict):
+        """Start the streaming completion for a turn, through the router and hedging when enabled.
         
-        async for chunk in response:
-            if token := chunk.choices[0].delta.content or "":
-                yield token
-                
-                message_buffer = ""
-                
-                for char in token:
-                    if mode == StreamMode.NORMAL:
-                        if char == '<':
-                            mode = StreamMode.COLLECTING_TAG
-                            current_tag = ['<']
-                            tag_chunk_buffer = '<'
-                            full_tag_buffer = '<'
-                        else:
-                            message_buffer += char
-                            
-                    elif mode == StreamMode.COLLECTING_TAG:
-                        current_tag.append(char)
-                        tag_chunk_buffer += char
-                        full_tag_buffer += char
-                        if char == '>':
-                            tag_text = ''.join(current_tag)
-                            current_tag_name = tag_text[1:-1]
-                            mode = StreamMode.IN_TAG
-                            if tag_queue is not None:
-                                await tag_queue.put(None)
-                            tag_queue = await self._create_stream(current_tag_name, on_tag_start)
-                            await tag_queue.put(tag_chunk_buffer)
-                            tag_chunk_buffer = ""
-                            
-                    elif mode == StreamMode.IN_TAG:
-                        tag_chunk_buffer += char
-                        full_tag_buffer += char
-                        
-                        if full_tag_buffer.endswith(f'</{current_tag_name}>'):
-                            await tag_queue.put(tag_chunk_buffer)
-                            mode = StreamMode.NORMAL
-                            current_tag_name = None
-                            tag_chunk_buffer = ""
-                            full_tag_buffer = ""
-                            await tag_queue.put(None)
-                            tag_queue = None
-                        
-                # Send any accumulated message content to the message queue
-                if message_buffer and mode == StreamMode.NORMAL:
-                    if message_queue is None:
-                        message_queue = await self._create_stream(None, on_message_start)
-                    await message_queue.put(message_buffer)
-                    message_buffer = ""
-                
-                # Send any accumulated tag chunk content to the tag queue
-                if tag_chunk_buffer and tag_queue is not None:
-                    await tag_queue.put(tag_chunk_buffer)
-                    tag_chunk_buffer = ""
+        Args:
+            tier: Model tier chosen by the router, or None to use model
+            model: Model for the turn when no tier is chosen
+            messages: Request messages, including system messages
+            request_kwargs: Extra litellm arguments
+            
+        Returns:
+            An async iterable of completion chunks
+        """
+        async def primary():
+            if tier is not None:
+                response, self.last_model = await self.router.acompletion(tier, messages, **request_kwargs)
+                return response
+            return await litellm.acompletion(
+                model=model,
+                messages=messages,
+                stream=True,
+                **request_kwargs
+            )
         
-        if message_queue is not None:
-            await message_queue.put(None)
+        if self.hedging is None:
+            return await primary()
+        
+        async def hedge():
+            if self.hedging.alternate_model is None:
+                return await primary()
+            return await litellm.acompletion(
+                model=self.hedging.alternate_model,
+                messages=messages,
+                stream=True,
+                **request_kwargs
+            )
+        
+        response, _ = await self.hedging.open(primary, hedge)
+        return response
+
+    @classmethod
+    def tool_schemas(cls) -> list:
+        """Native tool schemas for the agent's exposed functions, built once per class."""
+        if "_tool_schemas" not in cls.__dict__:
+            cls._tool_schemas = [build_tool_schema(spec.func) for spec in cls._dispatch_table.values()]
+        return cls._tool_schemas
+
+    def _uses_native_tools(self, model: str) -> bool:
+        """Whether to use native tool calling for this agent and model."""
+        if not self.native_tools or not self.functions:
+            return False
+        try:
+            return litellm.supports_function_calling(model=model)
+        except Exception:
+            return False
 
-    async def _execute_function(self, function_call_str: str) -> str:
+    def _native_system_prompt(self) -> str:
+        """The system prompt with the JSON function descriptions removed, since the
+        schemas are passed as tools instead."""
+        return re.sub(
+            r"<available_functions>.*?</available_functions>",
+            "Your functions are provided as tools. Call them with the tool-calling interface.",
+            self.system_prompt,
+            flags=re.DOTALL
+        )
+
+    async def _execute_function(self, function_call_str: str, in_thread: bool = False, call: dict = None) -> str:
         """Execute a function call and return its result.
         
         Args:
             function_call_str: The function call in JSON format as a string
+            in_thread: Run the function in a worker thread so it doesn't block the event loop
+            call: The call already parsed while it streamed, if it was
             
         Returns:
             The result of the function call as a string
         """
         try:
             # Parse the function call JSON
-            function_call = json.loads(function_call_str)
+            function_call = call if call is not None else json.loads(function_call_str)
             
             # Get the function name and arguments
             function_name = function_call.get("name")
             function_args = function_call.get("arguments", {})
-            
-            # Use dynamic method lookup
-            if hasattr(self, function_name):
-                func = getattr(self, function_name)
-                result = func(**function_args)
-                return result
-            else:
-                return f"Error: Function '{function_name}' not implemented"
-            
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, AttributeError):
             return "Error: Invalid function call format"
+        
+        # Only functions in the class's dispatch table can be called
+        spec = self._dispatch_table.get(function_name) if isinstance(function_name, str) else None
+        if spec is None:
+            return function_error("unknown_function", function_name, available=list(self._dispatch_table))
+        
+        kwargs, problems = spec.bind(function_args)
+        if problems:
+            return function_error("invalid_arguments", function_name, problems=problems)
+        
+        span = self._start_span(function_name, TOOL, {"arguments": kwargs})
+        try:
+            if in_thread:
+                result = await asyncio.to_thread(spec.func, self, **kwargs)
+            else:
+                result = spec.func(self, **kwargs)
         except Exception as e:
+            self._end_span(span, error=repr(e))
             return f"Error executing function: {str(e)}"
+        self._end_span(span, {"result": result})
+        return result
+
+    async def _drain_active_tasks(self) -> None:
+        """Wait for all running stream handler tasks to finish."""
+        pending = [t for t in self._active_tasks if not t.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _start_prefetch(self, messages: list) -> None:
+        """Run the agent's prefetcher in a worker thread without waiting for it.
+        
+        Args:
+            messages: The conversation history
+        """
+        if self.prefetcher is not None and self.uses_prefetcher:
+            self._prefetch_task = asyncio.create_task(asyncio.to_thread(self.prefetcher.run, list(messages)))
+            # Runs that are abandoned never reach _finish_prefetch; still report their failures
+            self._prefetch_task.add_done_callback(self._report_prefetch_error)
+
+    async def _finish_prefetch(self) -> None:
+        """Wait for this run's prefetch at the end of the run and report the session's prefetch stats."""
+        task, self._prefetch_task = self._prefetch_task, None
+        if task is None:
+            return
+        await asyncio.gather(task, return_exceptions=True)
+        print(f"[PREFETCH DEBUG] Session stats: {self.prefetcher.stats()}")
+
+    @staticmethod
+    def _report_prefetch_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[PREFETCH DEBUG] Prefetch failed: {task.exception()!r}")
+
+    def _dispatch_speculatively(self, function_call_str: str, call: dict) -> tuple[asyncio.Future, bool] | None:
+        """Start a function call while the model is still streaming.
+        
+        Args:
+            function_call_str: The function call in JSON format as a string
+            call: The parsed and validated call
+            
+        Returns:
+            The call as returned by _start_call, or None if the call must wait for
+            the full response (side-effecting functions)
+        """
+        spec = self._dispatch_table.get(call.get("name")) if isinstance(call, dict) else None
+        if spec is None or spec.side_effecting:
+            return None
+        
+        return self._start_call(function_call_str, call, in_thread=True)
+
+    def _start_call(self, function_call_str: str, call: dict = None, in_thread: bool = False) -> tuple[asyncio.Future, bool]:
+        """Start a function call, or join an identical read-only call made earlier in the request.
+        
+        Args:
+            function_call_str: The function call in JSON format as a string
+            call: The call already parsed while it streamed, if it was
+            in_thread: Run the function in a worker thread
+            
+        Returns:
+            (the call's result as a future, whether it repeats an earlier call)
+        """
+        def start():
+            return self._execute_function(function_call_str, in_thread=in_thread, call=call)
+
+        if call is not None:
+            key = json.dumps(call, sort_keys=True, separators=(",", ":"))
+        else:
+            key = canonical_json(function_call_str)
+        function_name = call.get("name") if isinstance(call, dict) else None
+        if call is None:
+            try:
+                function_name = json.loads(function_call_str).get("name")
+            except (json.JSONDecodeError, AttributeError):
+                pass
+        spec = self._dispatch_table.get(function_name) if isinstance(function_name, str) else None
+        if spec is not None and spec.side_effecting:
+            self._side_effects_run = True
+        # Functions with side effects always run
+        if self._ledger is None or (spec is not None and spec.side_effecting):
+            return asyncio.ensure_future(start()), False
+        return self._ledger.call(f"{type(self).__name__}:{key}", start)
 
     async def _stream_tagged_content(
         self,
@@ -357,6 +1091,9 @@ class BaseAgent:
             content: The content to wrap and stream
             on_tag_start: Callback for tag processing
         """
+        if self.event_bus is not None:
+            self.event_bus.publish(TOOL_RESULT, self.agent_path, tag_name, content)
+
         # Create a queue and stream for the tagged content
         queue = await self._create_stream(tag_name, on_tag_start)
         
@@ -404,6 +1141,7 @@ class BaseAgent:
         
         return queue
 
+    @side_effecting
     def updateArtifact(self, filename: str, contents: str) -> str:
         """Updates or creates an artifact file with the given contents.
         
@@ -415,13 +1153,111 @@ class BaseAgent:
             A message indicating success or failure
         """
         try:
-            os.makedirs("artifacts", exist_ok=True)
-            with open(os.path.join("artifacts", filename), "w") as file:
+            os.makedirs(self.artifacts_dir, exist_ok=True)
+            with open(os.path.join(self.artifacts_dir, filename), "w") as file:
                 file.write(contents)
             return f"Successfully saved artifact: {filename}"
         except Exception as e:
             return f"Failed to save artifact {filename}: {str(e)}"
 
+    @side_effecting
+    def patchArtifact(self, filename: str, diff: str, base_hash: str = "") -> str:
+        """Applies a unified diff to an existing artifact file.
+        
+        Args:
+            filename: Name of the file to patch
+            diff: Unified diff with @@ hunks; context lines must match the current contents
+            base_hash: Hash of the artifact the diff was written against
+            
+        Returns:
+            A message indicating success or failure
+        """
+        return self._edit_artifact(filename, base_hash, diff, lambda current: apply_unified_diff(current, diff))
+
+    @side_effecting
+    def replaceInArtifact(self, filename: str, search: str, replace: str, base_hash: str = "") -> str:
+        """Replaces one exact block of text in an existing artifact file.
+        
+        Args:
+            filename: Name of the file to edit
+            search: Exact text to replace; must occur exactly once
+            replace: Replacement text
+            base_hash: Hash of the artifact the edit was written against
+            
+        Returns:
+            A message indicating success or failure
+        """
+        return self._edit_artifact(
+            filename, base_hash, search + replace, lambda current: apply_search_replace(current, search, replace)
+        )
+
+    @side_effecting
+    def editArtifactLines(self, filename: str, start_line: int, end_line: int, contents: str, base_hash: str = "") -> str:
+        """Replaces a range of lines in an existing artifact file.
+        
+        Args:
+            filename: Name of the file to edit
+            start_line: First line to replace (1-based)
+            end_line: Last line to replace, inclusive; start_line - 1 inserts before start_line
+            contents: Replacement lines
+            base_hash: Hash of the artifact the line numbers refer to; without it the lines
+                are replaced in whatever the file contains now
+            
+        Returns:
+            A message indicating success or failure
+        """
+        return self._edit_artifact(
+            filename, base_hash, contents,
+            lambda current: apply_line_edit(current, start_line, end_line, contents),
+            exact_base=True
+        )
+
+    def _edit_artifact(self, filename: str, base_hash: str, patch_text: str, edit, exact_base: bool = False) -> str:
+        """Apply an edit to an artifact after checking it against base_hash.
+
+        A response ends at its first function call, so each edit is its own turn.
+        Edits located by content (diffs, search/replace) may still pass the hash
+        the agent read before its own earlier edits: as long as nobody else has
+        written the file since, they apply to the current version. Line edits
+        need the exact current version.
+        """
+        path = os.path.join(self.artifacts_dir, filename)
+        try:
+            with open(path, "r") as file:
+                current = file.read()
+        except FileNotFoundError:
+            return f"Failed to patch artifact {filename}: file does not exist, use updateArtifact to create it"
+        except Exception as e:
+            return f"Failed to patch artifact {filename}: {str(e)}"
+
+        try:
+            replaced, last_written = self._artifact_versions.get(filename, (set(), None))
+            current_hash = content_hash(current)
+            if exact_base or current_hash != last_written or base_hash not in replaced:
+                check_base_hash(current, base_hash)
+            updated = edit(current)
+        except PatchConflictError as e:
+            PATCH_STATS.record_conflict()
+            return f"Failed to patch artifact {filename}: conflict, {str(e)}"
+
+        try:
+            with open(path, "w") as file:
+                file.write(updated)
+        except Exception as e:
+            return f"Failed to patch artifact {filename}: {str(e)}"
+
+        updated_hash = content_hash(updated)
+        self._artifact_versions[filename] = (replaced | {current_hash}, updated_hash)
+        patch_tokens = self._count_tokens(patch_text)
+        rewrite_tokens = self._count_tokens(updated)
+        PATCH_STATS.record_edit(patch_tokens, rewrite_tokens)
+        print(f"[PATCH DEBUG] {filename}: {patch_tokens} output tokens instead of {rewrite_tokens}")
+        return f"Successfully patched artifact: {filename} (hash {updated_hash})"
+
+    def _count_tokens(self, text: str) -> int:
+        return count_text_tokens(self.model, text)
+
+    @side_effecting
     def saveImage(self, filename: str) -> str:
         """Saves the most recent image from the message history to the artifacts directory.
         
@@ -454,8 +1290,8 @@ class BaseAgent:
                                     final_filename = f"{name_without_ext}.{image_format}"
                                     
                                     # Save the image
-                                    os.makedirs("artifacts", exist_ok=True)
-                                    with open(os.path.join("artifacts", final_filename), "wb") as file:
+                                    os.makedirs(self.artifacts_dir, exist_ok=True)
+                                    with open(os.path.join(self.artifacts_dir, final_filename), "wb") as file:
                                         file.write(image_data)
                                     return f"Successfully saved image: {final_filename}"
                                 except Exception as e:
@@ -477,16 +1313,16 @@ class BaseAgent:
         artifacts_content = []
         
         try:
-            if not os.path.exists('artifacts'):
+            if not os.path.exists(self.artifacts_dir):
                 return ""
                 
-            for filename in os.listdir('artifacts'):
+            for filename in os.listdir(self.artifacts_dir):
                 if os.path.splitext(filename)[1].lower() in text_extensions:
                     try:
-                        with open(os.path.join('artifacts', filename), 'r') as f:
+                        with open(os.path.join(self.artifacts_dir, filename), 'r') as f:
                             content = f.read()
                             artifacts_content.append(
-                                f'  <artifact name="{filename}">\n    {content}\n  </artifact>'
+                                f'  <artifact name="{filename}" hash="{content_hash(content)}">\n    {content}\n  </artifact>'
                             )
                     except Exception as e:
                         print(f"Warning: Failed to read artifact {filename}: {str(e)}")
@@ -1,6 +1,8 @@
 from typing import AsyncGenerator
 import litellm
 
+from .stream_pipeline import StreamPipeline, ProviderSource
+
 class BaseAgent_v1:
     def __init__(
         self,
@@ -44,6 +46,6 @@ class BaseAgent_v1:
             **self.model_kwargs
         )
         
-        async for chunk in response:
-            if token := chunk.choices[0].delta.content:
-                yield token 
\ No newline at end of file
+        # A pipeline with no parser, stages or sinks passes tokens straight through
+        async for token in StreamPipeline(ProviderSource(response)):
+            yield token
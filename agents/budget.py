@@ -0,0 +1,179 @@
+import json
+from dataclasses import dataclass
+
+import litellm
+
+@dataclass
+class BudgetDecision:
+    """What the budget allows for an agent's next model turn."""
+    stop: bool = False
+    # Stop with a final summary turn; False when not even the prompt fits a turn
+    summarize: bool = True
+    # Use the budget's fallback model for the turn
+    downgrade: bool = False
+    # Cap for the turn's completion, or None to keep the agent's max_tokens
+    max_tokens: int | None = None
+    reason: str = ""
+
+class BudgetScope:
+    """Token use of one agent run ("agent"), one delegation subtree ("delegation") or the session.
+
+    Tokens charged to a scope are added to the totals of all its ancestors, so a
+    delegation scope covers every agent below it. An agent scope's limit only
+    counts the agent's own turns.
+    """
+
+    __slots__ = ("name", "kind", "limit", "parent", "own", "total")
+
+    def __init__(self, name: str, kind: str, limit: int | None = None, parent: "BudgetScope" = None):
+        self.name = name
+        self.kind = kind
+        self.limit = limit
+        self.parent = parent
+        self.own = 0
+        self.total = 0
+
+    @property
+    def used(self) -> int:
+        return self.own if self.kind == "agent" else self.total
+
+    def chain(self):
+        scope = self
+        while scope is not None:
+            yield scope
+            scope = scope.parent
+
+    @property
+    def path(self) -> str:
+        return "/".join(reversed([scope.name for scope in self.chain()]))
+
+class TokenBudget:
+    """Token and cost limits for a session and the agents and delegations within it.
+
+    Agents check the budget before each model turn. When a limit is close
+    (downgrade_at of it used) turns switch to fallback_model; when it's reached,
+    the agent gets one last turn, capped at summary_tokens, to summarize its
+    progress, and stops. Delegated agents share their parent's budget.
+    """
+
+    def __init__(
+        self,
+        turn_tokens: int = None,
+        agent_tokens: int = None,
+        delegation_tokens: int = None,
+        session_tokens: int = None,
+        session_cost: float = None,
+        fallback_model: str = None,
+        downgrade_at: float = 0.8,
+        summary_tokens: int = 1024,
+        min_turn_tokens: int = 256
+    ):
+        """Initialize the budget. Limits left as None are not enforced.
+
+        Args:
+            turn_tokens: Prompt plus completion tokens of a single model turn
+            agent_tokens: Tokens of one agent's own turns while it handles a request
+            delegation_tokens: Tokens of a delegated agent and everything it delegates
+            session_tokens: Tokens of all agents in the session
+            session_cost: USD spent by all agents in the session, for models litellm has prices for
+            fallback_model: Cheaper model for turns once downgrade_at of a limit is used
+            downgrade_at: Fraction of a limit after which turns use fallback_model
+            summary_tokens: Completion cap for the summary turn when a limit is reached
+            min_turn_tokens: Completion tokens a turn needs to be worth starting
+        """
+        self.turn_tokens = turn_tokens
+        self.agent_tokens = agent_tokens
+        self.delegation_tokens = delegation_tokens
+        self.session_cost = session_cost
+        self.fallback_model = fallback_model
+        self.downgrade_at = downgrade_at
+        self.summary_tokens = summary_tokens
+        self.min_turn_tokens = min_turn_tokens
+        self.session = BudgetScope("session", "session", session_tokens)
+        self.cost = 0.0
+        self.stops = 0
+        self.downgraded_turns = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "TokenBudget":
+        """Create a budget from a JSON file of constructor arguments."""
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def open_run(self, agent_name: str, parent: BudgetScope = None) -> BudgetScope:
+        """Scope for one agent's handling of a request, below parent or the session."""
+        return BudgetScope(agent_name, "agent", self.agent_tokens, parent or self.session)
+
+    def open_delegation(self, task_id: str, parent: BudgetScope) -> BudgetScope:
+        """Scope for a delegated agent and everything below it."""
+        return BudgetScope(task_id, "delegation", self.delegation_tokens, parent)
+
+    def check(self, scope: BudgetScope, prompt_tokens: int, max_tokens: int | None) -> BudgetDecision:
+        """Decide whether the scope's agent may take a turn with this prompt, and on what terms."""
+        decision = BudgetDecision(max_tokens=max_tokens)
+        needed = prompt_tokens + self.min_turn_tokens
+
+        if self.turn_tokens is not None:
+            if needed > self.turn_tokens:
+                return BudgetDecision(stop=True, summarize=False, reason=(
+                    f"The prompt ({prompt_tokens} tokens) doesn't fit the per-turn budget of {self.turn_tokens} tokens"
+                ))
+            decision.max_tokens = self._cap(decision.max_tokens, self.turn_tokens - prompt_tokens)
+
+        for s in scope.chain():
+            # Another agent's own limit doesn't apply to the agents it delegated to
+            if s.limit is None or (s.kind == "agent" and s is not scope):
+                continue
+            remaining = s.limit - s.used
+            if remaining < needed:
+                return BudgetDecision(stop=True, reason=(
+                    f"The {s.kind} token budget of {s.limit} tokens ({s.path}) is used up"
+                ))
+            decision.max_tokens = self._cap(decision.max_tokens, remaining - prompt_tokens)
+            if s.used >= self.downgrade_at * s.limit:
+                decision.downgrade = True
+
+        if self.session_cost is not None:
+            if self.cost >= self.session_cost:
+                return BudgetDecision(stop=True, reason=f"The session cost budget of ${self.session_cost:.2f} is used up")
+            if self.cost >= self.downgrade_at * self.session_cost:
+                decision.downgrade = True
+
+        decision.downgrade = decision.downgrade and self.fallback_model is not None
+        return decision
+
+    def charge(self, scope: BudgetScope, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        """Record a finished turn of the scope's agent."""
+        tokens = prompt_tokens + completion_tokens
+        scope.own += tokens
+        for s in scope.chain():
+            s.total += tokens
+        try:
+            prompt_cost, completion_cost = litellm.cost_per_token(
+                model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )
+            self.cost += prompt_cost + completion_cost
+        except Exception:
+            # Unknown models have no pricing; tokens are still counted
+            pass
+
+    def snapshot(self, scope: BudgetScope) -> dict:
+        """Budget use of a scope and its ancestors, for tracing metadata."""
+        return {
+            "scope": scope.path,
+            "session_cost": round(self.cost, 6),
+            "scopes": {s.path: {"used": s.used, "limit": s.limit} for s in scope.chain()},
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "session_tokens": self.session.total,
+            "session_token_limit": self.session.limit,
+            "session_cost": round(self.cost, 6),
+            "stops": self.stops,
+            "downgraded_turns": self.downgraded_turns,
+        }
+
+    @staticmethod
+    def _cap(max_tokens: int | None, limit: int) -> int:
+        return limit if max_tokens is None else min(max_tokens, limit)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+from typing import List
+
+from .session_store import SessionStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process per store
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class CheckpointStore(SessionStore):
+    """Session store in a directory of append-only JSON lines files.
+
+    Each path ("<run id>/3-delegate-PlanningAgent/...") gets its own file holding
+    one message per line, so a checkpoint only appends the messages added since
+    the previous one; the file is only read again when another process wrote to it. Inline base64 images are written once to a blob file named
+    by their hash. Appends take a file lock, so processes on the same host (or
+    a shared filesystem with working locks) can share the directory.
+    """
+
+    def __init__(self, directory: str = os.path.join(".cache", "checkpoints"), fsync: bool = True):
+        """Initialize the store.
+
+        Args:
+            directory: Where checkpoint files are written
+            fsync: Flush every checkpoint to disk before returning
+        """
+        self.directory = directory
+        self.fsync = fsync
+        # Size and line count of each file after this store's last save to it
+        self._written = {}
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "sessions"), exist_ok=True)
+
+    def save(self, path: str, messages: List[dict]) -> None:
+        file = self._file(path)
+        with open(file, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            size = os.fstat(f.fileno()).st_size
+            known = self._written.get(file)
+            if known is not None and known[0] == size:
+                # Nobody wrote to the file since our last save; no need to read it
+                stored = known[1]
+            else:
+                f.seek(0)
+                stored_bytes = f.read()
+                # Count complete lines only; a torn final write is dropped
+                size = stored_bytes.rfind(b"\n") + 1
+                stored = stored_bytes.count(b"\n")
+                if size != len(stored_bytes):
+                    f.truncate(size)
+            if stored > len(messages):
+                # Another process extended this history after ours was loaded; keep theirs
+                logger.warning("Stored history of %s is newer than the one being saved, not saving", path)
+                return
+            if stored < len(messages):
+                lines = "".join(
+                    json.dumps(self._pack(message), separators=(",", ":")) + "\n"
+                    for message in messages[stored:]
+                ).encode("utf-8")
+                f.write(lines)
+                f.flush()
+                size += len(lines)
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._written[file] = (size, len(messages))
+
+    def load(self, path: str, start: int = 0) -> List[dict] | None:
+        file = self._file(path)
+        if not os.path.exists(file):
+            # Written before nested paths got their own file names; the next save moves it
+            file = self._legacy_file(path)
+            if not os.path.exists(file):
+                return None
+        messages = []
+        with open(file, "rb") as f:
+            for index, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    # A torn final write; the next save drops it
+                    break
+                if index >= start:
+                    messages.append(self._unpack(json.loads(line)))
+        return messages
+
+    def delete(self, path: str) -> None:
+        # A path's file name extends its parent's, so the subtree shares a prefix
+        stem = os.path.basename(self._file(path))[:-len(".jsonl")]
+        if "/" not in path:
+            # A whole run, including files named by the legacy scheme
+            names = [name for name in os.listdir(self.directory) if name.startswith(stem)]
+        else:
+            names = [
+                name for name in os.listdir(self.directory)
+                if name == f"{stem}.jsonl" or name.startswith(f"{stem}-")
+            ]
+            names.append(os.path.basename(self._legacy_file(path)))
+        for name in names:
+            file = os.path.join(self.directory, name)
+            self._written.pop(file, None)
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+    def save_config(self, session_id: str, config: dict) -> None:
+        file = self._config_file(session_id)
+        tmp_path = f"{file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f)
+        os.replace(tmp_path, file)
+
+    def load_config(self, session_id: str) -> dict | None:
+        try:
+            with open(self._config_file(session_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _file(self, path: str) -> str:
+        # The run id's hash comes first, then one short hash per nested segment, so
+        # a path's file name is a prefix of the names of every path below it
+        run_id, *segments = path.split("/")
+        name = hashlib.sha256(run_id.encode("utf-8")).hexdigest()[:16]
+        for segment in segments:
+            name += "-" + hashlib.sha256(segment.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def _legacy_file(self, path: str) -> str:
+        # Earlier versions hashed the whole path after the run id's hash
+        run_id = path.split("/", 1)[0]
+        run_hash = hashlib.sha256(run_id.encode("utf-8")).hexdigest()[:16]
+        path_hash = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{run_hash}-{path_hash}.jsonl")
+
+    def _config_file(self, session_id: str) -> str:
+        return os.path.join(self.directory, "sessions", hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16] + ".json")
+
+    def _write_blob(self, data: str) -> str:
+        blob_hash = hashlib.sha256(data.encode("ascii")).hexdigest()
+        blob_path = os.path.join(self.directory, "blobs", blob_hash)
+        if not os.path.exists(blob_path):
+            tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write(data)
+            os.replace(tmp_path, blob_path)
+        return blob_hash
+
+    def _read_blob(self, blob_hash: str) -> str:
+        with open(os.path.join(self.directory, "blobs", blob_hash), encoding="ascii") as f:
+            return f.read()
@@ -0,0 +1,88 @@
+"""
+Typed events from every agent of a run, published once to subscribers.
+
+Without a bus, a delegated agent's tokens are yielded up through every
+parent's react_to. With one, each agent publishes its own events directly,
+tagged with its path in the delegation tree, and parents only get their
+delegations' results, so the cost per token doesn't grow with depth.
+"""
+from typing import Callable, Iterable, NamedTuple
+
+from .stream_pipeline import StreamSink, StreamEvent, TEXT, TAG_TEXT, TAG_OPEN, TAG_CLOSE
+
+# Event kinds
+TOKEN = "token"                        # Response text; tag is the tag it's in, or None
+TAG_START = "tag_open"                 # An opening tag
+TAG_END = "tag_close"                  # The end of a tag's text, including its closing tag
+TOOL_RESULT = "tool_result"            # A function, delegation or plan result; tag names the result tag
+DELEGATION_START = "delegation_start"  # A delegated agent starts; text is its instructions
+DELEGATION_END = "delegation_end"      # A delegated agent finished; text is its result
+
+class AgentEvent(NamedTuple):
+    kind: str
+    # Names of the agents from the top-level agent down to the one the event is from
+    path: tuple
+    tag: str | None
+    text: str
+
+# Builds an AgentEvent without the Python-level __new__
+_event = tuple.__new__
+
+class EventBus:
+    """Delivers agent events to subscribers, filtered by kind and agent path.
+
+    Callbacks are synchronous and run inline, so they should hand slow work
+    (UI updates, I/O) to a queue or task.
+    """
+
+    def __init__(self):
+        # kind -> [(callback, path prefix)]
+        self._subscribers: dict = {}
+        self.published = 0
+
+    def subscribe(
+        self,
+        callback: Callable[[AgentEvent], None],
+        kinds: Iterable[str] = None,
+        path: tuple = None
+    ) -> Callable[[], None]:
+        """Call callback for events of the given kinds (all kinds by default) from agents below path.
+
+        Returns:
+            A function that removes the subscription
+        """
+        kinds = tuple(kinds) if kinds is not None else (
+            TOKEN, TAG_START, TAG_END, TOOL_RESULT, DELEGATION_START, DELEGATION_END
+        )
+        entry = (callback, tuple(path) if path else None)
+        for kind in kinds:
+            self._subscribers.setdefault(kind, []).append(entry)
+
+        def unsubscribe():
+            for kind in kinds:
+                subscribers = self._subscribers.get(kind, [])
+                if entry in subscribers:
+                    subscribers.remove(entry)
+        return unsubscribe
+
+    def publish(self, kind: str, path: tuple, tag: str | None, text: str) -> None:
+        subscribers = self._subscribers.get(kind)
+        if not subscribers:
+            return
+        self.published += 1
+        event = _event(AgentEvent, (kind, path, tag, text))
+        for callback, prefix in subscribers:
+            if prefix is None or path[:len(prefix)] == prefix:
+                callback(event)
+
+class BusSink(StreamSink):
+    """Publishes a response's parsed events to an EventBus."""
+
+    _KINDS = {TEXT: TOKEN, TAG_TEXT: TOKEN, TAG_OPEN: TAG_START, TAG_CLOSE: TAG_END}
+
+    def __init__(self, bus: EventBus, path: tuple):
+        self.bus = bus
+        self.path = path
+
+    async def on_event(self, event: StreamEvent) -> None:
+        self.bus.publish(self._KINDS[event.kind], self.path, event.tag, event.text)
@@ -0,0 +1,170 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict
+
+# Starts a streaming completion and returns its chunk stream
+StreamOpener = Callable[[], Awaitable[AsyncIterator]]
+
+class HedgePolicy:
+    """Fires a backup request when the first chunk is slow, and keeps whichever
+    stream produces a token first.
+
+    The hedge delay is the observed p95 time to first token (or `initial_delay`
+    until enough samples exist). Hedges are limited to `max_hedge_ratio` of all
+    requests and `max_hedges` in total, so a slow provider can at most double
+    the cost of that fraction of turns.
+    """
+
+    def __init__(
+        self,
+        alternate_model: str = None,
+        initial_delay: float = 4.0,
+        min_delay: float = 0.5,
+        percentile: float = 0.95,
+        window: int = 100,
+        min_samples: int = 10,
+        max_hedge_ratio: float = 0.1,
+        max_hedges: int = 50,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Initialize the policy.
+
+        Args:
+            alternate_model: Model for the hedge request; None hedges with the same model
+            initial_delay: Hedge delay in seconds before enough samples have been observed
+            min_delay: Lower bound on the hedge delay
+            percentile: Time-to-first-token percentile used as the hedge delay
+            window: Number of recent time-to-first-token samples kept
+            min_samples: Samples needed before the percentile is used
+            max_hedge_ratio: Maximum fraction of requests that may be hedged
+            max_hedges: Maximum number of hedges in total
+            clock: Time source
+        """
+        self.alternate_model = alternate_model
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_hedges = max_hedges
+        self._clock = clock
+        self._ttfts = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self._discards = set()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first chunk before hedging."""
+        if len(self._ttfts) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._ttfts)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    async def open(self, primary: StreamOpener, hedge: StreamOpener) -> tuple[AsyncGenerator, bool]:
+        """Open the primary stream, hedging with a second one if its first chunk is slow.
+
+        Args:
+            primary: Starts the primary request
+            hedge: Starts the hedge request
+
+        Returns:
+            (the winning stream, whether the hedge won)
+        """
+        self.requests += 1
+        started = self._clock()
+        primary_leg = asyncio.create_task(self._first_chunk(primary))
+        done, _ = await asyncio.wait({primary_leg}, timeout=self.hedge_delay())
+
+        if done or not self._budget_allows():
+            first_chunk, chunks = await primary_leg
+            self._ttfts.append(self._clock() - started)
+            return self._join(first_chunk, chunks), False
+
+        self.hedges += 1
+        print(f"[HEDGE DEBUG] No first token after {self.hedge_delay():.2f}s, sending hedge request")
+        hedge_leg = asyncio.create_task(self._first_chunk(hedge))
+        pending = {primary_leg, hedge_leg}
+        error = None
+
+        # The first leg to produce a chunk wins; a failed leg leaves the race to the other
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Both legs may finish on the same wake-up; the primary is preferred then
+            finished = [leg for leg in (primary_leg, hedge_leg) if leg in done and leg.exception() is None]
+            for leg in done:
+                if leg.exception() is not None:
+                    error = leg.exception()
+            if not finished:
+                continue
+            winner = finished[0]
+            # Close every other leg, whether it is still waiting or already has a stream
+            for loser in (primary_leg, hedge_leg):
+                if loser is winner or (loser.done() and loser.exception() is not None):
+                    continue
+                loser.cancel()
+                discard = asyncio.create_task(self._discard(loser))
+                self._discards.add(discard)
+                discard.add_done_callback(self._discards.discard)
+            self._ttfts.append(self._clock() - started)
+            hedge_won = winner is hedge_leg
+            if hedge_won:
+                self.hedge_wins += 1
+            first_chunk, chunks = winner.result()
+            return self._join(first_chunk, chunks), hedge_won
+        raise error
+
+    def stats(self) -> Dict[str, float]:
+        """Return hedge rate and win metrics."""
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            "budget_denied": self.budget_denied,
+            "hedge_delay": round(self.hedge_delay(), 3),
+        }
+
+    def _budget_allows(self) -> bool:
+        if self.hedges >= self.max_hedges or (self.hedges + 1) / self.requests > self.max_hedge_ratio:
+            self.budget_denied += 1
+            return False
+        return True
+
+    @staticmethod
+    async def _first_chunk(opener: StreamOpener):
+        """Start a request and wait for its first chunk."""
+        stream = await opener()
+        chunks = stream.__aiter__()
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        return first_chunk, chunks
+
+    @staticmethod
+    async def _join(first_chunk, chunks) -> AsyncGenerator:
+        """Yield the winning stream, starting with its already received first chunk."""
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    @staticmethod
+    async def _discard(leg: asyncio.Task):
+        """Close the losing leg's stream so its connection is released."""
+        try:
+            _, chunks = await leg
+        except BaseException:
+            return
+        if hasattr(chunks, "aclose"):
+            try:
+                await chunks.aclose()
+            except Exception:
+                pass
@@ -1,4 +1,4 @@
-from agents.base_agent import BaseAgent
+from agents.base_agent import BaseAgent, ACTION_TAGS
 from .agent_factory import AgentFactory
 
 IMPLEMENTATION_PROMPT = """
@@ -25,10 +25,90 @@ You have access to the following functions:
         },
         "required": ["filename", "contents"]
     }
+    },
+    "replaceInArtifact": {
+    "description": "Replace one exact block of text in an existing artifact file.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+        "filename": {
+            "type": "string",
+            "description": "The name of the file to edit."
+        },
+        "search": {
+            "type": "string",
+            "description": "The exact text to replace. It must occur exactly once in the file."
+        },
+        "replace": {
+            "type": "string",
+            "description": "The replacement text."
+        },
+        "base_hash": {
+            "type": "string",
+            "description": "The hash shown on the artifact you are editing."
+        }
+        },
+        "required": ["filename", "search", "replace"]
+    }
+    },
+    "patchArtifact": {
+    "description": "Apply a unified diff to an existing artifact file.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+        "filename": {
+            "type": "string",
+            "description": "The name of the file to patch."
+        },
+        "diff": {
+            "type": "string",
+            "description": "A unified diff with @@ hunks. Context lines must match the file exactly."
+        },
+        "base_hash": {
+            "type": "string",
+            "description": "The hash shown on the artifact you are editing."
+        }
+        },
+        "required": ["filename", "diff"]
+    }
+    },
+    "editArtifactLines": {
+    "description": "Replace a range of lines in an existing artifact file.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+        "filename": {
+            "type": "string",
+            "description": "The name of the file to edit."
+        },
+        "start_line": {
+            "type": "integer",
+            "description": "The first line to replace, starting at 1."
+        },
+        "end_line": {
+            "type": "integer",
+            "description": "The last line to replace, inclusive. Use start_line - 1 to insert before start_line."
+        },
+        "contents": {
+            "type": "string",
+            "description": "The replacement lines."
+        },
+        "base_hash": {
+            "type": "string",
+            "description": "The hash shown on the artifact the line numbers refer to."
+        }
+        },
+        "required": ["filename", "start_line", "end_line", "contents"]
+    }
     }
 }
 </available_functions>
 
+Use updateArtifact to create a file or to rewrite most of it. To change part of an existing \
+file, prefer replaceInArtifact or patchArtifact, which only need the changed text. Pass the \
+hash shown on the artifact as base_hash; if the file has changed since, the edit fails and \
+you should redo it against the new contents.
+
 To use any function, generate a function call in JSON format, wrapped in \
 <function_call> tags. For example:
 <function_call>
@@ -52,6 +132,9 @@ class ImplementationAgent(BaseAgent):
     """
     Subclass of BaseAgent specialized in implementing HTML/CSS components based on provided milestones.
     """
+    functions = ("updateArtifact", "replaceInArtifact", "patchArtifact", "editArtifactLines")
+    cache_responses = True
+    stop_after_tags = ACTION_TAGS
 
     def __init__(
         self,
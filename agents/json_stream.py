@@ -0,0 +1,234 @@
+"""
+Incremental JSON parsing for values that arrive as a stream of text chunks.
+"""
+import re
+import string
+from typing import Callable
+
+# A run of string characters that need no special handling
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]+')
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?\Z")
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_WHITESPACE = frozenset(" \t\n\r")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = {"t": ("true", True), "f": ("false", False), "n": ("null", None)}
+
+class JSONStreamError(ValueError):
+    """The text can't be the start of a valid JSON value."""
+
+    def __init__(self, message: str, position: int = None):
+        super().__init__(message)
+        self.message = message
+        self.position = position
+
+class IncrementalJSONParser:
+    """Parses a single JSON value from chunks of text, failing at the first invalid character.
+
+    Objects and arrays are built as they are parsed, and callbacks report each
+    object key and member as soon as it is complete, so a caller can validate
+    a value before the rest of it has arrived. Callbacks reject the value by
+    raising JSONStreamError.
+    """
+
+    def __init__(
+        self,
+        on_key: Callable[[tuple, str], None] = None,
+        on_member: Callable[[tuple, str, object], None] = None
+    ):
+        """Initialize the parser.
+
+        Args:
+            on_key: Called with (path of the object, key) when a key is complete
+            on_member: Called with (path of the object, key, value) when a member's value is complete
+        """
+        self.on_key = on_key
+        self.on_member = on_member
+        self.position = 0
+        self.done = False
+        self.value = None
+        # One [container, pending key, path] per open object or array
+        self._frames = []
+        self._state = "value"
+        self._chars = []
+        self._is_key = False
+        self._surrogates = False
+        self._literal = ""
+
+    def feed(self, text: str) -> int:
+        """Parse the next chunk of text.
+
+        Returns:
+            How many characters of the chunk belong to the value; once the value
+            is complete, the rest of the chunk is left to the caller
+
+        Raises:
+            JSONStreamError: The text so far can't be part of a valid value
+        """
+        i, n = 0, len(text)
+        try:
+            while i < n and not self.done:
+                i = self._step(text, i)
+        except JSONStreamError as e:
+            if e.position is None:
+                e.position = self.position + i
+            raise
+        self.position += i
+        return i
+
+    def close(self):
+        """Return the parsed value, raising JSONStreamError if it is incomplete."""
+        if self._state == "number" and not self._frames:
+            self._end_number(self.position)
+        if not self.done:
+            raise JSONStreamError("unexpected end of input", self.position)
+        return self.value
+
+    def _step(self, text: str, i: int) -> int:
+        state = self._state
+        if state == "string":
+            run = _STRING_RUN.match(text, i)
+            if run:
+                self._chars.append(run.group())
+                return run.end()
+            c = text[i]
+            if c == '"':
+                self._end_string()
+            elif c == "\\":
+                self._state = "escape"
+            else:
+                raise JSONStreamError(f"unescaped control character {c!r} in a string")
+            return i + 1
+
+        c = text[i]
+        if state == "escape":
+            if c == "u":
+                self._state = "unicode"
+                self._literal = ""
+            elif c in _ESCAPES:
+                self._chars.append(_ESCAPES[c])
+                self._state = "string"
+            else:
+                raise JSONStreamError(f"invalid escape '\\{c}' in a string")
+            return i + 1
+        if state == "unicode":
+            if c not in string.hexdigits:
+                raise JSONStreamError("invalid \\u escape in a string")
+            self._literal += c
+            if len(self._literal) == 4:
+                code_point = int(self._literal, 16)
+                self._surrogates = self._surrogates or 0xD800 <= code_point <= 0xDFFF
+                self._chars.append(chr(code_point))
+                self._state = "string"
+            return i + 1
+        if state == "number":
+            if c in _NUMBER_CHARS:
+                self._chars.append(c)
+                return i + 1
+            self._end_number(self.position + i)
+            return i
+        if state == "literal":
+            self._literal += c
+            literal, value = _LITERALS[self._literal[0]]
+            if not literal.startswith(self._literal):
+                raise JSONStreamError(f"invalid literal {self._literal!r}")
+            if self._literal == literal:
+                self._end_value(value)
+            return i + 1
+
+        if c in _WHITESPACE:
+            return i + 1
+        if state == "value" or state == "value_or_end":
+            if c == "]" and state == "value_or_end":
+                self._end_container()
+                return i + 1
+            return self._start_value(c, i)
+        if state == "key" or state == "key_or_end":
+            if c == "}" and state == "key_or_end":
+                self._end_container()
+            elif c == '"':
+                self._start_string(is_key=True)
+            else:
+                raise JSONStreamError(f"expected an object key, got {c!r}")
+            return i + 1
+        if state == "colon":
+            if c != ":":
+                raise JSONStreamError(f"expected ':' after an object key, got {c!r}")
+            self._state = "value"
+            return i + 1
+        # After a value inside an object or array
+        is_object = isinstance(self._frames[-1][0], dict)
+        if c == ",":
+            self._state = "key" if is_object else "value"
+        elif c == ("}" if is_object else "]"):
+            self._end_container()
+        else:
+            raise JSONStreamError(f"expected ',' or '{'}' if is_object else ']'}', got {c!r}")
+        return i + 1
+
+    def _start_value(self, c: str, i: int) -> int:
+        if c == '"':
+            self._start_string(is_key=False)
+        elif c == "{" or c == "[":
+            if self._frames:
+                parent, key, parent_path = self._frames[-1]
+                path = parent_path + (key if isinstance(parent, dict) else len(parent),)
+            else:
+                path = ()
+            self._frames.append([{} if c == "{" else [], None, path])
+            self._state = "key_or_end" if c == "{" else "value_or_end"
+        elif c == "-" or c in "0123456789":
+            self._state = "number"
+            self._chars = [c]
+        elif c in _LITERALS:
+            self._state = "literal"
+            self._literal = c
+        else:
+            raise JSONStreamError(f"expected a value, got {c!r}")
+        return i + 1
+
+    def _start_string(self, is_key: bool):
+        self._state = "string"
+        self._is_key = is_key
+        self._chars = []
+        self._surrogates = False
+
+    def _end_string(self):
+        text = "".join(self._chars)
+        if self._surrogates:
+            # Combine escaped UTF-16 surrogate pairs
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "surrogatepass")
+        if not self._is_key:
+            self._end_value(text)
+            return
+        frame = self._frames[-1]
+        frame[1] = text
+        self._state = "colon"
+        if self.on_key is not None:
+            self.on_key(frame[2], text)
+
+    def _end_number(self, position: int):
+        text = "".join(self._chars)
+        if not _NUMBER.match(text):
+            raise JSONStreamError(f"invalid number {text!r}", position)
+        self._end_value(int(text) if text.lstrip("-").isdigit() else float(text))
+
+    def _end_container(self):
+        container = self._frames.pop()[0]
+        self._end_value(container)
+
+    def _end_value(self, value):
+        if not self._frames:
+            self.value = value
+            self.done = True
+            self._state = "done"
+            return
+        frame = self._frames[-1]
+        container, key, path = frame
+        if isinstance(container, dict):
+            container[key] = value
+            frame[1] = None
+            if self.on_member is not None:
+                self.on_member(path, key, value)
+        else:
+            container.append(value)
+        self._state = "after"
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional
+
+REPEATED_CALL_NOTE = "\n(Identical to an earlier call in this request; the earlier result is reused.)"
+REPEATED_DELEGATION_NOTE = (
+    "\n(This delegation was already run for this request and its earlier result is repeated here. "
+    "Do not delegate it again.)"
+)
+
+def canonical_json(text: str) -> str:
+    """Canonical form of a JSON call or request, with sorted keys and no whitespace.
+
+    Text that isn't valid JSON is compared with its whitespace collapsed.
+    """
+    try:
+        return json.dumps(json.loads(text), sort_keys=True, separators=(",", ":"))
+    except json.JSONDecodeError:
+        return " ".join(text.split())
+
+def delegation_key(delegation: dict) -> str:
+    """Canonical form of a delegation: agent, instructions (whitespace collapsed) and attachments."""
+    return json.dumps({
+        "name": delegation.get("name"),
+        "instructions": " ".join(str(delegation.get("instructions", "")).split()),
+        "attachments": sorted(map(str, delegation.get("attachments", []))),
+    }, sort_keys=True, separators=(",", ":"))
+
+def repeating_cycle(turns: List[tuple], max_period: int, repeats: int) -> Optional[int]:
+    """Return the period of a cycle of turns repeated at least `repeats` times at the end of turns.
+
+    Args:
+        turns: Action signature of each model turn, oldest first
+        max_period: Longest cycle to look for, in turns
+        repeats: Consecutive occurrences that make a loop
+    """
+    for period in range(1, max_period + 1):
+        window = period * repeats
+        if len(turns) < window:
+            break
+        cycle = turns[-period:]
+        if all(turns[-window + i] == cycle[i % period] for i in range(window)):
+            return period
+    return None
+
+class RequestLedger:
+    """Function calls and delegations already made while handling one user request.
+
+    Shared by the agent that received the request and every agent it delegates
+    to. Read-only function calls are kept as futures, so an identical call
+    (even one started while the first is still running) joins it instead of
+    running again. Delegation results are kept once their delegation finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._delegations: Dict[str, str] = {}
+        self.repeated_calls = 0
+        self.repeated_delegations = 0
+
+    def call(self, key: str, start: Callable[[], Awaitable[str]]) -> tuple[asyncio.Future, bool]:
+        """Return (future result, repeated): the earlier identical call's, or a newly started one."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.repeated_calls += 1
+            return future, True
+        future = asyncio.ensure_future(start())
+        self._calls[key] = future
+        return future, False
+
+    def delegation_result(self, key: str) -> Optional[str]:
+        result = self._delegations.get(key)
+        if result is not None:
+            self.repeated_delegations += 1
+        return result
+
+    def record_delegation(self, key: str, result: str) -> None:
+        # The first result is kept; later ones are repeats of it
+        self._delegations.setdefault(key, result)
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": len(self._calls),
+            "repeated_calls": self.repeated_calls,
+            "delegations": len(self._delegations),
+            "repeated_delegations": self.repeated_delegations,
+        }
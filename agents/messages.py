@@ -0,0 +1,144 @@
+"""
+Compact in-memory representation of conversation histories.
+
+Messages keep text as a single string and images as references to shared
+blobs, and are only expanded to litellm's dict format when a request is sent.
+"""
+import hashlib
+import re
+import sys
+import threading
+import weakref
+from typing import Iterable
+
+DATA_URL = re.compile(r"^data:([^;,]+);base64,", re.ASCII)
+
+class ImageBlob:
+    """Base64 image data shared by every message that contains the same image."""
+
+    __slots__ = ("data", "hash", "__weakref__")
+
+    def __init__(self, data: str, blob_hash: str):
+        self.data = data
+        self.hash = blob_hash
+
+# Blobs by content hash; a blob is dropped once no message references it
+_BLOBS: "weakref.WeakValueDictionary[str, ImageBlob]" = weakref.WeakValueDictionary()
+_BLOBS_LOCK = threading.Lock()
+
+def share_blob(data: str) -> ImageBlob:
+    """Return the shared blob for base64 data, creating it on first use."""
+    blob_hash = hashlib.sha256(data.encode("ascii")).hexdigest()
+    with _BLOBS_LOCK:
+        blob = _BLOBS.get(blob_hash)
+        if blob is None:
+            blob = ImageBlob(data, blob_hash)
+            _BLOBS[blob_hash] = blob
+        return blob
+
+class ImagePart:
+    __slots__ = ("mime", "blob")
+
+    def __init__(self, mime: str, blob: ImageBlob):
+        self.mime = sys.intern(mime)
+        self.blob = blob
+
+    def to_dict(self) -> dict:
+        return {"type": "image_url", "image_url": {"url": f"data:{self.mime};base64,{self.blob.data}"}}
+
+def _compact_part(part):
+    """Text parts become plain strings and inline images shared ImageParts; others are kept as is."""
+    if part.get("type") == "text":
+        return part["text"]
+    if part.get("type") == "image_url":
+        url = part["image_url"]["url"]
+        if match := DATA_URL.match(url):
+            return ImagePart(match.group(1), share_blob(url[match.end():]))
+    return part
+
+def _expand_part(part) -> dict:
+    if isinstance(part, str):
+        return {"type": "text", "text": part}
+    if isinstance(part, ImagePart):
+        return part.to_dict()
+    return part
+
+class Message:
+    """A single chat message.
+
+    Supports read access like the dict it replaces (message["role"],
+    message.get("content")), so code written against dict messages keeps working.
+    """
+
+    __slots__ = ("role", "_content")
+
+    def __init__(self, role: str, content):
+        self.role = sys.intern(role)
+        self._content = content if isinstance(content, str) or content is None else tuple(map(_compact_part, content))
+
+    @classmethod
+    def from_dict(cls, message) -> "Message":
+        if isinstance(message, Message):
+            return message
+        return cls(message["role"], message.get("content"))
+
+    @property
+    def content(self):
+        """The content in litellm's format: a string, or a list of part dicts."""
+        if isinstance(self._content, tuple):
+            return [_expand_part(part) for part in self._content]
+        return self._content
+
+    @property
+    def text(self) -> str:
+        """The message's text, without expanding any images."""
+        if isinstance(self._content, tuple):
+            return " ".join(part for part in self._content if isinstance(part, str))
+        return self._content or ""
+
+    @property
+    def image_count(self) -> int:
+        if isinstance(self._content, tuple):
+            return sum(isinstance(part, ImagePart) for part in self._content)
+        return 0
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+    def __getitem__(self, key: str):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("role", "content")
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.text[:40]!r})"
+
+class MessageList(list):
+    """A conversation history that stores every message it's given as a compact Message."""
+
+    def __init__(self, messages: Iterable = ()):
+        super().__init__(map(Message.from_dict, messages))
+
+    def append(self, message):
+        super().append(Message.from_dict(message))
+
+    def insert(self, index: int, message):
+        super().insert(index, Message.from_dict(message))
+
+    def extend(self, messages: Iterable):
+        super().extend(map(Message.from_dict, messages))
+
+def as_dicts(messages: Iterable) -> list:
+    """Expand messages to litellm's dict format for a request."""
+    return [message.to_dict() if isinstance(message, Message) else message for message in messages]
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+from typing import AsyncGenerator, Callable, Dict, List
+
+import litellm
+
+DEFAULT_ROUTING_CONFIG = {
+    "tiers": {
+        "fast": ["anthropic/claude-3-5-haiku-latest", "openai/gpt-4o-mini"],
+        "strong": ["anthropic/claude-3-5-sonnet-latest", "openai/gpt-4o"],
+    },
+    "default_tier": "strong",
+    # Default tier per agent class
+    "agents": {
+        "MovieAgent": "fast",
+        "MovieReviewsAgent": "fast",
+    },
+    # Per-turn overrides, first match wins. Conditions: "agent" (class name) and
+    # "last_message" (one of "user", "image", "function_result", "delegate_agent_result",
+    # "delegate_plan_result")
+    "rules": [
+        # The Supervisor's first turn on an upload only has to call saveImage
+        {"agent": "SupervisorAgent", "last_message": "image", "tier": "fast"},
+    ],
+    # Tier to escalate to when every model of a tier failed
+    "escalation": {
+        "fast": "strong",
+    },
+    # Seconds to wait for a model's first chunk before failing over to the next one
+    "first_token_timeout": 30,
+}
+
+def classify_turn(messages: list) -> str:
+    """Describe what the model is responding to, for matching routing rules."""
+    if not messages:
+        return "user"
+    content = messages[-1].get("content")
+    if isinstance(content, list):
+        return "image" if any(part.get("type") == "image_url" for part in content) else "user"
+    for tag in ("function_result", "delegate_agent_result", "delegate_plan_result"):
+        if isinstance(content, str) and content.startswith(f"<{tag}>"):
+            return tag
+    return "user"
+
+class TierStats:
+    __slots__ = ("requests", "failures", "failovers", "escalations", "ttft_total", "latency_total", "completed", "cost")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.failovers = 0
+        self.escalations = 0
+        self.ttft_total = 0.0
+        self.latency_total = 0.0
+        self.completed = 0
+        self.cost = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "failovers": self.failovers,
+            "escalations": self.escalations,
+            "avg_ttft": round(self.ttft_total / self.completed, 3) if self.completed else None,
+            "avg_latency": round(self.latency_total / self.completed, 3) if self.completed else None,
+            "cost": round(self.cost, 6),
+        }
+
+class ModelRouter:
+    """Picks a model tier per agent and per turn, and fails over across the tier's models.
+
+    Failover happens only before the first chunk arrives; once tokens have been
+    streamed to the UI, a mid-stream error propagates as before. When every model
+    of a tier failed, the request escalates to the tier configured in "escalation".
+    """
+
+    def __init__(
+        self,
+        config: dict = None,
+        completion: Callable = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Initialize the router.
+
+        Args:
+            config: Routing config, see DEFAULT_ROUTING_CONFIG
+            completion: Async completion function with litellm.acompletion's signature;
+                replace with a fake provider for testing
+            clock: Time source for latency metrics
+        """
+        self.config = config or DEFAULT_ROUTING_CONFIG
+        self._completion = completion
+        self._clock = clock
+        self._stats: Dict[str, TierStats] = {tier: TierStats() for tier in self.config["tiers"]}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ModelRouter":
+        """Create a router from a JSON config file."""
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def select_tier(self, agent_name: str, messages: list) -> str:
+        """Return the tier for the agent's next turn."""
+        turn = classify_turn(messages)
+        for rule in self.config.get("rules", []):
+            if rule.get("agent", agent_name) == agent_name and rule.get("last_message", turn) == turn:
+                return rule["tier"]
+        return self.config.get("agents", {}).get(agent_name, self.config.get("default_tier", "strong"))
+
+    def models_for(self, tier: str) -> List[str]:
+        return list(self.config["tiers"][tier])
+
+    async def acompletion(
+        self, tier: str, messages: list, _tried: tuple = (), **kwargs
+    ) -> tuple[AsyncGenerator, str]:
+        """Start a streaming completion on the first healthy model of the tier.
+
+        Args:
+            tier: Tier returned by select_tier
+            messages: Request messages
+            kwargs: Extra litellm arguments (temperature, tools, ...)
+
+        Returns:
+            (stream of chunks, model used)
+
+        Raises:
+            The last error if every model in the tier and the tiers it escalates to failed
+        """
+        completion = self._completion or litellm.acompletion
+        stats = self._stats.setdefault(tier, TierStats())
+        timeout = self.config.get("first_token_timeout")
+        last_error = None
+
+        for attempt, model in enumerate(self.models_for(tier)):
+            stats.requests += 1
+            if attempt:
+                stats.failovers += 1
+            started = self._clock()
+            response = None
+            try:
+                response = await asyncio.wait_for(
+                    completion(model=model, messages=messages, stream=True, **kwargs), timeout
+                )
+                chunks = response.__aiter__()
+                first_chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                first_chunk, chunks = None, None
+            except Exception as e:
+                stats.failures += 1
+                last_error = e
+                # Release the abandoned stream's connection
+                if hasattr(response, "aclose"):
+                    try:
+                        await response.aclose()
+                    except Exception:
+                        pass
+                print(f"[ROUTER DEBUG] {model} failed ({type(e).__name__}: {e}), trying next model")
+                continue
+            return self._metered(tier, model, messages, started, first_chunk, chunks), model
+
+        escalate_to = self.config.get("escalation", {}).get(tier)
+        if escalate_to is not None and escalate_to not in _tried + (tier,):
+            stats.escalations += 1
+            print(f"[ROUTER DEBUG] Every {tier} model failed, escalating to {escalate_to}")
+            return await self.acompletion(escalate_to, messages, _tried=_tried + (tier,), **kwargs)
+
+        raise last_error or RuntimeError(f"No models configured for tier {tier}")
+
+    async def _metered(self, tier, model, messages, started, first_chunk, chunks) -> AsyncGenerator:
+        """Re-yield the stream while recording time to first token, latency and cost."""
+        stats = self._stats[tier]
+        ttft = self._clock() - started
+        completion_text = []
+        try:
+            if first_chunk is not None:
+                completion_text.append(first_chunk.choices[0].delta.content or "")
+                yield first_chunk
+                async for chunk in chunks:
+                    completion_text.append(chunk.choices[0].delta.content or "")
+                    yield chunk
+        finally:
+            stats.completed += 1
+            stats.ttft_total += ttft
+            stats.latency_total += self._clock() - started
+            stats.cost += self._estimate_cost(model, messages, "".join(completion_text))
+
+    @staticmethod
+    def _estimate_cost(model: str, messages: list, completion_text: str) -> float:
+        try:
+            prompt_tokens = litellm.token_counter(model=model, messages=messages)
+            completion_tokens = litellm.token_counter(model=model, text=completion_text)
+            prompt_cost, completion_cost = litellm.cost_per_token(
+                model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )
+            return prompt_cost + completion_cost
+        except Exception:
+            # Unknown models have no pricing; latency is still recorded
+            return 0.0
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return request, failover, latency and cost metrics per tier."""
+        return {tier: stats.as_dict() for tier, stats in self._stats.items()}
@@ -12,13 +12,28 @@ You have access to the following functions:
 <available_functions>
 {
   "get_now_playing": {
-    "description": "Fetches a list of movies currently playing in theaters",
+    "description": "Fetches a compact list of movies currently playing in theaters \
+(title, TMDb movie ID and release date)",
     "parameters": {
       "type": "object",
       "properties": {},
       "required": []
     }
   },
+  "find_movie": {
+    "description": "Look up a movie by title (typos and partial titles are fine) and \
+get its TMDb movie ID, release date and overview",
+    "parameters": {
+      "type": "object",
+      "properties": {
+        "title": {
+          "type": "string",
+          "description": "Title or part of the title of the movie"
+        }
+      },
+      "required": ["title"]
+    }
+  },
   "get_showtimes": {
     "description": "Get movie showtimes for a specific title and location",
     "parameters": {
@@ -99,6 +114,7 @@ industry trends, or recent developments in cinema
 
 2. If the question is to fetch currently playing movies:
    - Call the get_now_playing function before responding
+   - Call find_movie when you need the overview or movie ID of a specific movie
 
 3. For general movie-related discussions:
    - Draw upon your knowledge of cinema, directors, actors, and film history
@@ -118,6 +134,10 @@ admit it and offer to provide related information you are confident about
 
 class MovieAgent(BaseAgent):
     """A specialized agent for handling movie-related queries."""
+    speculative_dispatch = True
+    functions = ("get_now_playing", "find_movie", "get_showtimes")
+    uses_prefetcher = True
+    native_tools = True
     
     def __init__(
         self,
@@ -139,10 +159,23 @@ class MovieAgent(BaseAgent):
             model_kwargs=model_kwargs
         )
 
+        # Used when the agent starts a session; a delegating agent passes down the session's
+        from movie_prefetch import MoviePrefetcher
+        self.prefetcher = MoviePrefetcher()
+
     def get_now_playing(self) -> str:
-        """Fetch a list of movies currently playing in theaters."""
-        from movie_functions import get_now_playing_movies
-        return get_now_playing_movies()
+        """Fetch a compact list of movies currently playing in theaters."""
+        from movie_functions import get_now_playing_summary
+        return get_now_playing_summary()
+
+    def find_movie(self, title: str) -> str:
+        """Look up a movie by title.
+        
+        Args:
+            title: Title or part of the title of the movie
+        """
+        from movie_functions import find_movies
+        return find_movies(title)
 
     def get_showtimes(self, title: str, location: str) -> str:
         """Get movie showtimes for a specific title and location.
@@ -12,17 +12,41 @@ You have access to the following functions:
 <available_functions>
 {
   "get_reviews": {
-    "description": "Get reviews for a specific movie",
+    "description": "Get the review count and average rating for a specific movie, \
+plus excerpts from a balanced selection of its reviews",
     "parameters": {
       "type": "object",
       "properties": {
         "movie_id": {
           "type": "string",
           "description": "TMDb movie ID"
+        },
+        "top_k": {
+          "type": "integer",
+          "description": "Number of review excerpts to return (default 3)"
         }
       },
       "required": ["movie_id"]
     }
+  },
+  "get_reviews_batch": {
+    "description": "Get review summaries for several movies at once. Prefer this over \
+multiple get_reviews calls when comparing movies",
+    "parameters": {
+      "type": "object",
+      "properties": {
+        "movie_ids": {
+          "type": "array",
+          "items": {"type": "string"},
+          "description": "TMDb movie IDs"
+        },
+        "top_k": {
+          "type": "integer",
+          "description": "Number of review excerpts per movie (default 2)"
+        }
+      },
+      "required": ["movie_ids"]
+    }
   }
 }
 </available_functions>
@@ -57,6 +81,10 @@ When analyzing reviews, follow these guidelines:
 
 class MovieReviewsAgent(BaseAgent):
     """A specialized agent for handling movie review queries."""
+    speculative_dispatch = True
+    functions = ("get_reviews", "get_reviews_batch")
+    uses_prefetcher = True
+    native_tools = True
     
     def __init__(
         self,
@@ -78,14 +106,29 @@ class MovieReviewsAgent(BaseAgent):
             model_kwargs=model_kwargs
         )
 
-    def get_reviews(self, movie_id: str) -> str:
-        """Get reviews for a specific movie.
+        # Used when the agent starts a session; a delegating agent passes down the session's
+        from movie_prefetch import MoviePrefetcher
+        self.prefetcher = MoviePrefetcher()
+
+    def get_reviews(self, movie_id: str, top_k: int = 3) -> str:
+        """Get a review summary for a specific movie.
         
         Args:
             movie_id: TMDb movie ID
+            top_k: Number of review excerpts to return
+        """
+        from movie_functions import get_review_summary
+        return get_review_summary(str(movie_id), top_k)
+
+    def get_reviews_batch(self, movie_ids: list[str], top_k: int = 2) -> str:
+        """Get review summaries for several movies, fetched concurrently.
+        
+        Args:
+            movie_ids: TMDb movie IDs
+            top_k: Number of review excerpts per movie
         """
-        from movie_functions import get_reviews
-        return get_reviews(movie_id)
+        from movie_functions import get_reviews_batch
+        return get_reviews_batch([str(movie_id) for movie_id in movie_ids], top_k)
 
 # Register the agent with the factory
 AgentFactory.register(MovieReviewsAgent) 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, ACTION_TAGS
 from .agent_factory import AgentFactory
 
 PLANNING_PROMPT = """\
@@ -311,6 +311,9 @@ response. Once the plan is complete and saved in plan.md, return with a <delegat
 
 class PlanningAgent(BaseAgent):
     """A specialized agent for creating detailed webpage implementation plans."""
+    functions = ("updateArtifact",)
+    cache_responses = True
+    stop_after_tags = ACTION_TAGS
     
     def __init__(
         self,
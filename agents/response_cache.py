@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Iterator
+
+class ResponseCache:
+    """LRU cache of complete model responses, persisted as one JSON file per entry.
+
+    Keys hash everything that determines a response: model, generation
+    arguments and the full request messages, which include the system prompt
+    and artifact contents. Only low-temperature requests are cached, since
+    other responses aren't expected to repeat.
+    """
+
+    def __init__(
+        self,
+        directory: str = ".cache/responses",
+        max_entries: int = 500,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_temperature: float = 0.3,
+        replay_chunk_size: int = 64
+    ):
+        """Initialize the cache, loading the index of entries already on disk.
+
+        Args:
+            directory: Where entries are persisted, or None to keep them in memory only
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of the cache, as stored
+            max_temperature: Requests with a higher temperature are never cached
+            replay_chunk_size: Characters per token when replaying a cached response
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_temperature = max_temperature
+        self.replay_chunk_size = replay_chunk_size
+        # Key -> size in bytes, least recently used first; text is loaded from disk on demand
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._memory: dict[str, str] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            entries = [e for e in os.scandir(directory) if e.name.endswith(".json")]
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                self._index[entry.name[:-5]] = entry.stat().st_size
+                self._bytes += entry.stat().st_size
+            self._evict()
+
+    def key(self, model: str, messages: list, request_kwargs: dict) -> str | None:
+        """Build the cache key for a request, or None if the request shouldn't be cached."""
+        if request_kwargs.get("temperature", 1.0) > self.max_temperature:
+            return None
+        payload = json.dumps(
+            {"model": model, "kwargs": request_kwargs, "messages": messages},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response text, or None on a miss."""
+        if key not in self._index:
+            self.misses += 1
+            return None
+
+        text = self._memory.get(key)
+        if text is None:
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = json.load(f)["text"]
+            except (OSError, ValueError, KeyError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+        self._index.move_to_end(key)
+        self.hits += 1
+        print(f"[RESPONSE CACHE DEBUG] ✓ Replaying cached response {key[:12]}")
+        return text
+
+    def put(self, key: str, text: str, model: str = None) -> None:
+        """Store a complete response."""
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+
+        if self.directory:
+            path = self._path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": model, "created": time.time(), "text": text}, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        else:
+            self._memory[key] = text
+
+        self._index[key] = size
+        self._bytes += size
+        self._evict()
+
+    def replay(self, text: str) -> Iterator[str]:
+        """Split a cached response into tokens for the normal stream processing."""
+        for start in range(0, len(text), self.replay_chunk_size):
+            yield text[start:start + self.replay_chunk_size]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._index),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remove(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is None:
+            return
+        self._bytes -= size
+        self._memory.pop(key, None)
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        while self._index and (len(self._index) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._index)))
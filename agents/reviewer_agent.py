@@ -10,6 +10,7 @@ For each file you intend to change, you must provide a detailed plan of the chan
 
 class ReviewerAgent(BaseAgent):
     """A specialized agent for creating detailed webpage implementation plans."""
+    cache_responses = True
     
     def __init__(
         self,
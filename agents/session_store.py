@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+DATA_URL = re.compile(r"^data:([^;,]+);base64,(.*)$", re.DOTALL)
+
+class SessionStore(ABC):
+    """Durable, append-only message histories plus per-session config.
+
+    Histories are stored per path: a session id for the top-level agent, and
+    "<session id>/<turn>-<task>-<agent>" for the agents it delegates to. save()
+    only writes the messages added since the stored history, so a turn costs one
+    small append. Inline base64 images are stored once by hash and referenced
+    from the messages. Implementations must be safe to share between processes.
+    """
+
+    @abstractmethod
+    def save(self, path: str, messages: List[dict]) -> None:
+        """Persist the messages added to the history since it was last stored.
+
+        A history shorter than the stored one is stale (another process has
+        extended it since) and is not saved.
+        """
+
+    @abstractmethod
+    def load(self, path: str, start: int = 0) -> List[dict] | None:
+        """Return the stored history from message index start, or None if there is none."""
+
+    @abstractmethod
+    def delete(self, path: str) -> None:
+        """Remove the history of a path and of every path nested below it."""
+
+    @abstractmethod
+    def save_config(self, session_id: str, config: dict) -> None:
+        """Store a session's agent config (model, generation settings, workspace)."""
+
+    @abstractmethod
+    def load_config(self, session_id: str) -> dict | None:
+        """Return a session's agent config, or None if it has none."""
+
+    @abstractmethod
+    def _write_blob(self, data: str) -> str:
+        """Store base64 image data once and return its hash."""
+
+    @abstractmethod
+    def _read_blob(self, blob_hash: str) -> str:
+        """Return the base64 image data stored under a hash."""
+
+    def _pack(self, message: dict) -> dict:
+        content = message.get("content")
+        if not isinstance(content, list):
+            return {"r": message["role"], "c": content}
+        parts = []
+        for part in content:
+            url = part.get("image_url", {}).get("url", "") if part.get("type") == "image_url" else ""
+            if match := DATA_URL.match(url):
+                parts.append({"type": "image_url", "blob": self._write_blob(match.group(2)), "mime": match.group(1)})
+            else:
+                parts.append(part)
+        return {"r": message["role"], "c": parts}
+
+    def _unpack(self, packed: dict) -> dict:
+        content = packed["c"]
+        if isinstance(content, list):
+            content = [
+                {"type": "image_url", "image_url": {"url": f"data:{part['mime']};base64,{self._read_blob(part['blob'])}"}}
+                if "blob" in part else part
+                for part in content
+            ]
+        return {"role": packed["r"], "content": content}
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a SQLite database that several worker processes can share.
+
+    Uses WAL mode so readers don't block the writer; each save runs in its own
+    write transaction and appends after the rows already stored, whichever
+    process wrote them.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """Open (and create if needed) the database.
+
+        Args:
+            path: Database file
+            busy_timeout: Seconds to wait for another process's write to finish
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                path TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (path, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                config TEXT NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def save(self, path: str, messages: List[dict]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (stored,) = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE path = ?", (path,)
+                ).fetchone()
+                if stored > len(messages):
+                    # Another process extended this history after ours was loaded; keep theirs
+                    logger.warning("Stored history of %s is newer than the one being saved, not saving", path)
+                    self._conn.execute("ROLLBACK")
+                    return
+                self._conn.executemany(
+                    "INSERT INTO messages (path, seq, message) VALUES (?, ?, ?)",
+                    [
+                        (path, seq, json.dumps(self._pack(messages[seq]), separators=(",", ":")))
+                        for seq in range(stored, len(messages))
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, path: str, start: int = 0) -> List[dict] | None:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, message FROM messages WHERE path = ? AND seq >= ? ORDER BY seq", (path, start)
+            ).fetchall()
+            if not rows and start == 0:
+                return None
+            return [self._unpack(json.loads(message)) for _, message in rows]
+
+    def delete(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM messages WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(path) + 1, path + "/")
+            )
+
+    def save_config(self, session_id: str, config: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, config, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(config), time.time())
+            )
+
+    def load_config(self, session_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT config FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_blob(self, data: str) -> str:
+        # Called inside save()'s transaction
+        blob_hash = hashlib.sha256(data.encode("ascii")).hexdigest()
+        self._conn.execute("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", (blob_hash, data))
+        return blob_hash
+
+    def _read_blob(self, blob_hash: str) -> str:
+        return self._conn.execute("SELECT data FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()[0]
+
+def open_session_store(location: str) -> SessionStore:
+    """Open a SQLite store for a .db/.sqlite/.sqlite3 path, otherwise a directory of files."""
+    if location.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteSessionStore(location)
+    from .checkpoint import CheckpointStore
+    return CheckpointStore(location)
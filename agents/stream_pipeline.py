@@ -0,0 +1,417 @@
+"""
+A model response as a pipeline: a source of text tokens, a tag parser, stages
+that watch the parsed events, and sinks that fan them out to consumers.
+
+    source -> TagParser -> stages -> sinks
+                  \\-> tokens yielded to the caller
+
+Stages are where per-response concerns (stopping, accounting, caching,
+tracing) plug in without touching the streaming loop. Disabled stages, and
+hooks a stage doesn't override, are left out when the pipeline is built, and a
+pipeline with no parser, stages or sinks just passes tokens through.
+"""
+import time
+from typing import AsyncGenerator, AsyncIterable, Callable, NamedTuple
+
+from .usage import measure_turn, count_text_tokens
+
+# Event kinds
+TEXT = "text"            # Message text outside tags
+TAG_OPEN = "tag_open"    # An opening tag, e.g. "<function_call>"
+TAG_TEXT = "tag_text"    # Text inside a tag
+TAG_CLOSE = "tag_close"  # The rest of a tag's text, up to and including its closing tag
+
+class StreamEvent(NamedTuple):
+    kind: str
+    # Name of the tag the text belongs to, None for message text
+    tag: str | None
+    text: str
+    # Offset in the response just after the event's text
+    end: int
+
+# Builds a StreamEvent without the Python-level __new__, which is most of the parser's time per token
+_event = tuple.__new__
+
+class TagParser:
+    """Splits streamed text into message text and XML tags, one event per run of text in a token.
+
+    Tags don't nest: once a tag is open, everything up to its closing tag is
+    the tag's text.
+    """
+
+    _NORMAL, _OPENING, _IN_TAG = range(3)
+
+    def __init__(self):
+        self._mode = self._NORMAL
+        self._tag = None
+        self._closing = None
+        # Text of a tag being opened, or the end of the open tag's text so far
+        self._pending = ""
+        self.position = 0
+
+    def feed(self, token: str) -> list:
+        """Return the events for the next token of the response."""
+        events = []
+        base = self.position
+        i, n = 0, len(token)
+        while i < n:
+            if self._mode == self._NORMAL:
+                j = token.find("<", i)
+                if j < 0:
+                    events.append(_event(StreamEvent, (TEXT, None, token[i:], base + n)))
+                    break
+                if j > i:
+                    events.append(_event(StreamEvent, (TEXT, None, token[i:j], base + j)))
+                self._mode = self._OPENING
+                self._pending = ""
+                i = j
+            elif self._mode == self._OPENING:
+                j = token.find(">", i)
+                if j < 0:
+                    self._pending += token[i:]
+                    break
+                text = self._pending + token[i:j + 1]
+                self._tag = text[1:-1]
+                self._closing = f"</{self._tag}>"
+                self._mode = self._IN_TAG
+                self._pending = ""
+                events.append(_event(StreamEvent, (TAG_OPEN, self._tag, text, base + j + 1)))
+                i = j + 1
+            else:
+                # The closing tag may start in an earlier token
+                window = self._pending + token[i:]
+                k = window.find(self._closing)
+                if k < 0:
+                    events.append(_event(StreamEvent, (TAG_TEXT, self._tag, token[i:], base + n)))
+                    self._pending = window[-(len(self._closing) - 1):]
+                    break
+                end = i + k + len(self._closing) - len(self._pending)
+                events.append(_event(StreamEvent, (TAG_CLOSE, self._tag, token[i:end], base + end)))
+                self._mode = self._NORMAL
+                self._tag = None
+                self._pending = ""
+                i = end
+        self.position += n
+        return events
+
+    def close(self) -> list:
+        """Return the events for the end of the response: a '<' that never became a tag is message text."""
+        if self._mode == self._OPENING and self._pending:
+            return [_event(StreamEvent, (TEXT, None, self._pending, self.position))]
+        return []
+
+class StreamResult(NamedTuple):
+    # The response as it was yielded
+    text: str
+    # Text received after a stage stopped the response, which wasn't yielded
+    dropped: str
+    # The source ran to its end
+    complete: bool
+    # The stage that stopped the response, if one did
+    stopped_by: "StreamStage | None"
+    # The exception the response failed with, if it did
+    error: Exception | None = None
+
+class StreamStage:
+    """A step that sees a response's parsed events and its end.
+
+    Subclasses override either hook or both; hooks left as they are here are
+    never called. A stage with enabled False is skipped entirely.
+    """
+
+    enabled = True
+
+    def on_event(self, event: StreamEvent) -> bool:
+        """Handle a parsed event. Return True to stop the response after it."""
+        return False
+
+    def on_end(self, result: StreamResult) -> None:
+        """Handle the end of the response, however it ended."""
+
+class StreamSink:
+    """A consumer of a response's parsed events."""
+
+    async def on_event(self, event: StreamEvent) -> None:
+        pass
+
+    def close(self) -> None:
+        """End the sink's streams. Called once, when the response ends."""
+
+class StreamPipeline:
+    """Runs a response through the parser, stages and sinks, yielding its tokens.
+
+    Usage:
+        async for token in StreamPipeline(source, TagParser(), stages, sinks):
+            ...
+
+    When a stage stops the response, the token is cut just after the event
+    that stopped it and the source is closed. The source is also closed when
+    the caller stops iterating. The outcome is kept in `result`.
+    """
+
+    def __init__(self, source: AsyncIterable[str], parser: TagParser = None, stages=(), sinks=()):
+        self.source = source
+        self.parser = parser
+        active = [stage for stage in stages if stage.enabled]
+        self._event_stages = [stage for stage in active if type(stage).on_event is not StreamStage.on_event]
+        self._end_stages = [stage for stage in active if type(stage).on_end is not StreamStage.on_end]
+        self.sinks = list(sinks)
+        self.result = None
+
+    def __aiter__(self) -> AsyncGenerator[str, None]:
+        return self.run()
+
+    async def run(self) -> AsyncGenerator[str, None]:
+        stream = self.source.__aiter__()
+        parser, event_stages, sinks = self.parser, self._event_stages, self.sinks
+        keep = bool(self._end_stages)
+        kept = []
+        length = 0
+        dropped = ""
+        complete = False
+        stopped_by = None
+        error = None
+        try:
+            if parser is None or not (event_stages or sinks):
+                # Nothing looks at the events, so there's nothing to parse
+                async for token in stream:
+                    if keep:
+                        kept.append(token)
+                    yield token
+                complete = True
+                return
+
+            async for token in stream:
+                for event in parser.feed(token):
+                    for stage in event_stages:
+                        if stage.on_event(event) and stopped_by is None:
+                            stopped_by = stage
+                    for sink in sinks:
+                        await sink.on_event(event)
+                    if stopped_by is not None:
+                        token, dropped = token[:event.end - length], token[event.end - length:]
+                        break
+                length += len(token)
+                if keep:
+                    kept.append(token)
+                yield token
+                if stopped_by is not None:
+                    break
+            else:
+                complete = True
+                for event in parser.close():
+                    for sink in sinks:
+                        await sink.on_event(event)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            for sink in sinks:
+                sink.close()
+            self.result = StreamResult("".join(kept), dropped, complete, stopped_by, error)
+            for stage in self._end_stages:
+                stage.on_end(self.result)
+
+class ProviderSource:
+    """Text tokens of a litellm streaming response.
+
+    Native tool calls are rendered as <function_call> tags, and the provider's
+    usage report and finish reason are kept for the stages.
+    """
+
+    def __init__(self, response, tool_calls=None, restore_stop: Callable[[str], str | None] = None):
+        """Initialize the source.
+
+        Args:
+            response: The litellm streaming response
+            tool_calls: ToolCallAssembler when the request passed native tools
+            restore_stop: Called with the text of a response that stopped on its
+                own; returns the stop sequence to add back, or None
+        """
+        self.response = response
+        self.tool_calls = tool_calls
+        self.restore_stop = restore_stop
+        self.received = []
+        self.usage = None
+        self.finish_reason = None
+        # Wall time of the first token
+        self.first_token_at = None
+
+    async def __aiter__(self) -> AsyncGenerator[str, None]:
+        complete = False
+        try:
+            async for chunk in self.response:
+                self.usage = getattr(chunk, "usage", None) or self.usage
+                choice = chunk.choices[0]
+                self.finish_reason = getattr(choice, "finish_reason", None) or self.finish_reason
+                token = choice.delta.content or ""
+                if self.tool_calls is not None and getattr(choice.delta, "tool_calls", None):
+                    token += self.tool_calls.feed(choice.delta.tool_calls)
+                if token:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.time()
+                    self.received.append(token)
+                    yield token
+            if self.tool_calls is not None and (token := self.tool_calls.close()):
+                self.received.append(token)
+                yield token
+            # Providers leave the stop sequence out of the response
+            if self.restore_stop is not None and self.finish_reason != "length":
+                if token := self.restore_stop("".join(self.received)):
+                    self.received.append(token)
+                    yield token
+            complete = True
+        finally:
+            if not complete and hasattr(self.response, "aclose"):
+                await self.response.aclose()
+
+class QueueSink(StreamSink):
+    """Forwards message text and each tag to their own streams, as BaseAgent's callbacks expect.
+
+    Streams are created with create_stream(name, callback), which returns the
+    queue feeding the stream; None ends a stream.
+    """
+
+    def __init__(self, create_stream, on_tag_start, on_message_start):
+        self.create_stream = create_stream
+        self.on_tag_start = on_tag_start
+        self.on_message_start = on_message_start
+        self._message_queue = None
+        self._tag_queue = None
+
+    async def on_event(self, event: StreamEvent) -> None:
+        kind = event.kind
+        if kind == TEXT:
+            if self._message_queue is None:
+                self._message_queue = await self.create_stream(None, self.on_message_start)
+            self._message_queue.put_nowait(event.text)
+        elif kind == TAG_OPEN:
+            self._tag_queue = await self.create_stream(event.tag, self.on_tag_start)
+            self._tag_queue.put_nowait(event.text)
+        else:
+            self._tag_queue.put_nowait(event.text)
+            if kind == TAG_CLOSE:
+                self._tag_queue.put_nowait(None)
+                self._tag_queue = None
+
+    def close(self) -> None:
+        # Includes a tag the model never finished, or one the response was stopped in
+        if self._message_queue is not None:
+            self._message_queue.put_nowait(None)
+        if self._tag_queue is not None:
+            self._tag_queue.put_nowait(None)
+
+class StopAfterTags(StreamStage):
+    """Stops the response as soon as one of the tags closes."""
+
+    def __init__(self, tags: tuple):
+        self.tags = frozenset(tags)
+        self.enabled = bool(self.tags)
+        self.tag = None
+
+    def on_event(self, event: StreamEvent) -> bool:
+        if event.kind == TAG_CLOSE and event.tag in self.tags:
+            self.tag = event.tag
+            return True
+        return False
+
+class ActionTailStage(StreamStage):
+    """Records the output after a response's last action tag in a UsageMeter."""
+
+    def __init__(self, usage, model: str, action_tags: tuple):
+        self.usage = usage
+        self.model = model
+        self.action_tags = frozenset(action_tags)
+        self.enabled = usage is not None
+        self._action_end = None
+
+    def on_event(self, event: StreamEvent) -> bool:
+        if event.kind == TAG_CLOSE and event.tag in self.action_tags:
+            self._action_end = (event.end, time.monotonic())
+        return False
+
+    def on_end(self, result: StreamResult) -> None:
+        if self._action_end is None or not (result.complete or result.stopped_by is not None):
+            return
+        end, closed_at = self._action_end
+        tail = result.dropped if result.stopped_by is not None else result.text[end:]
+        self.usage.record_action_tail(
+            count_text_tokens(self.model, tail), time.monotonic() - closed_at, result.stopped_by is not None
+        )
+
+class UsageStage(StreamStage):
+    """Charges a model turn to the UsageMeter and the token budget, including turns cut short."""
+
+    def __init__(self, agent_name: str, model: str, messages: list, source: ProviderSource,
+                 usage=None, budget=None, budget_scope=None):
+        self.agent_name = agent_name
+        self.model = model
+        self.messages = messages
+        self.source = source
+        self.usage = usage
+        self.budget = budget if budget_scope is not None else None
+        self.budget_scope = budget_scope
+        self.enabled = usage is not None or self.budget is not None
+
+    def on_end(self, result: StreamResult) -> None:
+        prompt_tokens, completion_tokens, estimated = measure_turn(
+            self.model, self.messages, "".join(self.source.received), self.source.usage
+        )
+        if self.usage is not None:
+            self.usage.record(self.agent_name, prompt_tokens, completion_tokens, estimated)
+        if self.budget is not None:
+            self.budget.charge(self.budget_scope, self.model, prompt_tokens, completion_tokens)
+
+class CacheStage(StreamStage):
+    """Stores a response in the ResponseCache once it has finished or was stopped at an action tag.
+
+    Responses the provider cut short (token limit, content filter) and responses
+    that failed are not stored, so a retry asks the model again.
+    """
+
+    # Finish reasons of responses that ended before the model finished them
+    TRUNCATED = frozenset({"length", "content_filter"})
+
+    def __init__(self, cache, key: str | None, model: str, source: ProviderSource = None):
+        self.cache = cache
+        self.key = key
+        self.model = model
+        self.source = source
+        self.enabled = cache is not None and key is not None
+
+    def on_end(self, result: StreamResult) -> None:
+        if result.error is not None:
+            return
+        if result.stopped_by is None:
+            if not result.complete:
+                return
+            if self.source is not None and self.source.finish_reason in self.TRUNCATED:
+                return
+        self.cache.put(self.key, result.text, model=self.model)
+
+class TraceStage(StreamStage):
+    """Ends a model turn's span in the run's trace with the response, its timing and how it ended."""
+
+    def __init__(self, trace, span, source: ProviderSource = None):
+        self.trace = trace
+        self.span = span
+        self.source = source
+        self.enabled = span is not None
+
+    def on_end(self, result: StreamResult) -> None:
+        metadata = {"complete": result.complete}
+        if result.stopped_by is not None:
+            metadata["stopped_by"] = type(result.stopped_by).__name__
+        source = self.source
+        if source is not None:
+            metadata["finish_reason"] = source.finish_reason
+            if source.first_token_at is not None:
+                metadata["first_token_seconds"] = source.first_token_at - self.span.start
+            if source.usage is not None:
+                metadata["prompt_tokens"] = getattr(source.usage, "prompt_tokens", None)
+                metadata["completion_tokens"] = getattr(source.usage, "completion_tokens", None)
+        error = repr(result.error) if result.error is not None else None
+        self.trace.end_span(self.span, {"response": result.text}, error, metadata)
@@ -1,4 +1,4 @@
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, ACTION_TAGS
 from .agent_factory import AgentFactory
 
 SUPERVISOR_PROMPT = """\
@@ -75,10 +75,33 @@ For example:
 
 The agent will respond with a <delegate_agent_result> tag containing either the result or an error message.
 If you receive an error, do not retry the delegation - instead, handle the error gracefully in your response.
+
+Once the plan is saved, you can run several delegations at once with the <delegate_plan> tag. It takes \
+a JSON object with a "tasks" array. Each task has an "id", the "name", "instructions" and optional \
+"attachments" of a delegation, and optionally "depends_on": the ids of tasks that must finish first. \
+Tasks without unfinished dependencies run at the same time. Tasks that write the same file (every \
+milestone of the page writes index.html and styles.css) must depend on each other, or they overwrite \
+each other's work; only tasks that write different files or nothing at all may run at the same time.
+
+For example:
+<delegate_plan>
+{
+  "tasks": [
+    {"id": "hero", "name": "ImplementationAgent", "instructions": "Implement milestone 1: Hero Section from plan.md."},
+    {"id": "features", "name": "ImplementationAgent", "instructions": "Implement milestone 2: Features Grid from plan.md.", "depends_on": ["hero"]},
+    {"id": "review", "name": "ReviewerAgent", "instructions": "Review the implementation against plan.md.", "depends_on": ["hero", "features"]}
+  ]
+}
+</delegate_plan>
+
+The results are returned in a <delegate_plan_result> tag as a JSON object mapping each task id to its \
+result or error. If you resubmit an identical plan after a failure, completed tasks are not run again.
 """
 
 class SupervisorAgent(BaseAgent):
     """A specialized agent for supervising webpage implementation."""
+    functions = ("saveImage",)
+    stop_after_tags = ACTION_TAGS
     
     def __init__(
         self,
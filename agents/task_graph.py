@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Tuple
+
+# Receives the task's output tokens as they are produced
+Emit = Callable[[str], Awaitable[None]]
+
+# Runs a task: called with an Emit function, returns the task's result
+TaskRunner = Callable[[Emit], Awaitable[str]]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+class TaskGraphError(Exception):
+    """Raised for graphs that can't run: unknown dependencies or cycles"""
+    pass
+
+@dataclass(slots=True, eq=False)
+class Task:
+    id: str
+    run: TaskRunner
+    depends_on: Tuple[str, ...] = ()
+    retries: int = 0
+    timeout: float | None = None
+    state: str = PENDING
+    attempts: int = 0
+    result: str | None = None
+    error: str | None = None
+
+class TaskGraph:
+    """Runs tasks in dependency order, running every ready task concurrently.
+
+    A task that still fails after its retries is marked failed and the tasks
+    depending on it are skipped; independent tasks keep running. With a
+    state_path, task states and results are saved after every change, and a
+    graph created with the same path resumes: tasks already done aren't run again.
+    """
+
+    def __init__(self, max_concurrency: int = 4, state_path: str = None):
+        """Initialize an empty graph.
+
+        Args:
+            max_concurrency: Maximum number of tasks running at once
+            state_path: JSON file to save progress to and resume from
+        """
+        self.max_concurrency = max_concurrency
+        self.state_path = state_path
+        self.tasks: Dict[str, Task] = {}
+        self._saved = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path) as f:
+                    self._saved = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Failed to load task state {state_path}: {str(e)}")
+
+    def add(
+        self,
+        task_id: str,
+        run: TaskRunner,
+        depends_on: Tuple[str, ...] = (),
+        retries: int = 0,
+        timeout: float = None
+    ) -> Task:
+        """Add a task.
+
+        Args:
+            task_id: Unique task name
+            run: Async function taking an emit function and returning the result
+            depends_on: IDs of tasks that must be done before this one starts
+            retries: Extra attempts after a failure or timeout
+            timeout: Seconds per attempt, or None for no limit
+        """
+        if task_id in self.tasks:
+            raise TaskGraphError(f"Duplicate task id '{task_id}'")
+        task = Task(task_id, run, tuple(depends_on), retries, timeout)
+        saved = self._saved.get(task_id)
+        if saved and saved.get("state") == DONE:
+            task.state, task.result, task.attempts = DONE, saved.get("result"), saved.get("attempts", 1)
+        self.tasks[task_id] = task
+        return task
+
+    def results(self) -> Dict[str, str]:
+        """Return each task's result, or its error for tasks that didn't complete."""
+        return {
+            task.id: task.result if task.state == DONE else f"ERROR: {task.error or task.state}"
+            for task in self.tasks.values()
+        }
+
+    def state(self) -> dict:
+        """Return the serializable state of every task."""
+        return {
+            task.id: {"state": task.state, "attempts": task.attempts, "result": task.result, "error": task.error}
+            for task in self.tasks.values()
+        }
+
+    async def run(self) -> Dict[str, str]:
+        """Run the graph to completion, discarding emitted tokens."""
+        async for _ in self.stream():
+            pass
+        return self.results()
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        """Run the graph, yielding the tokens tasks emit as they arrive."""
+        self._validate()
+        queue = asyncio.Queue()
+        scheduler = asyncio.create_task(self._schedule(queue.put))
+        scheduler.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (token := await queue.get()) is not None:
+                yield token
+            await scheduler
+        finally:
+            if not scheduler.done():
+                scheduler.cancel()
+                try:
+                    await scheduler
+                except asyncio.CancelledError:
+                    pass
+
+    def _validate(self):
+        for task in self.tasks.values():
+            for dependency in task.depends_on:
+                if dependency not in self.tasks:
+                    raise TaskGraphError(f"Task '{task.id}' depends on unknown task '{dependency}'")
+
+        # Kahn's algorithm: every task must be reachable without passing through a cycle
+        remaining = {task.id: len(task.depends_on) for task in self.tasks.values()}
+        ready = [task_id for task_id, count in remaining.items() if count == 0]
+        while ready:
+            task_id = ready.pop()
+            for task in self.tasks.values():
+                if task_id in task.depends_on:
+                    remaining[task.id] -= 1
+                    if remaining[task.id] == 0:
+                        ready.append(task.id)
+            del remaining[task_id]
+        if remaining:
+            raise TaskGraphError(f"Dependency cycle between tasks: {', '.join(sorted(remaining))}")
+
+    def _ready_tasks(self) -> list:
+        """Pending tasks whose dependencies are done; skips those with a failed dependency."""
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for task in self.tasks.values():
+                if task.state != PENDING:
+                    continue
+                states = [self.tasks[dependency].state for dependency in task.depends_on]
+                if any(state in (FAILED, SKIPPED) for state in states):
+                    task.state = SKIPPED
+                    task.error = "a dependency failed"
+                    changed = True
+                elif all(state == DONE for state in states) and task not in ready:
+                    ready.append(task)
+        return ready
+
+    async def _schedule(self, emit: Emit):
+        running: Dict[asyncio.Task, Task] = {}
+        try:
+            while True:
+                for task in self._ready_tasks():
+                    if len(running) >= self.max_concurrency:
+                        break
+                    task.state = RUNNING
+                    task.attempts += 1
+                    running[asyncio.create_task(asyncio.wait_for(task.run(emit), task.timeout))] = task
+                self._save()
+                if not running:
+                    return
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        task.state, task.result, task.error = DONE, future.result(), None
+                        continue
+                    task.error = "timed out" if isinstance(error, asyncio.TimeoutError) else f"{type(error).__name__}: {error}"
+                    if task.attempts <= task.retries:
+                        print(f"[TASK DEBUG] {task.id} failed ({task.error}), retrying")
+                        task.state = PENDING
+                    else:
+                        print(f"[TASK DEBUG] {task.id} failed ({task.error})")
+                        task.state = FAILED
+        finally:
+            for future in running:
+                future.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            for task in running.values():
+                task.state = PENDING
+            self._save()
+
+    def _save(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state(), f)
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,356 @@
+"""
+Helpers for declaring how agent functions may be invoked.
+"""
+import inspect
+import json
+import typing
+
+from .json_stream import IncrementalJSONParser, JSONStreamError
+
+def side_effecting(func):
+    """Mark an agent function as having side effects.
+
+    Side-effecting functions are never dispatched speculatively while the model
+    is still streaming; they only run once the full response has been received.
+    """
+    func.side_effecting = True
+    return func
+
+def is_side_effecting(func) -> bool:
+    """Return True if the function (or bound method) was marked with @side_effecting."""
+    return getattr(func, "side_effecting", False)
+
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+def _parse_docstring(doc: str) -> tuple[str, dict]:
+    """Split a Google-style docstring into its summary and Args descriptions."""
+    summary_lines, arg_descriptions = [], {}
+    section, current_arg = None, None
+    for line in inspect.cleandoc(doc or "").splitlines():
+        stripped = line.strip()
+        if stripped in ("Args:", "Returns:", "Raises:", "Yields:"):
+            section = stripped
+            continue
+        if section is None:
+            if not stripped and summary_lines:
+                section = "Description"
+            elif stripped:
+                summary_lines.append(stripped)
+        elif section == "Args:" and stripped:
+            name, sep, description = stripped.partition(":")
+            if sep and " " not in name:
+                current_arg = name
+                arg_descriptions[name] = description.strip()
+            elif current_arg:
+                arg_descriptions[current_arg] += " " + stripped
+    return " ".join(summary_lines), arg_descriptions
+
+def build_tool_schema(func) -> dict:
+    """Build an OpenAI-style tool schema from a function's signature and docstring.
+
+    Args:
+        func: The function or bound method to describe
+
+    Returns:
+        A {"type": "function", "function": {...}} dict accepted by litellm's tools parameter
+    """
+    description, arg_descriptions = _parse_docstring(func.__doc__)
+    properties, required = {}, []
+    for name, param in inspect.signature(func).parameters.items():
+        if name == "self" or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        annotation = typing.get_origin(param.annotation) or param.annotation
+        properties[name] = {"type": _JSON_TYPES.get(annotation, "string")}
+        if annotation is list:
+            item_types = typing.get_args(param.annotation)
+            properties[name]["items"] = {"type": _JSON_TYPES.get(item_types[0] if item_types else str, "string")}
+        if name in arg_descriptions:
+            properties[name]["description"] = arg_descriptions[name]
+        if param.default is param.empty:
+            required.append(name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": required,
+            },
+        },
+    }
+
+class ToolCallAssembler:
+    """Turns streamed native tool-call deltas into <function_call> tag text.
+
+    The text has the same shape as an XML protocol call, so it goes through
+    the normal tag parser and function dispatch.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._has_arguments = False
+
+    def feed(self, tool_call_deltas) -> str:
+        """Return the tag text for a chunk's tool-call deltas."""
+        text = ""
+        for delta in tool_call_deltas:
+            function = delta.function
+            if delta.index != self._index:
+                text += self.close()
+                self._index = delta.index
+                text += f'<function_call>{{"name": {json.dumps(function.name)}, "arguments": '
+            if function.arguments:
+                self._has_arguments = True
+                text += function.arguments
+        return text
+
+    def close(self) -> str:
+        """Return the text that closes the open call, if any."""
+        if self._index is None:
+            return ""
+        text = ("" if self._has_arguments else "{}") + "}</function_call>"
+        self._index = None
+        self._has_arguments = False
+        return text
+
+def _coerce_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError("expected string")
+
+def _coerce_int(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    raise ValueError("expected integer")
+
+def _coerce_float(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise ValueError("expected number")
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ValueError("expected boolean")
+
+def _coerce_dict(value):
+    if isinstance(value, dict):
+        return value
+    raise ValueError("expected object")
+
+_COERCERS = {
+    str: _coerce_str,
+    int: _coerce_int,
+    float: _coerce_float,
+    bool: _coerce_bool,
+    dict: _coerce_dict,
+}
+
+def _compile_coercer(annotation):
+    """Build the coercer for a parameter annotation. Unannotated parameters accept anything."""
+    origin = typing.get_origin(annotation) or annotation
+    if origin is list:
+        item_types = typing.get_args(annotation)
+        coerce_item = _COERCERS.get(item_types[0], lambda value: value) if item_types else (lambda value: value)
+
+        def coerce_list(value):
+            # Models often pass a single item where a list is expected
+            items = value if isinstance(value, list) else [value]
+            return [coerce_item(item) for item in items]
+        return coerce_list
+    return _COERCERS.get(origin, lambda value: value)
+
+class FunctionSpec:
+    """A function the model may call, with its argument coercers compiled once."""
+
+    __slots__ = ("name", "func", "side_effecting", "_coercers", "_required")
+
+    def __init__(self, name: str, func):
+        """Compile the spec from the function's signature.
+
+        Args:
+            name: Name the model calls the function by
+            func: The unbound method
+        """
+        self.name = name
+        self.func = func
+        self.side_effecting = is_side_effecting(func)
+        self._coercers = {}
+        self._required = []
+        for param_name, param in inspect.signature(func).parameters.items():
+            if param_name == "self" or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            self._coercers[param_name] = _compile_coercer(param.annotation)
+            if param.default is param.empty:
+                self._required.append(param_name)
+
+    def accepts(self, arg_name: str) -> bool:
+        return arg_name in self._coercers
+
+    def check_arg(self, arg_name: str, value) -> str | None:
+        """Return the problem with a single argument value, or None if it's valid."""
+        coerce = self._coercers.get(arg_name)
+        if coerce is None:
+            return "unexpected argument"
+        try:
+            coerce(value)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def missing(self, arguments: dict) -> list:
+        """Required arguments the call leaves out."""
+        return [arg_name for arg_name in self._required if arg_name not in arguments]
+
+    def bind(self, arguments) -> tuple[dict, list]:
+        """Validate and coerce call arguments.
+
+        Args:
+            arguments: The "arguments" object from the model's function call
+
+        Returns:
+            (keyword arguments, problems), where problems is a list of
+            {"arg": name, "problem": description} dicts and empty if the call is valid
+        """
+        if not isinstance(arguments, dict):
+            return {}, [{"arg": "arguments", "problem": "expected object"}]
+
+        kwargs, problems = {}, []
+        for arg_name, value in arguments.items():
+            coerce = self._coercers.get(arg_name)
+            if coerce is None:
+                problems.append({"arg": arg_name, "problem": "unexpected argument"})
+                continue
+            try:
+                kwargs[arg_name] = coerce(value)
+            except ValueError as e:
+                problems.append({"arg": arg_name, "problem": str(e)})
+        for arg_name in self.missing(arguments):
+            problems.append({"arg": arg_name, "problem": "missing"})
+        return kwargs, problems
+
+def build_dispatch_table(cls) -> dict:
+    """Compile the FunctionSpecs for the methods an agent class lists in `functions`."""
+    table = {}
+    for name in cls.functions:
+        func = getattr(cls, name, None)
+        if not callable(func):
+            raise TypeError(f"{cls.__name__}.functions lists '{name}', which is not a method")
+        table[name] = FunctionSpec(name, func)
+    return table
+
+def function_error(error: str, function_name, **details) -> str:
+    """Format a dispatch error as compact JSON for the model."""
+    return "Error: " + json.dumps({"error": error, "function": function_name, **details}, separators=(",", ":"))
+
+class StreamingCallParser:
+    """Parses a <function_call> tag as it streams and validates it against a dispatch table.
+
+    The call is rejected as soon as it can no longer be valid: malformed JSON,
+    a value other than an object, an unknown function name, or an argument the function doesn't take or
+    whose value has the wrong type. Missing arguments are known once the
+    arguments object is complete, if the function's name came before it.
+    """
+
+    OPEN_TAG = "<function_call>"
+    CLOSE_TAG = "</function_call>"
+    NOT_AN_OBJECT = 'the call must be a JSON object with "name" and "arguments"'
+
+    def __init__(self, dispatch_table: dict):
+        self._table = dispatch_table
+        self._parser = IncrementalJSONParser(on_key=self._on_key, on_member=self._on_member)
+        self._opening = ""
+        self._started = False
+        self._trailing = ""
+        self.spec = None
+        self.name = None
+        self.error = None
+
+    def feed(self, text: str) -> bool:
+        """Parse the next chunk of the tag. Returns False once the call is rejected (see error)."""
+        if self.error is not None:
+            return False
+        if len(self._opening) < len(self.OPEN_TAG):
+            # The tag stream starts with the opening tag itself
+            skip = min(len(self.OPEN_TAG) - len(self._opening), len(text))
+            self._opening += text[:skip]
+            text = text[skip:]
+        if not self._started and text.strip():
+            self._started = True
+            if text.lstrip()[0] != "{":
+                self.error = function_error("invalid_json", None, problem=self.NOT_AN_OBJECT)
+                return False
+        try:
+            if not self._parser.done:
+                text = text[self._parser.feed(text):]
+        except JSONStreamError as e:
+            self.error = self.error or function_error("invalid_json", self.name, problem=e.message, position=e.position)
+            return False
+        if text:
+            self._trailing += text
+            if not self.CLOSE_TAG.startswith(self._trailing.lstrip()):
+                self.error = function_error("invalid_json", self.name, problem="unexpected text after the call's JSON object")
+                return False
+        return self.error is None
+
+    def close(self) -> dict | None:
+        """Return the parsed call, or None if it was rejected or is incomplete (see error)."""
+        if self.error is None:
+            try:
+                call = self._parser.close()
+            except JSONStreamError as e:
+                self.error = function_error("invalid_json", self.name, problem=e.message, position=e.position)
+                return None
+            if isinstance(call, dict):
+                return call
+            self.error = function_error("invalid_json", None, problem=self.NOT_AN_OBJECT)
+        return None
+
+    def _on_key(self, path: tuple, key: str):
+        if path == ("arguments",) and self.spec is not None and not self.spec.accepts(key):
+            self._reject(function_error("invalid_arguments", self.name, problems=[{"arg": key, "problem": "unexpected argument"}]))
+
+    def _on_member(self, path: tuple, key: str, value):
+        if path == () and key == "name":
+            self.name = value
+            self.spec = self._table.get(value) if isinstance(value, str) else None
+            if self.spec is None:
+                self._reject(function_error("unknown_function", value, available=list(self._table)))
+        elif path == () and key == "arguments":
+            if not isinstance(value, dict):
+                self._reject(function_error("invalid_arguments", self.name, problems=[{"arg": "arguments", "problem": "expected object"}]))
+            elif self.spec is not None and (missing := self.spec.missing(value)):
+                self._reject(function_error("invalid_arguments", self.name, problems=[
+                    {"arg": arg_name, "problem": "missing"} for arg_name in missing
+                ]))
+        elif path == ("arguments",) and self.spec is not None:
+            if problem := self.spec.check_arg(key, value):
+                self._reject(function_error("invalid_arguments", self.name, problems=[{"arg": key, "problem": problem}]))
+
+    def _reject(self, error: str):
+        self.error = error
+        # Stops the parser; feed() keeps the more specific error
+        raise JSONStreamError(error)
@@ -0,0 +1,393 @@
+"""
+Traces of agent runs, recorded in memory and exported in batches off the request path.
+
+A trace covers one run (e.g. one user message). Its spans are the model turns,
+function calls and delegations of every agent in the run. Recording a span
+only appends to the trace. When the trace finishes, the sampler decides
+whether to keep it, and kept traces go on a bounded queue. A background thread
+takes them off the queue in batches and writes them to the sinks: a JSON lines
+file, which needs no network, or LangSmith. When the queue is full, traces are
+dropped rather than slowing the run, and sink failures are counted, never raised.
+"""
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import List
+
+# Span kinds, named as LangSmith run types
+CHAIN = "chain"
+LLM = "llm"
+TOOL = "tool"
+
+# Longest string kept in span inputs and outputs
+MAX_TEXT = 20000
+# Longest text kept per message in the summary of a model turn's messages
+MAX_MESSAGE_TEXT = 2000
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Span:
+    __slots__ = ("index", "parent", "name", "kind", "start", "end", "inputs", "outputs", "error", "metadata")
+
+    def __init__(self, index: int, parent: int | None, name: str, kind: str, inputs, metadata):
+        self.index = index
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.end = None
+        self.inputs = inputs
+        self.outputs = None
+        self.error = None
+        self.metadata = metadata
+
+class Trace:
+    """The spans of one run. Spans are recorded only if the trace may be kept."""
+
+    def __init__(self, tracer: "Tracer", name: str, inputs: dict = None, sampled: bool = True):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4()
+        # Kept by the head sample; otherwise only a tail rule (slow, errored) keeps it
+        self.sampled = sampled
+        self.recording = sampled or tracer.sampler.has_tail_rules
+        self.error = False
+        self.kept_by = None
+        self.root = Span(0, None, name, CHAIN, inputs or {}, None)
+        self.spans = [self.root]
+
+    def start_span(self, name: str, kind: str, parent: Span = None, inputs: dict = None, metadata: dict = None) -> Span | None:
+        """Start a span below parent (the root by default). Returns None when the trace isn't recording."""
+        if not self.recording:
+            return None
+        started = time.perf_counter()
+        span = Span(len(self.spans), (parent or self.root).index, name, kind, inputs, metadata)
+        self.spans.append(span)
+        self.tracer.overhead_seconds += time.perf_counter() - started
+        return span
+
+    def end_span(self, span: Span | None, outputs: dict = None, error: str = None, metadata: dict = None) -> None:
+        if span is None:
+            return
+        started = time.perf_counter()
+        span.end = time.time()
+        span.outputs = outputs
+        if error is not None:
+            span.error = error
+            self.error = True
+        if metadata:
+            span.metadata = {**(span.metadata or {}), **metadata}
+        self.tracer.overhead_seconds += time.perf_counter() - started
+
+    @property
+    def duration(self) -> float:
+        return (self.root.end or time.time()) - self.root.start
+
+    def as_dict(self) -> dict:
+        """The trace as JSON-ready data. Called by the exporter thread, after the trace finished."""
+        return {
+            "trace_id": str(self.trace_id),
+            "name": self.root.name,
+            "start": self.root.start,
+            "duration": self.duration,
+            "error": self.error,
+            "kept_by": self.kept_by,
+            "spans": [
+                {
+                    "id": span.index,
+                    "parent": span.parent,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start": span.start,
+                    "end": span.end,
+                    "inputs": _scrub(span.inputs),
+                    "outputs": _scrub(span.outputs),
+                    "error": span.error,
+                    "metadata": _scrub(span.metadata),
+                }
+                for span in self.spans
+            ],
+        }
+
+def summarize_messages(messages: list) -> list:
+    """Summarize request messages for a span: role, truncated text and image hashes.
+
+    Spans are held in memory until their trace is exported, so they must not
+    keep references to the history's (possibly very large) contents.
+    """
+    summary = []
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        text = "".join(part.get("text", "") for part in parts if part.get("type") == "text")
+        entry = {"role": message.get("role"), "text": text if len(text) <= MAX_MESSAGE_TEXT else text[:MAX_MESSAGE_TEXT] + f"...({len(text)} chars)"}
+        images = [
+            hashlib.sha256(part.get("image_url", {}).get("url", "").encode("utf-8")).hexdigest()[:16]
+            for part in parts if part.get("type") == "image_url"
+        ]
+        if images:
+            entry["images"] = images
+        summary.append(entry)
+    return summary
+
+def _scrub(value):
+    """Copy value for export, with inline images and very long strings shortened."""
+    if isinstance(value, str):
+        if value.startswith("data:") and ";base64," in value:
+            return f"{value[:value.index(';base64,')]};base64,...({len(value)} chars)"
+        return value if len(value) <= MAX_TEXT else value[:MAX_TEXT] + f"...({len(value)} chars)"
+    if isinstance(value, dict):
+        return {str(key): _scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+class TraceSampler:
+    """Head sampling when a trace starts, plus tail rules applied when it finishes.
+
+    A trace is kept if it was in the head sample (head_rate of traces), or if
+    it errored (keep_errors) or took at least slow_seconds. With tail rules,
+    every trace is recorded so the rules can keep it; without them, traces
+    outside the head sample record nothing.
+    """
+
+    def __init__(self, head_rate: float = 1.0, slow_seconds: float | None = None, keep_errors: bool = True):
+        self.head_rate = head_rate
+        self.slow_seconds = slow_seconds
+        self.keep_errors = keep_errors
+
+    @property
+    def has_tail_rules(self) -> bool:
+        return self.keep_errors or self.slow_seconds is not None
+
+    def head(self) -> bool:
+        return self.head_rate >= 1 or random.random() < self.head_rate
+
+    def keep(self, trace: Trace) -> str | None:
+        """Why the finished trace is kept ("error", "slow" or "head"), or None to drop it."""
+        if self.keep_errors and trace.error:
+            return "error"
+        if self.slow_seconds is not None and trace.duration >= self.slow_seconds:
+            return "slow"
+        if trace.sampled:
+            return "head"
+        return None
+
+class FileTraceSink:
+    """Appends traces to a JSON lines file, one trace per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, traces: List[dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for trace in traces:
+                f.write(json.dumps(trace) + "\n")
+
+class LangSmithTraceSink:
+    """Sends traces to LangSmith as runs, one batch request per batch of traces."""
+
+    def __init__(self, project: str = None):
+        self.project = project
+        self._client = None
+
+    def write(self, traces: List[dict]) -> None:
+        if self._client is None:
+            from langsmith import Client
+            self._client = Client()
+        runs = []
+        for trace in traces:
+            trace_id = uuid.UUID(trace["trace_id"])
+            ids, orders = {}, {}
+            # Parents come before their children, so each span's parent order is known
+            for span in trace["spans"]:
+                run_id = trace_id if span["id"] == 0 else uuid.uuid5(trace_id, str(span["id"]))
+                ids[span["id"]] = run_id
+                start = _utc(span["start"])
+                order = start.strftime("%Y%m%dT%H%M%S%fZ") + str(run_id)
+                if span["parent"] is not None:
+                    order = orders[span["parent"]] + "." + order
+                orders[span["id"]] = order
+                runs.append({
+                    "id": run_id,
+                    "trace_id": trace_id,
+                    "parent_run_id": ids.get(span["parent"]),
+                    "dotted_order": order,
+                    "name": span["name"],
+                    "run_type": span["kind"],
+                    "start_time": start,
+                    "end_time": _utc(span["end"] or trace["start"] + trace["duration"]),
+                    "inputs": span["inputs"] or {},
+                    "outputs": span["outputs"] or {},
+                    "error": span["error"],
+                    "extra": {"metadata": {**(span["metadata"] or {}), "kept_by": trace["kept_by"]}},
+                    "session_name": self.project,
+                })
+        self._client.batch_ingest_runs(create=runs, pre_sampled=True)
+
+def _utc(timestamp: float):
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+class TraceExporter:
+    """Writes finished traces to sinks from a background thread, in batches.
+
+    Traces wait on a queue of at most max_queue traces; when it's full, new
+    traces are dropped. A batch is written once batch_size traces are waiting,
+    or flush_interval seconds after its first trace arrived.
+    """
+
+    def __init__(self, sinks: list, max_queue: int = 1000, batch_size: int = 50, flush_interval: float = 5.0):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.dropped = 0
+        self.exported = 0
+        self.batches = 0
+        self.export_errors = 0
+        self.export_seconds = 0.0
+
+    def submit(self, trace: Trace) -> bool:
+        """Queue a finished trace for export without waiting. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        if self._thread is None:
+            self._start()
+        return True
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    trace = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if trace is None:
+                    stopping = True
+                    break
+                batch.append(trace)
+            self._export(batch)
+            if stopping:
+                return
+
+    def _export(self, batch: list) -> None:
+        started = time.perf_counter()
+        records = [trace.as_dict() for trace in batch]
+        for sink in self.sinks:
+            try:
+                sink.write(records)
+            except Exception as e:
+                self.export_errors += 1
+                print(f"[TRACE DEBUG] {type(sink).__name__} failed to write {len(records)} traces: {e}")
+        self.exported += len(records)
+        self.batches += 1
+        self.export_seconds += time.perf_counter() - started
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write the traces still queued and stop the thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+class Tracer:
+    """Starts traces, samples them when they finish and hands kept ones to the exporter.
+
+    Usage:
+        async with tracer.trace("on_message", {"content": text}):
+            await ...  # agents started here record their spans in the trace
+    """
+
+    def __init__(self, exporter: TraceExporter, sampler: TraceSampler = None):
+        self.exporter = exporter
+        self.sampler = sampler or TraceSampler()
+        self.traces = 0
+        self.sampled_out = 0
+        self.kept_by = {"head": 0, "error": 0, "slow": 0}
+        # Time spent recording, sampling and queueing traces in the run itself
+        self.overhead_seconds = 0.0
+
+    @staticmethod
+    def current() -> Trace | None:
+        """The trace of the running task, if one was started with trace()."""
+        return _current_trace.get()
+
+    def start(self, name: str, inputs: dict = None) -> Trace:
+        started = time.perf_counter()
+        trace = Trace(self, name, inputs, sampled=self.sampler.head())
+        self.traces += 1
+        self.overhead_seconds += time.perf_counter() - started
+        return trace
+
+    def finish(self, trace: Trace, outputs: dict = None, error: str = None) -> None:
+        trace.end_span(trace.root, outputs, error)
+        started = time.perf_counter()
+        trace.kept_by = self.sampler.keep(trace)
+        if trace.kept_by is None:
+            self.sampled_out += 1
+        else:
+            self.kept_by[trace.kept_by] += 1
+            self.exporter.submit(trace)
+        self.overhead_seconds += time.perf_counter() - started
+
+    @contextlib.asynccontextmanager
+    async def trace(self, name: str, inputs: dict = None):
+        """Run the body as a trace, which is the current trace for the tasks it starts."""
+        trace = self.start(name, inputs)
+        token = _current_trace.set(trace)
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            _current_trace.reset(token)
+            self.finish(trace, error=error)
+
+    def stats(self) -> dict:
+        """Counts of traces kept, sampled out, dropped and exported, and the time tracing took."""
+        exporter = self.exporter
+        return {
+            "traces": self.traces,
+            "kept_by": dict(self.kept_by),
+            "sampled_out": self.sampled_out,
+            "queued": exporter.queued,
+            "dropped": exporter.dropped,
+            "exported": exporter.exported,
+            "batches": exporter.batches,
+            "export_errors": exporter.export_errors,
+            "overhead_ms": round(self.overhead_seconds * 1000, 3),
+            "overhead_ms_per_trace": round(self.overhead_seconds * 1000 / self.traces, 3) if self.traces else 0.0,
+            "export_ms": round(exporter.export_seconds * 1000, 3),
+        }
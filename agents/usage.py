@@ -0,0 +1,159 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+import litellm
+
+from .messages import Message
+
+# Rough prompt cost of an inline image; litellm would decode every image to count it
+IMAGE_TOKENS = 1600
+# Role and separator tokens added to each message
+MESSAGE_OVERHEAD = 4
+
+# Token counts by (model, digest of the text). Keyed by digest so the cache
+# doesn't keep the histories' texts (artifacts, long responses) alive.
+TOKEN_COUNT_CACHE_SIZE = 4096
+_TOKEN_COUNTS: "OrderedDict[tuple[str, bytes], int]" = OrderedDict()
+_TOKEN_COUNTS_LOCK = threading.Lock()
+
+def count_text_tokens(model: str, text: str) -> int:
+    """Tokens in text for the model's tokenizer, cached since histories are recounted every turn."""
+    if not text:
+        return 0
+    key = (model, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+    with _TOKEN_COUNTS_LOCK:
+        count = _TOKEN_COUNTS.get(key)
+        if count is not None:
+            _TOKEN_COUNTS.move_to_end(key)
+            return count
+    try:
+        count = litellm.token_counter(model=model, text=text)
+    except Exception:
+        # Roughly four characters per token for models without a known tokenizer
+        count = len(text) // 4
+    with _TOKEN_COUNTS_LOCK:
+        _TOKEN_COUNTS[key] = count
+        if len(_TOKEN_COUNTS) > TOKEN_COUNT_CACHE_SIZE:
+            _TOKEN_COUNTS.popitem(last=False)
+    return count
+
+def count_message_tokens(model: str, messages: list) -> int:
+    """Estimate the prompt tokens of Message objects or litellm message dicts."""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD
+        if isinstance(message, Message):
+            total += count_text_tokens(model, message.text) + message.image_count * IMAGE_TOKENS
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            total += count_text_tokens(model, content)
+        elif content:
+            for part in content:
+                if part.get("type") == "text":
+                    total += count_text_tokens(model, part["text"])
+                elif part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+    return total
+
+def measure_turn(model: str, messages: list, completion_text: str, reported=None) -> tuple[int, int, bool]:
+    """Return (prompt tokens, completion tokens, estimated) for a model turn.
+
+    Uses the usage the provider reported on the stream when there is one, and
+    the cached tokenizer otherwise.
+    """
+    prompt_tokens = getattr(reported, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(reported, "completion_tokens", 0) or 0
+    if prompt_tokens:
+        return prompt_tokens, completion_tokens, False
+    return count_message_tokens(model, messages), count_text_tokens(model, completion_text), True
+
+class UsageMeter:
+    """Token usage of the model turns of a run, in total and per agent class."""
+
+    def __init__(self):
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_turns = 0
+        self.by_agent: Dict[str, Dict[str, int]] = {}
+        # Output after the action tag that ends a turn (function call or delegation)
+        self.action_turns = 0
+        self.stopped_turns = 0
+        self.dropped_tokens = 0
+        self.trailing_tokens = 0
+        self.trailing_seconds = 0.0
+
+    def record(self, agent_name: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        """Record one model turn.
+
+        Args:
+            agent_name: Agent class that made the request
+            prompt_tokens: Prompt tokens of the request
+            completion_tokens: Tokens of the response
+            estimated: The counts were estimated locally rather than reported by the provider
+        """
+        self.turns += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        if estimated:
+            self.estimated_turns += 1
+        agent = self.by_agent.setdefault(agent_name, {"turns": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        agent["turns"] += 1
+        agent["prompt_tokens"] += prompt_tokens
+        agent["completion_tokens"] += completion_tokens
+
+    def record_action_tail(self, tail_tokens: int, seconds: float, stopped: bool):
+        """Record what a model turn produced after its action tag closed.
+
+        Args:
+            tail_tokens: Tokens after the tag: the output dropped from a stopped
+                turn, or the trailing output of a turn that ran to its end
+            seconds: Time from the tag closing to the end of the turn
+            stopped: The turn was stopped at the tag
+        """
+        self.action_turns += 1
+        if stopped:
+            self.stopped_turns += 1
+            self.dropped_tokens += tail_tokens
+        else:
+            self.trailing_tokens += tail_tokens
+            self.trailing_seconds += seconds
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def early_stop_savings(self) -> dict:
+        """Output saved by stopping turns at their action tag.
+
+        Savings are estimated from the trailing output of the action turns that
+        weren't stopped, so they are None until there are some.
+        """
+        unstopped = self.action_turns - self.stopped_turns
+        tokens_saved = seconds_saved = None
+        if unstopped:
+            tokens_saved = max(0, round(self.stopped_turns * self.trailing_tokens / unstopped) - self.dropped_tokens)
+            seconds_saved = round(self.stopped_turns * self.trailing_seconds / unstopped, 3)
+        return {
+            "action_turns": self.action_turns,
+            "stopped_turns": self.stopped_turns,
+            "dropped_tokens": self.dropped_tokens,
+            "trailing_tokens": self.trailing_tokens,
+            "trailing_seconds": round(self.trailing_seconds, 3),
+            "estimated_tokens_saved": tokens_saved,
+            "estimated_seconds_saved": seconds_saved,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "estimated_turns": self.estimated_turns,
+            "by_agent": self.by_agent,
+            "early_stop": self.early_stop_savings(),
+        }
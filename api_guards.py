@@ -0,0 +1,332 @@
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. The clock
+    and sleep functions can be swapped for fakes.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """Initialize the bucket, starting full.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (the allowed burst size)
+            clock: Returns the current time in seconds
+            sleep: Blocks for the given number of seconds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds to wait before retrying
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, max_wait: float | None = None) -> float | None:
+        """Block until tokens are available and take them.
+
+        Args:
+            tokens: Number of tokens to take
+            max_wait: Give up instead of waiting longer than this many seconds
+
+        Returns:
+            Total seconds spent waiting, or None if it gave up
+        """
+        waited = 0
+        while (delay := self.try_acquire(tokens)) > 0:
+            if max_wait is not None and waited + delay > max_wait:
+                return None
+            self._sleep(delay)
+            waited += delay
+        return waited
+
+    def available(self) -> float:
+        """Return the number of tokens currently available."""
+        with self._lock:
+            elapsed = self._clock() - self._updated
+            return min(self.capacity, self._tokens + elapsed * self.rate)
+
+class APIError(Exception):
+    """Raised when an upstream API returns an error response"""
+    def __init__(self, status_code: int, reason: str):
+        super().__init__(f"{status_code} - {reason}")
+        self.status_code = status_code
+        self.reason = reason
+
+class GuardRejectedError(Exception):
+    """Raised instead of calling an upstream that is known to be unavailable"""
+    def __init__(self, upstream: str, message: str, retry_after: float):
+        super().__init__(f"{upstream} {message}, retry after {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class CircuitOpenError(GuardRejectedError):
+    pass
+
+class RateLimitedError(GuardRejectedError):
+    pass
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. After that a single trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Initialize the breaker in the closed state.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to stay open before allowing a trial call
+            clock: Returns the current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> float:
+        """Check whether a call may go through.
+
+        Returns:
+            0 if the call is allowed, otherwise the seconds until the next trial call
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return 0
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return 0
+            return max(self._opened_at + self.reset_timeout - self._clock(), 0.001)
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot taken by a call that never ran."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Errors that say the upstream is unhealthy: network errors, timeouts, throttling and 5xx.
+    Client errors like 404 don't count against the breaker."""
+    if isinstance(error, APIError):
+        return error.status_code in (408, 429) or error.status_code >= 500
+    return not isinstance(error, GuardRejectedError)
+
+class ApiGuard:
+    """Rate limiter and circuit breaker for one upstream (or one function)."""
+
+    def __init__(self, name: str, limiter: TokenBucket, breaker: CircuitBreaker, max_wait: float = 5.0):
+        """Initialize the guard.
+
+        Args:
+            name: Name used in errors and metrics
+            limiter: Token bucket shared by all calls through this guard
+            breaker: Circuit breaker shared by all calls through this guard
+            max_wait: Longest a call may wait for the rate limiter before it's rejected
+        """
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_wait = max_wait
+        self.calls = 0
+        self.failures = 0
+        self.rejected_open = 0
+        self.rejected_rate_limited = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call func through the limiter and breaker.
+
+        Raises:
+            CircuitOpenError: The circuit is open
+            RateLimitedError: The call would have to wait longer than max_wait
+        """
+        if (retry_after := self.breaker.allow()) > 0:
+            self._count("rejected_open")
+            raise CircuitOpenError(self.name, "circuit is open", retry_after)
+
+        waited = self.limiter.acquire(max_wait=self.max_wait)
+        if waited is None:
+            self._count("rejected_rate_limited")
+            self.breaker.release_trial()
+            raise RateLimitedError(self.name, "rate limit exceeded", 1 / self.limiter.rate)
+
+        self._count("calls", wait_seconds=waited)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if is_upstream_failure(e):
+                self._count("failures")
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.breaker.state,
+                "times_opened": self.breaker.times_opened,
+                "tokens_available": round(self.limiter.available(), 2),
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected_open": self.rejected_open,
+                "rejected_rate_limited": self.rejected_rate_limited,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def _count(self, counter: str, wait_seconds: float = 0.0):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.wait_seconds += wait_seconds
+
+# Guards by name: one per upstream, plus any per-function overrides
+_GUARDS: Dict[str, ApiGuard] = {}
+
+# Name of the guard_scope function currently running, if any
+_SCOPE: ContextVar[str | None] = ContextVar("guard_scope", default=None)
+
+def configure_guard(
+    name: str,
+    rate: float,
+    capacity: float,
+    failure_threshold: int = 5,
+    reset_timeout: float = 30.0,
+    max_wait: float = 5.0,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep
+) -> ApiGuard:
+    """Create (or replace) the guard for an upstream or a single function.
+
+    A guard named after a function, e.g. configure_guard("get_showtimes", ...),
+    takes precedence over the upstream guard for the calls that function makes.
+    The function must be a @guarded fetcher or decorated with @guard_scope.
+
+    Args:
+        name: Upstream name (e.g. "tmdb") or function name
+        rate: Requests per second
+        capacity: Burst size
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open
+        max_wait: Longest a call may wait for the rate limiter
+        clock: Time source, replaceable with a fake for testing
+        sleep: Sleep function, replaceable with a fake for testing
+    """
+    guard = ApiGuard(
+        name,
+        TokenBucket(rate, capacity, clock=clock, sleep=sleep),
+        CircuitBreaker(failure_threshold, reset_timeout, clock=clock),
+        max_wait=max_wait
+    )
+    _GUARDS[name] = guard
+    return guard
+
+def guard_for(function_name: str, upstream: str) -> ApiGuard:
+    """Return the guard for a call to an upstream.
+
+    In order: the guard of the enclosing guard_scope function, the guard of the
+    called function, the upstream's guard.
+    """
+    scope = _SCOPE.get()
+    return _GUARDS.get(scope) or _GUARDS.get(function_name) or _GUARDS[upstream]
+
+def guarded(upstream: str):
+    """
+    Decorator to route calls through the rate limiter and circuit breaker for an upstream
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return guard_for(func.__name__, upstream).call(func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def guard_scope(func: Callable) -> Callable:
+    """
+    Decorator for tool functions that call @guarded fetchers: a guard configured
+    under the tool's name applies to the upstream calls it makes
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _SCOPE.set(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _SCOPE.reset(token)
+    return wrapper
+
+def guard_metrics() -> Dict[str, Dict[str, Any]]:
+    """Return limiter and breaker metrics for every configured guard."""
+    return {name: guard.metrics() for name, guard in _GUARDS.items()}
@@ -5,68 +5,176 @@ import litellm
 from agents.planning_agent import PlanningAgent
 from agents.implementation_agent import ImplementationAgent
 from agents.supervisor_agent import SupervisorAgent
+from agents.model_router import ModelRouter
+from agents.hedging import HedgePolicy
+from agents.response_cache import ResponseCache
+from agents.session_store import open_session_store
+from agents.messages import MessageList
+from agents.budget import TokenBudget
+from agents.event_bus import EventBus, AgentEvent, TOOL_RESULT, DELEGATION_START, DELEGATION_END
+from agents.tracing import Tracer, TraceExporter, TraceSampler, FileTraceSink, LangSmithTraceSink, summarize_messages
+from agents.artifact_patch import PATCH_STATS
+from agents.usage import UsageMeter
+from chainlit_ui import ChainlitUI, tag_display_from_env
+from server_stats import ServerStats
+from movie_prefetch import MoviePrefetcher
 
-from langsmith import traceable
-from typing import AsyncGenerator
 import base64
+import os
 
 load_dotenv(override=True)
 
-litellm.success_callback = ["langsmith"]
-
 # Available model configurations
 MODEL_OPENAI_GPT4 = "openai/gpt-4o"
 MODEL_ANTHROPIC_CLAUDE = "anthropic/claude-3-5-sonnet-latest"
 MODEL_FIREWORKS_QWEN = "fireworks/qwen1.5-72b-chat"
 
-async def on_tag_start(tag_name: str, stream: AsyncGenerator[str, None]):
-    # Create a parent message first
-    parent_message = cl.Message(content="")
-    await parent_message.send()
-    
-    # Create step with parent message ID
-    step = cl.Step(name=tag_name, parent_id=parent_message.id)
-    await step.send()
-    
-    content = ""
-    async for token in stream:
-        content += token
-        await step.stream_token(token)
-    
-    await step.update()
-    return step
+# Shared across sessions so the hedge budget and latency samples cover the whole worker
+HEDGE_POLICY = HedgePolicy(alternate_model=os.getenv("HEDGE_ALTERNATE_MODEL")) if os.getenv("HEDGE_LLM_REQUESTS") else None
 
-async def on_message_start(stream: AsyncGenerator[str, None]):
-    message = cl.Message(content="")
-    await message.send()
-    
-    content = ""
-    async for token in stream:
-        content += token
-        await message.stream_token(token)
-    
-    await message.update()
-    return message
+# Replays identical low-temperature agent turns (planning, implementation) from disk
+RESPONSE_CACHE = ResponseCache(os.getenv("RESPONSE_CACHE_DIR")) if os.getenv("RESPONSE_CACHE_DIR") else None
 
-@traceable
-@cl.on_chat_start
-def on_chat_start():
-    model_kwargs = {
-        "temperature": 0.1,
-        "max_tokens": 8192
+# Shared session state: every agent's history (appended after each turn, so
+# interrupted runs can resume) and each session's agent config and workspace.
+# A SQLite file (.db) can be shared by several workers; otherwise a directory.
+SESSION_STORE = open_session_store(os.getenv("SESSION_STORE")) if os.getenv("SESSION_STORE") else None
+
+# When set, each session gets its own artifacts workspace below this directory
+ARTIFACTS_ROOT = os.getenv("ARTIFACTS_ROOT")
+
+# Traces of each user message, sampled and exported in batches by a background
+# thread: to a JSON lines file, and to LangSmith when LangChain tracing is on
+TRACE_SINKS = []
+if os.getenv("TRACE_FILE"):
+    TRACE_SINKS.append(FileTraceSink(os.getenv("TRACE_FILE")))
+if os.getenv("LANGCHAIN_TRACING_V2", "").lower() == "true":
+    TRACE_SINKS.append(LangSmithTraceSink(os.getenv("LANGSMITH_PROJECT") or os.getenv("LANGCHAIN_PROJECT")))
+TRACER = Tracer(
+    TraceExporter(TRACE_SINKS),
+    TraceSampler(
+        head_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1")),
+        slow_seconds=float(os.getenv("TRACE_SLOW_SECONDS", "60"))
+    )
+) if TRACE_SINKS else None
+
+# Event loop lag, CPU and memory of this worker, sampled for benchmarks/load_test.py
+SERVER_STATS = ServerStats(os.getenv("SERVER_STATS_FILE")) if os.getenv("SERVER_STATS_FILE") else None
+
+# Per-tag display overrides for the chat UI (stream, collapse or hide)
+UI_TAG_DISPLAY = tag_display_from_env()
+
+def log_event(event: AgentEvent):
+    print(f"[{'/'.join(event.path)}] {event.kind} {event.tag or ''}: {event.text[:200]}")
+
+def new_session_config(thread_id: str) -> dict:
+    return {
+        "model": MODEL_ANTHROPIC_CLAUDE,
+        "model_kwargs": {
+            "temperature": 0.1,
+            "max_tokens": 8192
+        },
+        "artifacts_dir": os.path.join(ARTIFACTS_ROOT, thread_id) if ARTIFACTS_ROOT else "artifacts",
     }
 
+def create_supervisor(thread_id: str, config: dict) -> SupervisorAgent:
     agent = SupervisorAgent(
-        litellm_model=MODEL_ANTHROPIC_CLAUDE,
-        model_kwargs=model_kwargs
+        litellm_model=config["model"],
+        model_kwargs=config["model_kwargs"]
     )
-    cl.user_session.set("agent", agent)
+
+    # Route each turn to a model tier when a routing config is provided
+    if routing_config := os.getenv("MODEL_ROUTING_CONFIG"):
+        agent.router = ModelRouter.from_file(routing_config)
+    agent.hedging = HEDGE_POLICY
+    agent.response_cache = RESPONSE_CACHE
+    agent.checkpoints = SESSION_STORE
+    agent.checkpoint_path = thread_id
+    agent.tracer = TRACER
+    # One prefetcher per session, so its budget and hit rate cover the whole session
+    agent.prefetcher = MoviePrefetcher()
+    agent.artifacts_dir = config["artifacts_dir"]
+    # Token usage and early-stop savings of the session's turns, logged after each run
+    agent.usage = UsageMeter()
+
+    # Token and cost limits for the session, its agents and its delegations
+    if budget_config := os.getenv("BUDGET_CONFIG"):
+        agent.budget = TokenBudget.from_file(budget_config)
+
+    # Every agent of the session publishes its output here; delegated agents'
+    # tokens don't pass through their parents
+    agent.event_bus = EventBus()
+    agent.event_bus.subscribe(log_event, kinds=(TOOL_RESULT, DELEGATION_START, DELEGATION_END))
+
+    return agent
+
+def load_session(thread_id: str) -> tuple[SupervisorAgent, MessageList]:
+    """Return the session's agent and history, restoring them from the session store
+    when this worker hasn't served the session before."""
+    agent = cl.user_session.get("agent")
+    if agent is None:
+        config = SESSION_STORE.load_config(thread_id) if SESSION_STORE is not None else None
+        if config is None:
+            config = new_session_config(thread_id)
+            if SESSION_STORE is not None:
+                SESSION_STORE.save_config(thread_id, config)
+        agent = create_supervisor(thread_id, config)
+        cl.user_session.set("agent", agent)
+
+    message_history = cl.user_session.get("message_history") or MessageList()
+    if SESSION_STORE is not None:
+        # Another worker may have served this session since; fetch only the newer messages
+        message_history.extend(SESSION_STORE.load(thread_id, start=len(message_history)) or [])
+    cl.user_session.set("message_history", message_history)
+    return agent, message_history
+
+@cl.on_chat_start
+async def on_chat_start():
+    if SERVER_STATS is not None:
+        SERVER_STATS.start()
+    load_session(cl.context.session.thread_id)
+
+@cl.on_chat_resume
+async def on_chat_resume(thread):
+    agent, message_history = load_session(thread["id"])
+
+    # Finish a run that stopped mid-turn; a finished run returns without calling the model
+    if SESSION_STORE is not None and message_history:
+        await run_agent(agent, message_history)
+
+async def run_agent(agent: SupervisorAgent, message_history: list):
+    # The agents' output reaches the UI through the callbacks and the event bus
+    ui = ChainlitUI(UI_TAG_DISPLAY)
+    if TRACER is None:
+        await drain_agent(agent, message_history, ui)
+    else:
+        last = message_history[-1] if message_history else None
+        inputs = {"thread_id": cl.context.session.thread_id, "messages": summarize_messages([last] if last else [])}
+        async with TRACER.trace("on_message", inputs):
+            await drain_agent(agent, message_history, ui)
+        print(f"[TRACE DEBUG] {TRACER.stats()}")
+    if agent.router is not None:
+        print(f"[ROUTER DEBUG] Session stats: {agent.router.stats()}")
+    if agent.hedging is not None:
+        print(f"[HEDGE DEBUG] Worker stats: {agent.hedging.stats()}")
+    if agent.response_cache is not None:
+        print(f"[CACHE DEBUG] Response cache stats: {agent.response_cache.stats()}")
+    print(f"[PATCH DEBUG] Worker stats: {PATCH_STATS.as_dict()}")
+    print(f"[USAGE DEBUG] Session usage: {agent.usage.as_dict()}")
+
+    cl.user_session.set("message_history", message_history)
+
+async def drain_agent(agent: SupervisorAgent, message_history: list, ui: ChainlitUI):
+    async for _ in agent.react_to(
+        message_history,
+        on_tag_start=ui.on_tag_start,
+        on_message_start=ui.on_message_start
+    ):
+        pass
 
 @cl.on_message
-@traceable
 async def on_message(message: cl.Message):
-    message_history = cl.user_session.get("message_history", [])
-    agent = cl.user_session.get("agent")
+    agent, message_history = load_session(cl.context.session.thread_id)
     
     images = [file for file in message.elements if "image" in file.mime] if message.elements else []
     if images:
@@ -91,17 +199,7 @@ async def on_message(message: cl.Message):
     else:
         message_history.append({"role": "user", "content": message.content})
 
-    full_response = ""
-    async for token in agent.react_to(
-        message_history,
-        on_tag_start=on_tag_start,
-        on_message_start=on_message_start
-    ):
-        full_response += token
-
-    print(full_response)
-
-    cl.user_session.set("message_history", message_history)
+    await run_agent(agent, message_history)
     
 if __name__ == "__main__":
     cl.main() 
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+Headless runner for the mockup-to-HTML pipeline.
+
+Runs SupervisorAgent.react_to over a directory of mockup images without the
+Chainlit UI. Every job gets its own workspace with its artifacts and an event
+log, and the runner reports per-job wall time and token usage as well as the
+pipeline's throughput.
+
+Usage:
+    python batch_runner.py mockups/ --output runs/nightly --concurrency 3
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import AsyncGenerator, List
+
+from dotenv import load_dotenv
+
+from agents.supervisor_agent import SupervisorAgent
+from agents.messages import MessageList
+from agents.budget import TokenBudget
+from agents.model_router import ModelRouter
+from agents.artifact_patch import PATCH_STATS
+from agents.session_store import open_session_store
+from agents.usage import UsageMeter
+
+DEFAULT_MODEL = "anthropic/claude-3-5-sonnet-latest"
+DEFAULT_PROMPT = "Here is a mockup of a landing page. Please build it in HTML and CSS."
+IMAGE_EXTENSIONS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png"}
+
+@dataclass
+class JobResult:
+    job_id: str
+    image: str
+    workspace: str
+    status: str = "pending"
+    wall_time: float = 0.0
+    turns: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    usage_by_agent: dict = field(default_factory=dict)
+    early_stop: dict = None
+    budget: dict = None
+    artifacts: List[str] = field(default_factory=list)
+    error: str = None
+
+class EventLog:
+    """on_tag_start/on_message_start handlers that drain the streams and optionally log them to a file."""
+
+    def __init__(self, path: str = None):
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    async def on_tag_start(self, tag_name: str, stream: AsyncGenerator[str, None]):
+        await self._drain(tag_name, stream)
+
+    async def on_message_start(self, stream: AsyncGenerator[str, None]):
+        await self._drain("message", stream)
+
+    async def _drain(self, name: str, stream: AsyncGenerator[str, None]):
+        parts = []
+        async for token in stream:
+            if self._file is not None:
+                parts.append(token)
+        if self._file is not None:
+            self._file.write(json.dumps({"time": time.time(), "event": name, "content": "".join(parts)}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def find_mockups(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+def job_id_for(image_path: str) -> str:
+    """Name a mockup's job (and its workspace) after its file name, extension included,
+    so mock.jpg and mock.png don't share a workspace or checkpoint."""
+    return os.path.basename(image_path)
+
+def mockup_message(image_path: str, prompt: str) -> dict:
+    with open(image_path, "rb") as f:
+        image_data = base64.b64encode(f.read()).decode("utf-8")
+    image_format = IMAGE_EXTENSIONS[os.path.splitext(image_path)[1].lower()]
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:image/{image_format};base64,{image_data}"}},
+        ],
+    }
+
+async def run_job(
+    image_path: str,
+    output_dir: str,
+    model: str = DEFAULT_MODEL,
+    model_kwargs: dict = None,
+    prompt: str = DEFAULT_PROMPT,
+    log_events: bool = True,
+    router: ModelRouter = None,
+    session_store=None,
+    budget_config: str = None
+) -> JobResult:
+    """Run the pipeline for one mockup in its own workspace.
+
+    Args:
+        image_path: Mockup image
+        output_dir: Directory for the job workspaces
+        model: Supervisor model
+        model_kwargs: Generation parameters, shared with delegated agents
+        prompt: User message sent with the mockup
+        log_events: Write tag and message events to events.jsonl in the workspace
+        router: Optional ModelRouter for all agents of the job
+        session_store: Optional SessionStore; a rerun of the same job resumes its checkpoints
+        budget_config: Optional TokenBudget JSON file; each job gets its own budget
+    """
+    job_id = job_id_for(image_path)
+    workspace = os.path.join(output_dir, job_id)
+    result = JobResult(job_id=job_id, image=image_path, workspace=workspace)
+    os.makedirs(workspace, exist_ok=True)
+
+    agent = SupervisorAgent(litellm_model=model, model_kwargs=model_kwargs)
+    agent.artifacts_dir = os.path.join(workspace, "artifacts")
+    agent.router = router
+    agent.usage = UsageMeter()
+    if budget_config:
+        agent.budget = TokenBudget.from_file(budget_config)
+
+    messages = MessageList([mockup_message(image_path, prompt)])
+    if session_store is not None:
+        agent.checkpoints = session_store
+        agent.checkpoint_path = f"batch-{job_id}"
+        messages = MessageList(session_store.load(agent.checkpoint_path) or messages)
+
+    events = EventLog(os.path.join(workspace, "events.jsonl") if log_events else None)
+    started = time.monotonic()
+    try:
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+        result.status = "succeeded"
+    except Exception as e:
+        result.status = "failed"
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        events.close()
+        result.wall_time = round(time.monotonic() - started, 2)
+        result.turns = agent.usage.turns
+        result.prompt_tokens = agent.usage.prompt_tokens
+        result.completion_tokens = agent.usage.completion_tokens
+        result.usage_by_agent = agent.usage.by_agent
+        result.early_stop = agent.usage.early_stop_savings()
+        if agent.budget is not None:
+            result.budget = agent.budget.as_dict()
+        if os.path.isdir(agent.artifacts_dir):
+            result.artifacts = sorted(os.listdir(agent.artifacts_dir))
+    return result
+
+def total_early_stop(results: List[JobResult]) -> dict:
+    """Sum the jobs' early-stop savings. Estimates are summed over the jobs that have one."""
+    totals = {}
+    for result in results:
+        for key, value in (result.early_stop or {}).items():
+            if value is not None:
+                totals[key] = round(totals.get(key, 0) + value, 3)
+    for key in ("estimated_tokens_saved", "estimated_seconds_saved"):
+        totals.setdefault(key, None)
+    return totals
+
+async def run_batch(images: List[str], output_dir: str, concurrency: int = 2, **job_kwargs) -> dict:
+    """Run jobs for all images, at most `concurrency` at a time, and return the report.
+
+    Raises:
+        ValueError: Two images have the same file name (or one is listed twice), so their jobs would share a workspace
+    """
+    seen = {}
+    for image_path in images:
+        job_id = job_id_for(image_path)
+        if job_id in seen:
+            raise ValueError(f"{seen[job_id]} and {image_path} have the same job id '{job_id}'")
+        seen[job_id] = image_path
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(image_path: str) -> JobResult:
+        async with semaphore:
+            result = await run_job(image_path, output_dir, **job_kwargs)
+            print(f"[BATCH] {result.job_id}: {result.status} in {result.wall_time}s, "
+                  f"{result.prompt_tokens + result.completion_tokens} tokens")
+            return result
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(limited(image_path) for image_path in images))
+    wall_time = time.monotonic() - started
+
+    completion_tokens = sum(r.completion_tokens for r in results)
+    succeeded = [r for r in results if r.status == "succeeded"]
+    router = job_kwargs.get("router")
+    return {
+        "jobs": [asdict(r) for r in results],
+        # Per-tier requests, failovers, escalations, latency and cost over all jobs
+        "router": router.stats() if router is not None else None,
+        # Patch edits and the output tokens they saved over full rewrites, over all jobs
+        "patches": PATCH_STATS.as_dict(),
+        "summary": {
+            "jobs": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "concurrency": concurrency,
+            "wall_time": round(wall_time, 2),
+            "jobs_per_hour": round(len(succeeded) / wall_time * 3600, 2) if wall_time else 0.0,
+            "mean_job_time": round(sum(r.wall_time for r in results) / len(results), 2) if results else 0.0,
+            "prompt_tokens": sum(r.prompt_tokens for r in results),
+            "completion_tokens": completion_tokens,
+            "completion_tokens_per_second": round(completion_tokens / wall_time, 1) if wall_time else 0.0,
+            "early_stop": total_early_stop(results),
+        },
+    }
+
+def print_report(report: dict):
+    print(f"\n{'job':<24} {'status':<10} {'time (s)':>9} {'turns':>6} {'prompt':>9} {'completion':>11}")
+    for job in report["jobs"]:
+        print(f"{job['job_id'][:24]:<24} {job['status']:<10} {job['wall_time']:>9} {job['turns']:>6} "
+              f"{job['prompt_tokens']:>9} {job['completion_tokens']:>11}")
+    summary = report["summary"]
+    print(f"\n{summary['succeeded']}/{summary['jobs']} jobs succeeded in {summary['wall_time']}s "
+          f"at concurrency {summary['concurrency']}: {summary['jobs_per_hour']} jobs/hour, "
+          f"{summary['completion_tokens_per_second']} completion tokens/s")
+    early_stop = summary["early_stop"]
+    if early_stop["estimated_tokens_saved"] is not None:
+        print(f"{early_stop['stopped_turns']} turns stopped at their action tag, saving about "
+              f"{early_stop['estimated_tokens_saved']} tokens and {early_stop['estimated_seconds_saved']}s")
+    patches = report["patches"]
+    print(f"{patches['edits']} patch edits saved {patches['tokens_saved']} output tokens, "
+          f"{patches['conflicts']} conflicts")
+    for tier, stats in (report["router"] or {}).items():
+        print(f"  {tier} tier: {stats['requests']} requests, {stats['failovers']} failovers, "
+              f"{stats['escalations']} escalations, avg latency {stats['avg_latency']}s, ${stats['cost']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mockups", help="Directory of mockup images (.jpg, .jpeg, .png)")
+    parser.add_argument("--output", default=os.path.join("runs", time.strftime("%Y%m%d-%H%M%S")),
+                        help="Directory for job workspaces and the report")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs running at once")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--temperature", type=float, default=0.1)
+    parser.add_argument("--max-tokens", type=int, default=8192)
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--no-event-log", action="store_true", help="Drain events without writing events.jsonl")
+    parser.add_argument("--routing-config", default=os.getenv("MODEL_ROUTING_CONFIG"))
+    parser.add_argument("--session-store", help="SQLite file or directory; reruns resume unfinished jobs")
+    parser.add_argument("--budget-config", default=os.getenv("BUDGET_CONFIG"), help="Token budget JSON file, applied per job")
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    images = find_mockups(args.mockups)
+    if not images:
+        parser.error(f"No mockup images found in {args.mockups}")
+    os.makedirs(args.output, exist_ok=True)
+
+    report = asyncio.run(run_batch(
+        images,
+        args.output,
+        concurrency=args.concurrency,
+        model=args.model,
+        model_kwargs={"temperature": args.temperature, "max_tokens": args.max_tokens},
+        prompt=args.prompt,
+        log_events=not args.no_event_log,
+        router=ModelRouter.from_file(args.routing_config) if args.routing_config else None,
+        session_store=open_session_store(args.session_store) if args.session_store else None,
+        budget_config=args.budget_config,
+    ))
+
+    report_path = os.path.join(args.output, "report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
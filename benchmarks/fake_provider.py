@@ -0,0 +1,191 @@
+"""
+A local stand-in for the OpenAI and Anthropic chat APIs, for load tests.
+
+It streams scripted agent responses shaped like the real runs: the Supervisor
+saves an uploaded mockup, delegates to the PlanningAgent and then the
+ImplementationAgent, which write plan.md and index.html, and answers other
+questions directly. The time to the first token and the token rate are fixed,
+so a load test measures the app rather than the provider. Stop sequences are
+honored the way the real APIs do.
+
+Point litellm at it with ANTHROPIC_API_BASE=http://127.0.0.1:<port> and
+OPENAI_API_BASE=http://127.0.0.1:<port>/v1.
+
+Usage:
+    python benchmarks/fake_provider.py [--port 8101] [--ttft-ms 400] [--tokens-per-second 80]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web
+
+THOUGHT = "<thought_process>" + "Check the request against what has been done so far and pick the next step. " * 6 + "</thought_process>\n"
+
+PAGE = (
+    "<!DOCTYPE html>\n<html>\n<head>\n<link rel='stylesheet' href='styles.css'>\n</head>\n<body>\n"
+    + "<section class='card'><h2>Feature</h2><p>A short description of the feature.</p></section>\n" * 12
+    + "</body>\n</html>\n"
+)
+
+PLAN = "# Plan\n\n" + "".join(f"## Milestone {i}\n- Build section {i} to match the mockup\n\n" for i in range(1, 5))
+
+def function_call(name: str, arguments: dict) -> str:
+    return "<function_call>" + json.dumps({"name": name, "arguments": arguments}) + "</function_call>"
+
+def delegation(name: str, instructions: str) -> str:
+    return "<delegate_agent>" + json.dumps({"name": name, "instructions": instructions}) + "</delegate_agent>"
+
+def script(system: str, messages: list) -> str:
+    """The response of the agent with this system prompt to the conversation so far."""
+    last = message_text(messages[-1]) if messages else ""
+    has_image = bool(messages) and message_has_image(messages[-1])
+
+    if "The plan has been saved as plan.md" in system:
+        if "<function_result>" in last:
+            return THOUGHT + "The plan has been saved as plan.md."
+        return THOUGHT + function_call("updateArtifact", {"filename": "plan.md", "contents": PLAN})
+
+    if "The implementation is complete" in system:
+        if "<function_result>" in last:
+            return THOUGHT + "The implementation is complete."
+        return THOUGHT + function_call("updateArtifact", {"filename": "index.html", "contents": PAGE})
+
+    if "<delegate_agent_result>" in last:
+        if "implementation is complete" in last:
+            return THOUGHT + "The landing page is implemented in index.html, following plan.md."
+        return THOUGHT + delegation("ImplementationAgent", "Implement every milestone of plan.md in index.html.")
+    if "<function_result>" in last:
+        return THOUGHT + delegation("PlanningAgent", "Write a plan for the mockup saved as mockup.jpg.")
+    if has_image:
+        return THOUGHT + function_call("saveImage", {"filename": "mockup.jpg"})
+    return THOUGHT + "Here are a few films worth a look: " + "a well reviewed drama with a strong cast, " * 8 + "and a recent thriller."
+
+def message_text(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content or () if isinstance(part, dict))
+
+def message_has_image(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        isinstance(part, dict) and part.get("type") in ("image", "image_url") for part in content
+    )
+
+def apply_stop(text: str, stop) -> tuple[str, str | None]:
+    """Cut text before its first stop sequence, like the APIs do. Returns (text, the sequence hit)."""
+    if isinstance(stop, str):
+        stop = [stop]
+    hits = [(text.find(sequence), sequence) for sequence in stop or () if sequence and sequence in text]
+    if not hits:
+        return text, None
+    index, sequence = min(hits)
+    return text[:index], sequence
+
+class FakeProvider:
+    """Serves /v1/messages (Anthropic) and /v1/chat/completions (OpenAI) as streams."""
+
+    def __init__(self, ttft: float = 0.4, tokens_per_second: float = 80, chars_per_token: int = 4):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = chars_per_token
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/messages", self.anthropic)
+        app.router.add_post("/v1/chat/completions", self.openai)
+        return app
+
+    async def tokens(self, text: str):
+        await asyncio.sleep(self.ttft)
+        delay = 1 / self.tokens_per_second
+        for start in range(0, len(text), self.chars_per_token):
+            yield text[start:start + self.chars_per_token]
+            await asyncio.sleep(delay)
+
+    async def anthropic(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        system = body.get("system") or ""
+        if isinstance(system, list):
+            system = "".join(part.get("text", "") for part in system)
+        text, stopped = apply_stop(script(system, body.get("messages", [])), body.get("stop_sequences"))
+        response = await self._open_stream(request)
+
+        async def send(event: str, data: dict):
+            await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+
+        prompt_tokens = len(json.dumps(body)) // self.chars_per_token
+        await send("message_start", {"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": 1},
+        }})
+        await send("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        count = 0
+        async for token in self.tokens(text):
+            count += 1
+            await send("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}})
+        await send("content_block_stop", {"type": "content_block_stop", "index": 0})
+        await send("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "stop_sequence" if stopped else "end_turn", "stop_sequence": stopped},
+            "usage": {"output_tokens": count},
+        })
+        await send("message_stop", {"type": "message_stop"})
+        await response.write_eof()
+        return response
+
+    async def openai(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        messages = body.get("messages", [])
+        system = "".join(message_text(m) for m in messages if m.get("role") == "system")
+        conversation = [m for m in messages if m.get("role") != "system"]
+        text, _ = apply_stop(script(system, conversation), body.get("stop"))
+        response = await self._open_stream(request)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        async def send(delta: dict, finish_reason=None, usage=None):
+            chunk = {
+                "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage is not None:
+                chunk["usage"] = usage
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        count = 0
+        async for token in self.tokens(text):
+            await send({"role": "assistant", "content": token} if count == 0 else {"content": token})
+            count += 1
+        usage = None
+        if (body.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens = len(json.dumps(body)) // self.chars_per_token
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count}
+        await send({}, "stop", usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _open_stream(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        return response
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--ttft-ms", type=float, default=400, help="Delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    args = parser.parse_args()
+    provider = FakeProvider(ttft=args.ttft_ms / 1000, tokens_per_second=args.tokens_per_second)
+    web.run_app(provider.app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Load test of the Chainlit app: how many concurrent sessions one worker handles.
+
+Starts the fake provider (benchmarks/fake_provider.py) and `chainlit run
+app.py` pointed at it, then, for each concurrency level, runs that many
+simulated users at once over Chainlit's socket protocol. Each user alternates
+between uploading a mockup (which runs the Supervisor -> Planning ->
+Implementation delegations) and asking a movie question.
+
+For each level it reports the time to the first token and the full turn
+latency (p50/p90/p99/max), completed turns per second, and the worker's CPU
+use, peak resident memory and event loop lag, which the app samples itself
+when SERVER_STATS_FILE is set. Results are saved as JSON; pass an earlier
+result with --compare to see the change, e.g. between two commits.
+
+Variables in .env override the ones set here (app.py loads it with
+override=True), so unset response caching, hedging and budgets there for
+comparable runs.
+
+Usage:
+    python benchmarks/load_test.py [--users 1,5,10,20] [--turns 4] [--mockups mockups/]
+        [--ttft-ms 400] [--tokens-per-second 80] [--label NAME] [--compare runs/load-tests/earlier.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import aiohttp
+import socketio
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from batch_runner import find_mockups
+
+QUESTIONS = [
+    "What are some good science fiction movies from the last few years?",
+    "Which films are playing in theaters this week?",
+    "Recommend a comedy that's good for a family movie night.",
+    "Who directed the best thriller of last year?",
+]
+
+class TurnResult:
+    __slots__ = ("kind", "ttft", "latency", "error")
+
+    def __init__(self, kind: str, ttft: float | None, latency: float | None, error: str | None = None):
+        self.kind = kind
+        self.ttft = ttft
+        self.latency = latency
+        self.error = error
+
+class SimulatedUser:
+    """One browser session: a socket connection that sends messages and times the replies."""
+
+    def __init__(self, base_url: str, turn_timeout: float):
+        self.base_url = base_url
+        self.turn_timeout = turn_timeout
+        self.session_id = str(uuid.uuid4())
+        self.client = socketio.AsyncClient(reconnection=False)
+        self._turn_started = None
+        self._first_output = None
+        self._turn_done = None
+        # The turn is done at this many task_end events
+        self._task_ends = 0
+        self._turn_until = None
+        self.client.on("stream_token", self._on_output)
+        self.client.on("new_message", self._on_step)
+        self.client.on("update_message", self._on_step)
+        self.client.on("task_end", self._on_task_end)
+
+    async def connect(self) -> None:
+        await self.client.connect(
+            self.base_url,
+            headers={
+                "X-Chainlit-Session-Id": self.session_id,
+                "X-Chainlit-Client-Type": "webapp",
+                "user-env": "{}",
+            },
+            transports=["websocket"],
+            socketio_path="/ws/socket.io",
+        )
+        # Chainlit ends a task once connected, and another after on_chat_start;
+        # a message sent before then would be answered with on_chat_start's task_end
+        self._turn_done = asyncio.get_running_loop().create_future()
+        self._turn_until = 2
+        await self.client.emit("connection_successful")
+        await asyncio.wait_for(self._turn_done, self.turn_timeout)
+
+    async def close(self) -> None:
+        await self.client.emit("clear_session")
+        await self.client.disconnect()
+
+    async def _on_output(self, data) -> None:
+        if self._turn_started is not None and self._first_output is None:
+            self._first_output = time.monotonic()
+
+    async def _on_step(self, step) -> None:
+        # Collapsed steps arrive whole, without stream tokens
+        if step.get("type") != "user_message" and step.get("output"):
+            await self._on_output(step)
+
+    async def _on_task_end(self, data) -> None:
+        self._task_ends += 1
+        if self._turn_done is not None and not self._turn_done.done() and self._task_ends >= self._turn_until:
+            self._turn_done.set_result(time.monotonic())
+
+    async def upload(self, http: aiohttp.ClientSession, name: str, content: bytes, mime: str) -> str:
+        form = aiohttp.FormData()
+        form.add_field("file", content, filename=name, content_type=mime)
+        async with http.post(f"{self.base_url}/project/file", params={"session_id": self.session_id}, data=form) as response:
+            response.raise_for_status()
+            return (await response.json())["id"]
+
+    async def send(self, kind: str, text: str, file_ids: list = ()) -> TurnResult:
+        """Send a message and wait for the app to finish its turn."""
+        self._first_output = None
+        self._turn_done = asyncio.get_running_loop().create_future()
+        self._turn_until = self._task_ends + 1
+        self._turn_started = time.monotonic()
+        await self.client.emit("client_message", {
+            "message": {
+                "id": str(uuid.uuid4()),
+                "name": "User",
+                "type": "user_message",
+                "output": text,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+            },
+            "fileReferences": [{"id": file_id} for file_id in file_ids],
+        })
+        try:
+            finished = await asyncio.wait_for(self._turn_done, self.turn_timeout)
+        except asyncio.TimeoutError:
+            return TurnResult(kind, None, None, "timeout")
+        finally:
+            started, self._turn_started = self._turn_started, None
+        ttft = self._first_output - started if self._first_output is not None else None
+        return TurnResult(kind, ttft, finished - started, None if ttft is not None else "no output")
+
+async def run_user(index: int, base_url: str, turns: int, mockups: list, turn_timeout: float) -> list:
+    user = SimulatedUser(base_url, turn_timeout)
+    results = []
+    try:
+        await user.connect()
+        async with aiohttp.ClientSession() as http:
+            for turn in range(turns):
+                if turn % 2 == 0 and mockups:
+                    name, content, mime = mockups[(index + turn) % len(mockups)]
+                    file_id = await user.upload(http, name, content, mime)
+                    results.append(await user.send("mockup", "Implement this mockup as a landing page.", [file_id]))
+                else:
+                    results.append(await user.send("question", QUESTIONS[(index + turn) % len(QUESTIONS)]))
+    except Exception as e:
+        results.append(TurnResult("connect", None, None, f"{type(e).__name__}: {e}"))
+    finally:
+        if user.client.connected:
+            await user.close()
+    return results
+
+def load_mockups(directory: str | None) -> list:
+    """(name, bytes, mime) of each mockup, or one generated image when there's no directory."""
+    if directory:
+        mockups = []
+        for path in find_mockups(directory):
+            with open(path, "rb") as f:
+                mime = "image/png" if path.lower().endswith(".png") else "image/jpeg"
+                mockups.append((os.path.basename(path), f.read(), mime))
+        return mockups
+
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (1200, 800), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1200, 120), fill="navy")
+    for column in range(3):
+        draw.rectangle((60 + column * 380, 300, 380 + column * 380, 700), outline="gray", width=4)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return [("mockup.png", buffer.getvalue(), "image/png")]
+
+def percentiles(values: list) -> dict | None:
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(int(len(values) * q), len(values) - 1)] * 1000
+    return {"p50": round(pick(0.5), 1), "p90": round(pick(0.9), 1), "p99": round(pick(0.99), 1), "max": round(values[-1] * 1000, 1)}
+
+def server_samples(path: str, start: float, end: float) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    return [sample for sample in samples if start <= sample["time"] <= end]
+
+async def run_level(users: int, base_url: str, args, mockups: list, stats_path: str) -> dict:
+    started_at = time.time()
+    started = time.monotonic()
+    per_user = await asyncio.gather(*(
+        run_user(index, base_url, args.turns, mockups, args.turn_timeout) for index in range(users)
+    ))
+    elapsed = time.monotonic() - started
+    # The app writes a sample a second; wait for the one covering the end of the level
+    await asyncio.sleep(1.5)
+    samples = server_samples(stats_path, started_at, time.time())
+
+    turns = [result for results in per_user for result in results]
+    completed = [turn for turn in turns if turn.error is None]
+    level = {
+        "users": users,
+        "turns": len(completed),
+        "errors": {},
+        "seconds": round(elapsed, 2),
+        "turns_per_second": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+        "ttft_ms": percentiles([turn.ttft for turn in completed]),
+        "turn_ms": percentiles([turn.latency for turn in completed]),
+        "turn_ms_by_kind": {
+            kind: percentiles([turn.latency for turn in completed if turn.kind == kind])
+            for kind in sorted({turn.kind for turn in completed})
+        },
+    }
+    for turn in turns:
+        if turn.error is not None:
+            level["errors"][turn.error] = level["errors"].get(turn.error, 0) + 1
+    if len(samples) >= 2:
+        wall = samples[-1]["time"] - samples[0]["time"]
+        level["cpu_percent"] = round((samples[-1]["cpu_seconds"] - samples[0]["cpu_seconds"]) / wall * 100, 1) if wall else None
+    if samples:
+        level["rss_mb_max"] = round(max(sample["rss_bytes"] for sample in samples) / 2**20, 1)
+        level["loop_lag_ms"] = {
+            "p99": round(max(sample["lag_ms_p99"] for sample in samples), 1),
+            "max": round(max(sample["lag_ms_max"] for sample in samples), 1),
+        }
+    return level
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout} seconds")
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args) -> dict:
+    started = datetime.now(timezone.utc).isoformat()
+    mockups = load_mockups(args.mockups)
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    stats_path = os.path.join(workdir, "server_stats.jsonl")
+    provider_port, app_port = free_port(), free_port()
+    provider_base = f"http://127.0.0.1:{provider_port}"
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_BASE": provider_base,
+        "OPENAI_API_BASE": f"{provider_base}/v1",
+        "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", "load-test"),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "load-test"),
+        "ARTIFACTS_ROOT": os.path.join(workdir, "workspaces"),
+        "SERVER_STATS_FILE": stats_path,
+        "LANGCHAIN_TRACING_V2": "false",
+    }
+    log = open(os.path.join(workdir, "app.log"), "w")
+    processes = []
+    try:
+        provider = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_provider.py"), "--port", str(provider_port),
+             "--ttft-ms", str(args.ttft_ms), "--tokens-per-second", str(args.tokens_per_second)],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+        processes.append(provider)
+        app = subprocess.Popen(
+            [sys.executable, "-m", "chainlit", "run", "app.py", "--headless", "--port", str(app_port)],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        processes.append(app)
+        await wait_for_port(provider_port, provider)
+        await wait_for_port(app_port, app)
+
+        base_url = f"http://127.0.0.1:{app_port}"
+        levels = []
+        for users in args.users:
+            print(f"Running {users} users x {args.turns} turns...")
+            level = await run_level(users, base_url, args, mockups, stats_path)
+            levels.append(level)
+            print_level(level)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+
+    print(f"App output and workspaces: {workdir}")
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "started": started,
+        "settings": {
+            "turns": args.turns,
+            "mockups": len(mockups),
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_second": args.tokens_per_second,
+        },
+        "levels": levels,
+    }
+
+def print_level(level: dict) -> None:
+    ttft, turn, lag = level["ttft_ms"] or {}, level["turn_ms"] or {}, level.get("loop_lag_ms") or {}
+    print(
+        f"  {level['users']:>4} users  {level['turns']:>4} turns  {level['turns_per_second']:>6.2f} turns/s"
+        f"  TTFT p50 {ttft.get('p50', '-')} p99 {ttft.get('p99', '-')} ms"
+        f"  turn p50 {turn.get('p50', '-')} p99 {turn.get('p99', '-')} ms"
+        f"  CPU {level.get('cpu_percent', '-')}%  RSS {level.get('rss_mb_max', '-')} MB"
+        f"  lag p99 {lag.get('p99', '-')} max {lag.get('max', '-')} ms"
+        + (f"  errors {level['errors']}" if level["errors"] else "")
+    )
+
+def print_comparison(report: dict, earlier: dict) -> None:
+    """Change per concurrency level in the main numbers, against an earlier report."""
+    print(f"Compared with {earlier.get('label') or earlier.get('commit')} ({earlier.get('started')}):")
+    earlier_levels = {level["users"]: level for level in earlier.get("levels", [])}
+    metrics = [
+        ("TTFT p50", lambda level: (level["ttft_ms"] or {}).get("p50")),
+        ("TTFT p99", lambda level: (level["ttft_ms"] or {}).get("p99")),
+        ("turn p50", lambda level: (level["turn_ms"] or {}).get("p50")),
+        ("turn p99", lambda level: (level["turn_ms"] or {}).get("p99")),
+        ("turns/s", lambda level: level.get("turns_per_second")),
+        ("CPU %", lambda level: level.get("cpu_percent")),
+        ("RSS MB", lambda level: level.get("rss_mb_max")),
+        ("lag p99", lambda level: (level.get("loop_lag_ms") or {}).get("p99")),
+    ]
+    for level in report["levels"]:
+        before = earlier_levels.get(level["users"])
+        if before is None:
+            continue
+        changes = []
+        for name, value in metrics:
+            new, old = value(level), value(before)
+            if new is not None and old:
+                changes.append(f"{name} {old} -> {new} ({(new - old) / old * 100:+.0f}%)")
+        print(f"  {level['users']:>4} users  " + "  ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1,5,10,20", help="Comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=4, help="Messages per user, alternating mockups and questions")
+    parser.add_argument("--mockups", help="Directory of mockup images; a generated image by default")
+    parser.add_argument("--ttft-ms", type=float, default=400, help="Fake provider delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="Fake provider token rate")
+    parser.add_argument("--turn-timeout", type=float, default=300)
+    parser.add_argument("--label", help="Name for this run in the results, e.g. a branch")
+    parser.add_argument("--output", default=os.path.join("runs", "load-tests"), help="Directory to save the results in")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args()
+    args.users = [int(users) for users in args.users.split(",")]
+
+    report = asyncio.run(run(args))
+    os.makedirs(args.output, exist_ok=True)
+    name = f"load-{args.label or report['commit'] or 'run'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    report_path = os.path.join(args.output, name)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {report_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the memory used by session histories stored as plain dicts and as a
+MessageList.
+
+Each simulated session uploads a mockup, delegates it to two agents as an
+attachment, and streams several long responses with function results, like a
+Supervisor -> Planning -> Implementation run.
+
+Usage:
+    python benchmarks/message_memory.py [--sessions 200] [--image-kb 300] [--turns 6]
+"""
+import argparse
+import base64
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agents.messages import MessageList
+
+def stream_tokens(index: int, length: int = 8000, token_size: int = 4):
+    text = f"<thought_process>turn {index} " + "x" * length + "</thought_process>"
+    for start in range(0, len(text), token_size):
+        yield text[start:start + token_size]
+
+def image_message(text: str, image_bytes: bytes) -> dict:
+    # Every load re-encodes the file, like the upload handler and attachment loading do
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": text},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('utf-8')}"}},
+        ],
+    }
+
+def build_session(image_bytes: bytes, turns: int, compact: bool) -> list:
+    histories = []
+    for agent in ("SupervisorAgent", "PlanningAgent", "ImplementationAgent"):
+        messages = MessageList() if compact else []
+        messages.append({"role": "user", "content": f"Instructions for {agent}"})
+        messages.append(image_message("Reference image from: mock.jpeg", image_bytes))
+        for turn in range(turns):
+            if compact:
+                parts = []
+                for token in stream_tokens(turn):
+                    parts.append(token)
+                response = "".join(parts)
+            else:
+                response = ""
+                for token in stream_tokens(turn):
+                    response += token
+            messages.append({"role": "assistant", "content": response})
+            messages.append({"role": "user", "content": f"<function_result>Successfully saved artifact: page{turn}.html</function_result>"})
+        histories.append(messages)
+    return histories
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+
+    # Sessions upload different mockups, but a session's agents share the same one
+    images = [os.urandom(args.image_kb * 1024) for _ in range(args.sessions)]
+
+    results = {}
+    for label, compact in (("dict", False), ("MessageList", True)):
+        image_iter = iter(images)
+        gc.collect()
+        tracemalloc.start()
+        kept = [build_session(next(image_iter), args.turns, compact) for _ in range(args.sessions)]
+        results[label] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del kept
+
+    print(f"{args.sessions} sessions, {args.image_kb} KB image, {args.turns} turns per agent")
+    for label, (current, peak) in results.items():
+        print(f"  {label:<12} retained {current / 2**20:8.1f} MiB   peak {peak / 2**20:8.1f} MiB")
+    dict_current = results["dict"][0]
+    compact_current = results["MessageList"][0]
+    print(f"  retained memory reduced by {(1 - compact_current / dict_current) * 100:.0f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measures the per-token overhead of the response stream pipeline and of each
+of its stages.
+
+Each configuration streams the same synthetic agent responses (a thought
+process, message text and a function call, split into small tokens) from an
+in-memory source. The overhead is the time per token above iterating the
+source directly.
+
+Usage:
+    python benchmarks/stream_pipeline.py [--responses 300] [--token-size 4] [--repeats 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agents.base_agent import ACTION_TAGS
+from agents.stream_pipeline import (
+    StreamPipeline, StreamSink, StreamStage, TagParser, QueueSink,
+    StopAfterTags, ActionTailStage, UsageStage, CacheStage
+)
+from agents.usage import UsageMeter
+
+RESPONSE = (
+    "<thought_process>" + "Compare the header spacing with the mockup. " * 12 + "</thought_process>\n"
+    + "I'll update the page now.\n"
+    + '<function_call>{"name": "updateArtifact", "arguments": {"filename": "index.html", "contents": "'
+    + "<div class='card'>text</div>" * 20 + '"}}</function_call>'
+)
+
+class ListSource:
+    """An in-memory source, standing in for a ProviderSource."""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.received = tokens
+        self.usage = None
+
+    async def __aiter__(self):
+        for token in self.tokens:
+            yield token
+
+class DisabledStage(StreamStage):
+    enabled = False
+
+    def on_event(self, event) -> bool:
+        raise AssertionError("disabled stages are never called")
+
+class NullCache:
+    def put(self, key, text, model=None):
+        pass
+
+def configurations(source: ListSource):
+    usage = UsageMeter()
+    model = "openai/gpt-4o"
+    return {
+        "pipeline, no parser": lambda: StreamPipeline(source),
+        "parser + empty sink": lambda: StreamPipeline(source, TagParser(), sinks=[StreamSink()]),
+        "  + disabled stage": lambda: StreamPipeline(source, TagParser(), [DisabledStage()], [StreamSink()]),
+        "  + StopAfterTags": lambda: StreamPipeline(source, TagParser(), [StopAfterTags(("delegate_plan",))], [StreamSink()]),
+        "  + ActionTailStage": lambda: StreamPipeline(source, TagParser(), [ActionTailStage(usage, model, ACTION_TAGS)], [StreamSink()]),
+        "  + UsageStage": lambda: StreamPipeline(source, TagParser(), [UsageStage("Bench", model, [], source, usage)], [StreamSink()]),
+        "  + CacheStage": lambda: StreamPipeline(source, TagParser(), [CacheStage(NullCache(), "key", model)], [StreamSink()]),
+        "parser + QueueSink": lambda: StreamPipeline(
+            source, TagParser(), sinks=[QueueSink(create_queue, None, None)]
+        ),
+    }
+
+async def create_queue(name, callback):
+    # Nothing reads the streams; the queues are dropped with the pipeline
+    return asyncio.Queue()
+
+async def time_run(make_stream, responses: int) -> float:
+    started = time.perf_counter()
+    for _ in range(responses):
+        async for _token in make_stream():
+            pass
+    return time.perf_counter() - started
+
+async def run(args):
+    tokens = [RESPONSE[i:i + args.token_size] for i in range(0, len(RESPONSE), args.token_size)]
+    source = ListSource(tokens)
+    total_tokens = len(tokens) * args.responses
+    configs = {"source only": lambda: source, **configurations(source)}
+
+    # Rounds go through every configuration, so drift affects them all alike
+    best = dict.fromkeys(configs, float("inf"))
+    for _ in range(args.repeats):
+        for label, make_stream in configs.items():
+            best[label] = min(best[label], await time_run(make_stream, args.responses))
+
+    baseline = best.pop("source only")
+    print(f"{args.responses} responses of {len(tokens)} tokens ({args.token_size} chars each), best of {args.repeats}")
+    print(f"  {'source only':<24} {baseline / total_tokens * 1e9:8.0f} ns/token")
+    previous = None
+    for label, elapsed in best.items():
+        per_token = (elapsed - baseline) / total_tokens * 1e9
+        line = f"  {label:<24} {per_token:+8.0f} ns/token over the source"
+        if label.startswith("  +") and previous is not None:
+            line += f"   ({per_token - previous:+.0f} for the stage)"
+        else:
+            previous = per_token
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=300)
+    parser.add_argument("--token-size", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+from typing import AsyncGenerator, Dict
+
+import chainlit as cl
+
+# How each tag is shown:
+#   "stream":   a step that streams as the tag arrives
+#   "collapse": a step sent once, complete, when the tag closes
+#   "hide":     not shown
+# Tags not listed stream.
+TAG_DISPLAY = {
+    "thought_process": "stream",
+    "function_call": "collapse",
+    "function_result": "collapse",
+    "delegate_agent": "collapse",
+    "delegate_agent_result": "collapse",
+    "delegate_plan": "collapse",
+    "delegate_plan_result": "collapse",
+    "loop_detected": "collapse",
+    "budget_exceeded": "collapse",
+}
+
+def tag_display_from_env(value: str = None) -> Dict[str, str]:
+    """Parse per-tag display overrides like "thought_process=collapse,function_call=hide"."""
+    value = value if value is not None else os.getenv("UI_TAG_DISPLAY", "")
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        tag_name, _, display = item.partition("=")
+        if display not in ("stream", "collapse", "hide"):
+            raise ValueError(f"Unknown display '{display}' for tag '{tag_name}' in UI_TAG_DISPLAY")
+        overrides[tag_name.strip()] = display
+    return overrides
+
+class ChainlitUI:
+    """on_tag_start/on_message_start callbacks that render an agent run in Chainlit.
+
+    UI operations are kept few: steps and messages are created by their first
+    token rather than sent empty up front, the steps of an agent turn share one
+    parent message, collapsed tags (such as results, which arrive all at once)
+    are a single send, and streamed tokens are coalesced to one update per
+    flush_interval. A turn's steps run up to its last result tag, and the next
+    tag after a result starts a new turn.
+    """
+
+    def __init__(self, tag_display: Dict[str, str] = None, flush_interval: float = 0.1):
+        """Initialize the adapter for one run.
+
+        Args:
+            tag_display: Per-tag "stream", "collapse" or "hide", over TAG_DISPLAY
+            flush_interval: Seconds between updates of a streaming step or message
+        """
+        self.tag_display = {**TAG_DISPLAY, **(tag_display or {})}
+        self.flush_interval = flush_interval
+        self.operations = 0
+        self._turn_message_id = None
+        self._turn_has_results = False
+        self._turn_lock = asyncio.Lock()
+
+    async def on_tag_start(self, tag_name: str, stream: AsyncGenerator[str, None]):
+        display = self.tag_display.get(tag_name, "stream")
+        if display == "hide":
+            async for _ in stream:
+                pass
+            if tag_name.endswith("_result"):
+                self._turn_has_results = True
+        elif display == "collapse":
+            output = "".join([token async for token in stream])
+            step = cl.Step(name=tag_name, parent_id=await self._parent_for(tag_name))
+            step.output = output
+            await step.send()
+            self.operations += 1
+        else:
+            step = None
+            async for chunk in self._coalesce(stream):
+                if step is None:
+                    step = cl.Step(name=tag_name, parent_id=await self._parent_for(tag_name))
+                await step.stream_token(chunk)
+                self.operations += 1
+            if step is not None:
+                await step.send()
+                self.operations += 1
+
+    async def on_message_start(self, stream: AsyncGenerator[str, None]):
+        message = None
+        async for chunk in self._coalesce(stream):
+            if message is None:
+                message = cl.Message(content="")
+            await message.stream_token(chunk)
+            self.operations += 1
+        if message is not None:
+            await message.send()
+            self.operations += 1
+
+    async def _parent_for(self, tag_name: str) -> str:
+        """Id of the parent message for a tag's step, sent when a turn's first step needs it."""
+        is_result = tag_name.endswith("_result")
+        async with self._turn_lock:
+            # Results belong to the turn that made the calls; anything after them is the next response
+            if self._turn_message_id is None or (self._turn_has_results and not is_result):
+                message = cl.Message(content="")
+                await message.send()
+                self.operations += 1
+                self._turn_message_id = message.id
+                self._turn_has_results = False
+            self._turn_has_results = self._turn_has_results or is_result
+            return self._turn_message_id
+
+    async def _coalesce(self, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Join tokens that arrive within flush_interval of the last update. The first token goes out at
+        once, and buffered tokens go out when the interval ends even if no further token has arrived."""
+        tokens = stream.__aiter__()
+        buffer = []
+        last_flush = float("-inf")
+        # The pending read of the next token, kept across flushes; cancelling
+        # a read would cancel the stream
+        next_token = None
+        try:
+            while True:
+                if buffer:
+                    if next_token is None:
+                        next_token = asyncio.ensure_future(tokens.__anext__())
+                    remaining = last_flush + self.flush_interval - time.monotonic()
+                    done, _ = await asyncio.wait((next_token,), timeout=max(remaining, 0))
+                    if not done:
+                        yield "".join(buffer)
+                        buffer.clear()
+                        last_flush = time.monotonic()
+                        continue
+                    read, next_token = next_token, None
+                    try:
+                        token = read.result()
+                    except StopAsyncIteration:
+                        break
+                else:
+                    try:
+                        token = await (next_token if next_token is not None else tokens.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_token = None
+                buffer.append(token)
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    last_flush = now
+        finally:
+            if next_token is not None:
+                next_token.cancel()
+        if buffer:
+            yield "".join(buffer)
@@ -1,8 +1,36 @@
+import contextvars
 import os
+import threading
+import time
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from serpapi import GoogleSearch
 from functools import wraps
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, List
+from api_guards import APIError, GuardRejectedError, configure_guard, guard_scope, guarded
+from movie_store import STORE
+
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+REQUEST_TIMEOUT = 10
+
+# Most pages fetched for one paginated listing, and most TMDb requests in flight
+TMDB_MAX_PAGES = 5
+TMDB_MAX_CONCURRENCY = 4
+
+_TMDB_POOL = ThreadPoolExecutor(max_workers=TMDB_MAX_CONCURRENCY, thread_name_prefix="tmdb")
+# Review batches get their own workers: a batch waiting on page fetches in the
+# shared pool could otherwise hold every worker and block them
+_REVIEWS_POOL = ThreadPoolExecutor(max_workers=TMDB_MAX_CONCURRENCY, thread_name_prefix="tmdb-reviews")
+
+# Shared rate limiters and circuit breakers per upstream. TMDb allows roughly 50
+# requests per second; SerpAPI is billed per search. To override settings for
+# one tool, configure a guard under its name, e.g. configure_guard("get_showtimes", ...).
+# Only the tools decorated with @guard_scope below can be overridden.
+configure_guard("tmdb", rate=40, capacity=20, failure_threshold=5, reset_timeout=30)
+configure_guard("serpapi", rate=1, capacity=5, failure_threshold=3, reset_timeout=60)
+
+class ErrorResult(str):
+    """An error message for the model. Returned to the caller but never cached"""
 
 # Global cache dictionary
 # Structure: {
@@ -10,47 +38,175 @@ from typing import Dict, Any, Callable
 # }
 _CACHE: Dict[str, Any] = {}
 
-def memoize_api_call():
+# Expiry time (time.monotonic) per cache key; keys without one never go stale
+_CACHE_EXPIRES: Dict[str, float] = {}
+
+# Keys with an API call in progress, so concurrent callers (e.g. a prefetch and
+# the model's own function call) share one request
+_IN_FLIGHT: Dict[str, threading.Event] = {}
+_CACHE_LOCK = threading.Lock()
+
+# Keys filled by a prefetch that no real call has read yet, mapped to the
+# callback to notify when one does
+_PREFETCHED: Dict[str, Callable[[str], None]] = {}
+
+def _cache_key(func_name: str, args: tuple, kwargs: dict) -> str:
+    return f"{func_name}:{str(args)}:{str(kwargs)}"
+
+def _is_fresh(cache_key: str) -> bool:
+    return cache_key in _CACHE and _CACHE_EXPIRES.get(cache_key, float("inf")) > time.monotonic()
+
+def _cache_hit(cache_key: str) -> Any:
+    print(f"[CACHE DEBUG] ✓ Cache hit! Returning cached result")
+    on_prefetch_hit = _PREFETCHED.pop(cache_key, None)
+    if on_prefetch_hit is not None:
+        on_prefetch_hit(cache_key)
+    return _CACHE[cache_key]
+
+def memoize_api_call(ttl: float | None = None):
     """
     Decorator to memoize API calls
+
+    Args:
+        ttl: Seconds before an entry goes stale, or None to keep it forever. Stale
+            entries are still served when the upstream's guard rejects the call
+            (circuit open or rate limited).
     """
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Create a cache key from function name and arguments
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
+            cache_key = _cache_key(func.__name__, args, kwargs)
             print(f"\n[CACHE DEBUG] Looking for key: {cache_key}")
             
-            # Return cached result if it exists
-            if cache_key in _CACHE:
-                print(f"[CACHE DEBUG] ✓ Cache hit! Returning cached result")
-                return _CACHE[cache_key]
+            with _CACHE_LOCK:
+                # Return cached result if it exists
+                if _is_fresh(cache_key):
+                    return _cache_hit(cache_key)
+                in_flight = _IN_FLIGHT.get(cache_key)
+                if in_flight is None:
+                    _IN_FLIGHT[cache_key] = threading.Event()
+            
+            # Another caller is already fetching this key, wait for its result
+            if in_flight is not None:
+                print(f"[CACHE DEBUG] … Request in flight. Waiting for its result")
+                in_flight.wait()
+                with _CACHE_LOCK:
+                    if cache_key in _CACHE:
+                        return _cache_hit(cache_key)
+                return func(*args, **kwargs)
             
             # If no cache, call the function and cache result
             print(f"[CACHE DEBUG] ✗ Cache miss. Calling API and caching result")
-            result = func(*args, **kwargs)
-            _CACHE[cache_key] = result
-            return result
+            try:
+                result = func(*args, **kwargs)
+                if not isinstance(result, ErrorResult):
+                    _CACHE[cache_key] = result
+                    if ttl is not None:
+                        _CACHE_EXPIRES[cache_key] = time.monotonic() + ttl
+                return result
+            except GuardRejectedError as e:
+                if cache_key not in _CACHE:
+                    raise
+                print(f"[CACHE DEBUG] ⚠ {e}. Serving stale result")
+                return _CACHE[cache_key]
+            finally:
+                with _CACHE_LOCK:
+                    _IN_FLIGHT.pop(cache_key).set()
         return wrapper
     return decorator
 
-@memoize_api_call()
-def get_now_playing_movies():
-    url = "https://api.themoviedb.org/3/movie/now_playing?language=en-US&page=1"
+def prefetch(func: Callable, *args, on_hit: Callable[[str], None] | None = None) -> bool:
+    """Warm the cache for func(*args) ahead of an actual call.
+    
+    Args:
+        func: A memoized API function from this module
+        args: Positional arguments, exactly as the agent will pass them
+        on_hit: Called with the cache key when a later real call reads the prefetched entry
+        
+    Returns:
+        True if an API call was made, False if the entry was already cached or in flight
+    """
+    cache_key = _cache_key(func.__name__, args, {})
+    with _CACHE_LOCK:
+        if _is_fresh(cache_key) or cache_key in _IN_FLIGHT:
+            return False
+        # Register before fetching so a caller waiting on the in-flight request
+        # is counted as a prefetch hit
+        if on_hit is not None:
+            _PREFETCHED[cache_key] = on_hit
+    try:
+        func(*args)
+    except Exception:
+        with _CACHE_LOCK:
+            _PREFETCHED.pop(cache_key, None)
+        raise
+    return True
+
+@memoize_api_call(ttl=3600)
+@guarded("tmdb")
+def fetch_tmdb_page(path, page=1):
+    """Fetch one page of a paginated TMDb endpoint and return the JSON body"""
+    url = f"{TMDB_BASE_URL}{path}?language=en-US&page={page}"
     headers = {
+        "accept": "application/json",
         "Authorization": f"Bearer {os.getenv('TMDB_API_ACCESS_TOKEN')}"
     }
-    response = requests.get(url, headers=headers)
-    
+    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+
     if response.status_code != 200:
-        return f"Error fetching data: {response.status_code} - {response.reason}"
+        raise APIError(response.status_code, response.reason)
+
+    return response.json()
+
+def fetch_remaining_pages(path, total_pages, on_page: Callable[[List[dict]], None]) -> List[Future]:
+    """Fetch pages 2..total_pages concurrently in the background.
     
-    data = response.json()
+    Args:
+        path: TMDb endpoint path, e.g. "/movie/now_playing"
+        total_pages: total_pages reported by the first page (capped at TMDB_MAX_PAGES)
+        on_page: Called with each page's results as soon as that page arrives
+        
+    Returns:
+        Futures for the pending pages, in page order
+    """
+    def fetch(page):
+        results = fetch_tmdb_page(path, page).get('results', [])
+        on_page(results)
+        return results
+
+    def log_failure(future: Future):
+        if future.exception() is not None:
+            print(f"[PAGINATION DEBUG] Failed to fetch page of {path}: {future.exception()}")
+
+    futures = []
+    for page in range(2, min(int(total_pages or 1), TMDB_MAX_PAGES) + 1):
+        # Carry the caller's guard scope over to the worker thread
+        future = _TMDB_POOL.submit(contextvars.copy_context().run, fetch, page)
+        future.add_done_callback(log_failure)
+        futures.append(future)
+    return futures
+
+@memoize_api_call(ttl=3600)
+@guard_scope
+def get_now_playing_movies():
+    try:
+        data = fetch_tmdb_page("/movie/now_playing", 1)
+    except APIError as e:
+        return ErrorResult(f"Error fetching data: {e.status_code} - {e.reason}")
 
     movies = data.get('results', [])
     if not movies:
         return "No movies are currently playing."
 
+    # Return the first page now; later pages fill in the store as they arrive
+    STORE.add_movies(movies, now_playing=True)
+    fetch_remaining_pages(
+        "/movie/now_playing",
+        data.get('total_pages'),
+        lambda results: STORE.add_movies(results, now_playing=True, append=True)
+    )
+
     formatted_movies = "The TMDb API returned these movies:\n\n"
 
     for movie in movies:
@@ -67,7 +223,18 @@ def get_now_playing_movies():
 
     return formatted_movies
 
-@memoize_api_call()
+@guarded("serpapi")
+def search_google(params):
+    """Run a SerpAPI Google search and return the results dict"""
+    results = GoogleSearch(params).get_dict()
+    if 'error' in results and "hasn't returned any results" not in results['error']:
+        # SerpAPI reports quota, auth and upstream failures in the body
+        status_code = 429 if 'run out of searches' in results['error'] else 502
+        raise APIError(status_code, results['error'])
+    return results
+
+@memoize_api_call(ttl=900)
+@guard_scope
 def get_showtimes(title, location):
     params = {
         "api_key": os.getenv('SERP_API_KEY'),
@@ -79,8 +246,10 @@ def get_showtimes(title, location):
         "hl": "en"
     }
 
-    search = GoogleSearch(params)
-    results = search.get_dict()
+    try:
+        results = search_google(params)
+    except APIError as e:
+        return ErrorResult(f"Error fetching showtimes: {e.reason}")
 
     if 'showtimes' not in results:
         return f"No showtimes found for {title} in {location}."
@@ -107,19 +276,25 @@ def get_showtimes(title, location):
 def buy_ticket(theater, movie, showtime):
     return f"Ticket purchased for {movie} at {theater} for {showtime}."
 
-@memoize_api_call()
+@memoize_api_call(ttl=3600)
+@guard_scope
 def get_reviews(movie_id):
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}/reviews?language=en-US&page=1"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {os.getenv('TMDB_API_ACCESS_TOKEN')}"
-    }
-    response = requests.get(url, headers=headers)
-    reviews_data = response.json()
+    path = f"/movie/{movie_id}/reviews"
+    try:
+        reviews_data = fetch_tmdb_page(path, 1)
+    except APIError as e:
+        return ErrorResult(f"Error fetching reviews: {e.status_code} - {e.reason}")
 
     if 'results' not in reviews_data or not reviews_data['results']:
         return "No reviews found."
 
+    STORE.add_reviews(movie_id, reviews_data['results'])
+    fetch_remaining_pages(
+        path,
+        reviews_data.get('total_pages'),
+        lambda results: STORE.add_reviews(movie_id, results)
+    )
+
     formatted_reviews = ""
     for review in reviews_data['results']:
         author = review.get('author', 'N/A')
@@ -139,19 +314,98 @@ def get_reviews(movie_id):
 
     return formatted_reviews
 
+def get_now_playing_summary():
+    """Compact list of now-playing movies: one line per movie, without overviews"""
+    result = get_now_playing_movies()
+    movies = STORE.now_playing()
+    if not movies:
+        return result
+
+    lines = [f"- {movie.title} (ID {movie.id}, released {movie.release_date or 'N/A'})" for movie in movies]
+    return "Movies currently playing:\n" + "\n".join(lines)
+
+def find_movies(title, limit=3):
+    """Look up movies by title in the local store, fetching now-playing data if it's empty"""
+    if not STORE.now_playing():
+        get_now_playing_movies()
+
+    matches = STORE.search(title, limit=limit)
+    if not matches:
+        return f"No movie found matching \"{title}\"."
+
+    formatted_movies = ""
+    for movie in matches:
+        formatted_movies += (
+            f"**Title:** {movie.title}\n"
+            f"**Movie ID:** {movie.id}\n"
+            f"**Release Date:** {movie.release_date or 'N/A'}\n"
+            f"**Overview:** {movie.overview or 'N/A'}\n\n"
+        )
+    return formatted_movies
+
+def get_review_summary(movie_id, top_k=3):
+    """Review aggregate plus the top_k most informative review excerpts for a movie"""
+    result = get_reviews(str(movie_id))
+    aggregate = STORE.review_aggregate(movie_id)
+    if aggregate is None:
+        return result
+
+    average = f"{aggregate.average_rating}/10" if aggregate.average_rating is not None else "N/A"
+    formatted_reviews = (
+        f"**Reviews:** {aggregate.count} ({aggregate.rated_count} rated)\n"
+        f"**Average Rating:** {average}\n"
+    )
+    if aggregate.rated_count:
+        formatted_reviews += f"**Rating Range:** {aggregate.min_rating} - {aggregate.max_rating}\n"
+    formatted_reviews += "----------------------------------------\n"
+
+    for review in STORE.top_reviews(movie_id, k=int(top_k)):
+        rating = review.rating if review.rating is not None else 'N/A'
+        formatted_reviews += (
+            f"**Author:** {review.author}\n"
+            f"**Rating:** {rating}\n"
+            f"**Excerpt:** {review.excerpt}\n"
+            f"**Created At:** {review.created_at or 'N/A'}\n"
+            "----------------------------------------\n"
+        )
+    return formatted_reviews
+
+def get_reviews_batch(movie_ids, top_k=2):
+    """Fetch reviews for several movies concurrently and return a summary for each"""
+    futures = {
+        str(movie_id): _REVIEWS_POOL.submit(get_review_summary, str(movie_id), top_k)
+        for movie_id in movie_ids
+    }
+
+    formatted_reviews = ""
+    for movie_id, future in futures.items():
+        try:
+            summary = future.result()
+        except Exception as e:
+            summary = f"Error fetching reviews: {str(e)}\n"
+        formatted_reviews += f"## Movie ID {movie_id}\n{summary}\n"
+    return formatted_reviews
+
 def clear_cache():
     """Clear the entire API cache"""
     global _CACHE
     _CACHE = {}
+    _CACHE_EXPIRES.clear()
+    _PREFETCHED.clear()
+    STORE.clear()
 
 def clear_cache_for_function(function_name: str):
     """Clear cache entries for a specific function"""
     global _CACHE
     _CACHE = {k: v for k, v in _CACHE.items() if not k.startswith(f"{function_name}:")}
+    for key in [k for k in _CACHE_EXPIRES if k.startswith(f"{function_name}:")]:
+        del _CACHE_EXPIRES[key]
+    for key in [k for k in _PREFETCHED if k.startswith(f"{function_name}:")]:
+        del _PREFETCHED[key]
 
 def print_cache_status():
     """Print the current contents of the cache"""
     print("\n[CACHE STATUS]")
     print(f"Total cached items: {len(_CACHE)}")
     for key in _CACHE:
-        print(f"- {key}")
+        print(f"- {key}{'' if _is_fresh(key) else ' (stale)'}")
@@ -0,0 +1,143 @@
+import re
+import threading
+from typing import Dict, List
+
+import movie_functions
+from movie_store import STORE
+
+NOW_PLAYING_KEYWORDS = ("now playing", "in theaters", "in theatres", "playing", "showing", "out now")
+SHOWTIME_KEYWORDS = ("showtime", "show time", "tickets", "what time", "when is", "where can i")
+REVIEW_KEYWORDS = ("review", "critic", "rating", "rated", "worth watching", "any good")
+
+# "in Boston, MA", "near San Francisco", "around Austin"
+LOCATION_PATTERN = re.compile(r"\b(?:in|near|around)\s+([A-Z][\w.'-]*(?:(?:\s+|,\s*)[A-Z][\w.'-]*)*)")
+MOVIE_ID_PATTERN = re.compile(r"\b(?:movie\s*)?id[\s:#]*(\d+)\b", re.IGNORECASE)
+
+class MoviePrefetcher:
+    """Warms the movie_functions cache from cheap heuristics on the latest user message.
+
+    One prefetcher is shared by the agents of a session (BaseAgent passes it to
+    delegated agents), so the budget and metrics cover a single session.
+    Prefetching is best effort: a wrong guess only costs the API call, and the
+    agent's own function calls still go through the normal cache.
+    """
+
+    def __init__(self, budget: int = 10):
+        """Initialize the prefetcher.
+
+        Args:
+            budget: Maximum number of prefetch API calls for the session
+        """
+        self.budget = budget
+        self.issued = 0
+        self.hits = 0
+        self.skipped_budget = 0
+        self._lock = threading.Lock()
+
+    def run(self, messages: list) -> List[str]:
+        """Prefetch data for the latest user message. Blocking; run it in a thread.
+
+        Args:
+            messages: The conversation history
+
+        Returns:
+            Descriptions of the prefetches that were issued
+        """
+        message = latest_user_text(messages)
+        return self.prefetch_for(message) if message else []
+
+    def prefetch_for(self, message: str) -> List[str]:
+        """Prefetch data the model is likely to ask for in response to a message.
+
+        Args:
+            message: Text of the user message
+
+        Returns:
+            Descriptions of the prefetches that were issued
+        """
+        issued = []
+        text = message.lower()
+
+        wants_now_playing = any(keyword in text for keyword in NOW_PLAYING_KEYWORDS)
+        wants_showtimes = any(keyword in text for keyword in SHOWTIME_KEYWORDS)
+        wants_reviews = any(keyword in text for keyword in REVIEW_KEYWORDS)
+
+        # Titles are matched against the now-playing index, so fetch it first
+        # whenever anything title-based might be needed
+        if wants_now_playing or ((wants_showtimes or wants_reviews) and not STORE.now_playing()):
+            if self._prefetch(movie_functions.get_now_playing_movies):
+                issued.append("get_now_playing_movies()")
+
+        titles = self._match_titles(text)
+
+        if wants_showtimes:
+            location = self._match_location(message)
+            if location:
+                for title in titles:
+                    if self._prefetch(movie_functions.get_showtimes, title, location):
+                        issued.append(f"get_showtimes({title!r}, {location!r})")
+
+        if wants_reviews:
+            movie_ids = [str(movie_id) for movie_id in titles.values()]
+            movie_ids += [m for m in MOVIE_ID_PATTERN.findall(message) if m not in movie_ids]
+            for movie_id in movie_ids:
+                if self._prefetch(movie_functions.get_reviews, movie_id):
+                    issued.append(f"get_reviews({movie_id!r})")
+
+        if issued:
+            print(f"[PREFETCH DEBUG] Issued: {', '.join(issued)}")
+        return issued
+
+    def stats(self) -> Dict[str, float]:
+        """Return prefetch metrics for the session."""
+        with self._lock:
+            return {
+                "issued": self.issued,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.issued if self.issued else 0.0,
+                "skipped_budget": self.skipped_budget,
+                "budget_remaining": self.budget - self.issued,
+            }
+
+    def _prefetch(self, func, *args) -> bool:
+        with self._lock:
+            if self.issued >= self.budget:
+                self.skipped_budget += 1
+                return False
+            self.issued += 1
+        try:
+            fetched = movie_functions.prefetch(func, *args, on_hit=self._record_hit)
+        except Exception as e:
+            print(f"[PREFETCH DEBUG] Prefetch failed: {str(e)}")
+            fetched = False
+        if not fetched:
+            # Already cached or in flight, or failed: don't charge the budget
+            with self._lock:
+                self.issued -= 1
+        return fetched
+
+    def _record_hit(self, cache_key: str):
+        with self._lock:
+            self.hits += 1
+        print(f"[PREFETCH DEBUG] ✓ Prefetch hit: {cache_key}")
+
+    @staticmethod
+    def _match_titles(text: str) -> Dict[str, int]:
+        """Return now-playing titles mentioned in the text, mapped to their movie IDs."""
+        return STORE.match_titles(text)
+
+    @staticmethod
+    def _match_location(message: str) -> str | None:
+        match = LOCATION_PATTERN.search(message)
+        return match.group(1).rstrip(",.") if match else None
+
+def latest_user_text(messages: list) -> str:
+    """Extract the text of the most recent user message."""
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, list):
+            return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        return content or ""
+    return ""
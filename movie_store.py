@@ -0,0 +1,231 @@
+import difflib
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+# Review content kept per record; the full text stays with TMDb
+REVIEW_EXCERPT_CHARS = 600
+
+@dataclass(slots=True)
+class MovieRecord:
+    id: int
+    title: str
+    release_date: str = ""
+    overview: str = ""
+
+@dataclass(slots=True)
+class ReviewRecord:
+    author: str
+    rating: Optional[float]
+    excerpt: str
+    content_length: int
+    created_at: str = ""
+    url: str = ""
+
+@dataclass(slots=True)
+class ReviewAggregate:
+    count: int = 0
+    rated_count: int = 0
+    average_rating: Optional[float] = None
+    min_rating: Optional[float] = None
+    max_rating: Optional[float] = None
+    latest: str = ""
+
+@dataclass(slots=True)
+class _MovieReviews:
+    reviews: List[ReviewRecord] = field(default_factory=list)
+    aggregate: ReviewAggregate = field(default_factory=ReviewAggregate)
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class MovieStore:
+    """In-memory store of compact movie and review records.
+
+    Records are filled in by movie_functions as API responses arrive, so lookups
+    by title and per-movie review summaries don't need another round trip.
+    """
+
+    def __init__(self):
+        self._movies: Dict[int, MovieRecord] = {}
+        self._now_playing: List[int] = []
+        self._reviews: Dict[int, _MovieReviews] = {}
+        # Title token -> IDs of movies whose title contains it
+        self._title_index: Dict[str, Set[int]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add_movies(self, movies: List[dict], now_playing: bool = False, append: bool = False) -> List[MovieRecord]:
+        """Store movies from a TMDb API response.
+
+        Args:
+            movies: Raw movie objects from the TMDb API
+            now_playing: Whether these are the current now-playing results
+            append: Add to the now-playing list (a later page) instead of replacing it
+
+        Returns:
+            The stored records, in response order
+        """
+        records = []
+        with self._lock:
+            for movie in movies:
+                if not movie.get('id') or not movie.get('title'):
+                    continue
+                record = MovieRecord(
+                    id=int(movie['id']),
+                    title=movie['title'],
+                    release_date=movie.get('release_date') or "",
+                    overview=movie.get('overview') or "",
+                )
+                self._movies[record.id] = record
+                for token in _tokens(record.title):
+                    self._title_index[token].add(record.id)
+                records.append(record)
+            if now_playing and append:
+                known = set(self._now_playing)
+                self._now_playing.extend(record.id for record in records if record.id not in known)
+            elif now_playing:
+                self._now_playing = [record.id for record in records]
+        return records
+
+    def add_reviews(self, movie_id, reviews: List[dict]) -> ReviewAggregate:
+        """Store reviews from a TMDb API response and update the movie's aggregate.
+
+        Args:
+            movie_id: TMDb movie ID
+            reviews: Raw review objects from the TMDb API
+
+        Returns:
+            The updated review aggregate for the movie
+        """
+        records = []
+        for review in reviews:
+            content = review.get('content') or ""
+            rating = (review.get('author_details') or {}).get('rating')
+            records.append(ReviewRecord(
+                author=review.get('author') or "N/A",
+                rating=float(rating) if rating is not None else None,
+                excerpt=content[:REVIEW_EXCERPT_CHARS].rstrip() + ("…" if len(content) > REVIEW_EXCERPT_CHARS else ""),
+                content_length=len(content),
+                created_at=review.get('created_at') or "",
+                url=review.get('url') or "",
+            ))
+
+        with self._lock:
+            entry = self._reviews.setdefault(int(movie_id), _MovieReviews())
+            known = {(r.author, r.created_at) for r in entry.reviews}
+            entry.reviews.extend(r for r in records if (r.author, r.created_at) not in known)
+            entry.aggregate = self._aggregate(entry.reviews)
+            return entry.aggregate
+
+    def get_movie(self, movie_id) -> Optional[MovieRecord]:
+        with self._lock:
+            return self._movies.get(int(movie_id))
+
+    def now_playing(self) -> List[MovieRecord]:
+        with self._lock:
+            return [self._movies[movie_id] for movie_id in self._now_playing]
+
+    def has_reviews(self, movie_id) -> bool:
+        with self._lock:
+            return int(movie_id) in self._reviews
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.5) -> List[MovieRecord]:
+        """Find movies by title, tolerating typos and partial titles.
+
+        Args:
+            query: Title or part of a title
+            limit: Maximum number of results
+            min_score: Minimum match score between 0 and 1
+
+        Returns:
+            Matching records, best match first
+        """
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            vocabulary = list(self._title_index)
+            candidates: Set[int] = set()
+            for token in query_tokens:
+                for match in difflib.get_close_matches(token, vocabulary, n=3, cutoff=0.75):
+                    candidates |= self._title_index[match]
+            movies = [self._movies[movie_id] for movie_id in candidates]
+
+        scored = []
+        for movie in movies:
+            title_tokens = set(_tokens(movie.title))
+            overlap = sum(
+                1 for token in query_tokens
+                if token in title_tokens or difflib.get_close_matches(token, title_tokens, n=1, cutoff=0.75)
+            ) / len(query_tokens)
+            ratio = difflib.SequenceMatcher(None, query.lower(), movie.title.lower()).ratio()
+            score = (overlap + ratio) / 2
+            if score >= min_score:
+                scored.append((score, movie))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [movie for _, movie in scored[:limit]]
+
+    def match_titles(self, text: str) -> Dict[str, int]:
+        """Return now-playing titles mentioned verbatim in free text, mapped to movie IDs."""
+        text = text.lower()
+        return {
+            movie.title: movie.id
+            for movie in self.now_playing()
+            if re.search(rf"\b{re.escape(movie.title.lower())}\b", text)
+        }
+
+    def review_aggregate(self, movie_id) -> Optional[ReviewAggregate]:
+        with self._lock:
+            entry = self._reviews.get(int(movie_id))
+            return entry.aggregate if entry else None
+
+    def top_reviews(self, movie_id, k: int = 3) -> List[ReviewRecord]:
+        """Pick up to k reviews giving a balanced view of the movie.
+
+        Rated reviews alternate from the highest and lowest rating, followed by
+        the most recent unrated ones.
+
+        Args:
+            movie_id: TMDb movie ID
+            k: Maximum number of reviews
+        """
+        with self._lock:
+            entry = self._reviews.get(int(movie_id))
+            reviews = list(entry.reviews) if entry else []
+
+        rated = sorted((r for r in reviews if r.rating is not None), key=lambda r: r.rating, reverse=True)
+        unrated = sorted((r for r in reviews if r.rating is None), key=lambda r: r.created_at, reverse=True)
+
+        picked = []
+        while rated and len(picked) < k:
+            picked.append(rated.pop(0))
+            if rated and len(picked) < k:
+                picked.append(rated.pop())
+        picked.extend(unrated[:k - len(picked)])
+        return picked
+
+    def clear(self):
+        with self._lock:
+            self._movies.clear()
+            self._now_playing.clear()
+            self._reviews.clear()
+            self._title_index.clear()
+
+    @staticmethod
+    def _aggregate(reviews: List[ReviewRecord]) -> ReviewAggregate:
+        ratings = [r.rating for r in reviews if r.rating is not None]
+        return ReviewAggregate(
+            count=len(reviews),
+            rated_count=len(ratings),
+            average_rating=round(sum(ratings) / len(ratings), 1) if ratings else None,
+            min_rating=min(ratings) if ratings else None,
+            max_rating=max(ratings) if ratings else None,
+            latest=max((r.created_at for r in reviews), default=""),
+        )
+
+# Shared store, filled in by movie_functions
+STORE = MovieStore()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+
+class ServerStats:
+    """Samples the worker's event loop lag, CPU time and memory into a JSON lines file.
+
+    A task sleeps for `interval` in a loop; how much later than asked it wakes
+    up is the loop's lag. Every `report_every` seconds, the lag of the samples
+    since the last line is written along with the process's CPU seconds and
+    resident memory. benchmarks/load_test.py reads the file.
+    """
+
+    def __init__(self, path: str, interval: float = 0.05, report_every: float = 1.0):
+        """Initialize the sampler. It starts with start(), from inside the worker's event loop.
+
+        Args:
+            path: JSON lines file to append samples to
+            interval: Seconds between lag samples
+            report_every: Seconds between lines
+        """
+        self.path = path
+        self.interval = interval
+        self.report_every = report_every
+        self._task = None
+
+    def start(self) -> None:
+        """Start sampling on the running loop, once."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        lags = []
+        last_report = time.monotonic()
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lags.append(max(now - before - self.interval, 0.0))
+            if now - last_report >= self.report_every:
+                self._write(lags)
+                lags = []
+                last_report = now
+
+    def _write(self, lags: list) -> None:
+        lags.sort()
+        sample = {
+            "time": time.time(),
+            "lag_ms_p50": lags[len(lags) // 2] * 1000,
+            "lag_ms_p99": lags[min(int(len(lags) * 0.99), len(lags) - 1)] * 1000,
+            "lag_ms_max": lags[-1] * 1000,
+            "cpu_seconds": time.process_time(),
+            "rss_bytes": current_rss(),
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(sample) + "\n")
+
+def current_rss() -> int:
+    """Resident memory of this process in bytes (the peak, where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
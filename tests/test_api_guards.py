@@ -0,0 +1,129 @@
+import pytest
+
+import api_guards
+from api_guards import (
+    APIError,
+    CircuitBreaker,
+    CircuitOpenError,
+    TokenBucket,
+    configure_guard,
+    guard_for,
+    guard_scope,
+    guarded,
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture(autouse=True)
+def restore_guards():
+    saved = dict(api_guards._GUARDS)
+    yield
+    api_guards._GUARDS.clear()
+    api_guards._GUARDS.update(saved)
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    # Refill stops at capacity
+    clock.now += 10
+    assert bucket.available() == 3
+
+def test_token_bucket_acquire_waits_then_gives_up(clock):
+    bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+    assert bucket.acquire(max_wait=0.5) is None
+    assert clock.slept == [pytest.approx(1.0)]
+
+def test_circuit_breaker_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == pytest.approx(30)
+
+    clock.now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # One trial call at a time
+    assert breaker.allow() == 0
+    assert breaker.allow() > 0
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() == 0
+    assert breaker.times_opened == 1
+
+def test_circuit_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow() == 0
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == pytest.approx(10)
+    assert breaker.times_opened == 2
+
+def test_guard_opens_on_upstream_failures(clock):
+    guard = configure_guard("upstream", rate=10, capacity=10, failure_threshold=2,
+                            reset_timeout=5, clock=clock, sleep=clock.sleep)
+
+    def failing():
+        raise APIError(503, "Service Unavailable")
+
+    for _ in range(2):
+        with pytest.raises(APIError):
+            guard.call(failing)
+    with pytest.raises(CircuitOpenError):
+        guard.call(failing)
+
+    clock.now += 5
+    assert guard.call(lambda: "ok") == "ok"
+    assert guard.metrics()["state"] == CircuitBreaker.CLOSED
+
+def test_tool_guard_overrides_upstream_guard(clock):
+    upstream = configure_guard("upstream", rate=10, capacity=10, clock=clock, sleep=clock.sleep)
+    tool = configure_guard("get_listing", rate=10, capacity=10, clock=clock, sleep=clock.sleep)
+
+    @guarded("upstream")
+    def fetch_page():
+        return guard_for("fetch_page", "upstream")
+
+    @guard_scope
+    def get_listing():
+        return fetch_page()
+
+    @guard_scope
+    def get_other_listing():
+        return fetch_page()
+
+    assert get_listing() is tool
+    assert get_other_listing() is upstream
+    assert fetch_page() is upstream
+    assert (tool.calls, upstream.calls) == (1, 2)
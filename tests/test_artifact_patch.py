@@ -0,0 +1,76 @@
+import pytest
+
+from agents.artifact_patch import (
+    PatchConflictError,
+    apply_line_edit,
+    apply_search_replace,
+    apply_unified_diff,
+    check_base_hash,
+    content_hash,
+)
+from agents.implementation_agent import ImplementationAgent
+
+PAGE = "<html>\n<body>\n<h1>Title</h1>\n<p>Intro</p>\n</body>\n</html>\n"
+
+def test_unified_diff_applies_with_shifted_line_numbers():
+    diff = "@@ -5,2 +5,2 @@\n <body>\n-<h1>Title</h1>\n+<h1>New title</h1>\n"
+    assert apply_unified_diff(PAGE, diff) == PAGE.replace("Title", "New title")
+
+def test_unified_diff_with_unmatched_context_conflicts():
+    with pytest.raises(PatchConflictError, match="hunk 1 does not match"):
+        apply_unified_diff(PAGE, "@@ -2,1 +2,1 @@\n-<body class='x'>\n+<body>\n")
+    with pytest.raises(PatchConflictError, match="no @@ hunks"):
+        apply_unified_diff(PAGE, "-<body>\n+<main>\n")
+
+def test_search_replace_needs_exactly_one_anchor():
+    assert apply_search_replace(PAGE, "<p>Intro</p>", "<p>Hi</p>") == PAGE.replace("Intro", "Hi")
+    with pytest.raises(PatchConflictError, match="not found"):
+        apply_search_replace(PAGE, "<p>Missing</p>", "")
+    with pytest.raises(PatchConflictError, match="found 2 times"):
+        apply_search_replace(PAGE, "html>", "")
+    with pytest.raises(PatchConflictError, match="empty"):
+        apply_search_replace(PAGE, "", "x")
+
+def test_line_edit_replaces_and_inserts():
+    assert apply_line_edit(PAGE, 3, 3, "<h1>New</h1>") == PAGE.replace("Title", "New")
+    assert apply_line_edit(PAGE, 4, 3, "<hr>\n") == PAGE.replace("<p>", "<hr>\n<p>")
+
+@pytest.mark.parametrize("start, end", [(0, 1), (6, 7), (3, 1), (8, 8)])
+def test_line_range_outside_the_file_conflicts(start, end):
+    with pytest.raises(PatchConflictError, match="outside the artifact's 6 lines"):
+        apply_line_edit(PAGE, start, end, "x")
+
+def test_stale_base_hash_conflicts():
+    check_base_hash(PAGE, content_hash(PAGE))
+    check_base_hash(PAGE, "")
+    with pytest.raises(PatchConflictError, match="has changed since hash"):
+        check_base_hash(PAGE, content_hash("older contents"))
+
+@pytest.fixture
+def agent(tmp_path):
+    agent = ImplementationAgent(litellm_model="fake/model")
+    agent.artifacts_dir = str(tmp_path)
+    (tmp_path / "index.html").write_text(PAGE)
+    return agent
+
+def test_agent_rejects_edits_against_a_stale_hash(agent, tmp_path):
+    stale = content_hash("an older version")
+    result = agent.replaceInArtifact("index.html", "Intro", "Hi", base_hash=stale)
+
+    assert result.startswith("Failed to patch artifact index.html: conflict")
+    assert (tmp_path / "index.html").read_text() == PAGE
+
+def test_agent_accepts_content_edits_against_the_hash_before_its_own_edits(agent, tmp_path):
+    base = content_hash(PAGE)
+    assert agent.replaceInArtifact("index.html", "Intro", "Hi", base_hash=base).startswith("Successfully")
+    assert agent.replaceInArtifact("index.html", "Title", "Welcome", base_hash=base).startswith("Successfully")
+    # Line numbers need the exact current version
+    assert "conflict" in agent.editArtifactLines("index.html", 1, 1, "<html lang='en'>", base_hash=base)
+
+    # Someone else's write invalidates the chain
+    (tmp_path / "index.html").write_text(PAGE.replace("Intro", "Theirs"))
+    assert "conflict" in agent.replaceInArtifact("index.html", "Theirs", "Hey", base_hash=base)
+
+def test_line_edit_without_hash_edits_the_current_file(agent, tmp_path):
+    assert agent.editArtifactLines("index.html", 3, 3, "<h1>New</h1>").startswith("Successfully")
+    assert (tmp_path / "index.html").read_text() == PAGE.replace("Title", "New")
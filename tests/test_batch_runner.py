@@ -0,0 +1,43 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+from batch_runner import run_batch
+
+def chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+
+async def finish(model, messages, stream=True, **kwargs):
+    async def stream_chunks():
+        yield chunk("The page is built.")
+    return stream_chunks()
+
+def mockups(directory, *names):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name in names:
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG")
+        paths.append(path)
+    return paths
+
+def test_mockups_differing_only_in_extension_get_their_own_jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(litellm, "acompletion", finish)
+    images = mockups(str(tmp_path / "mockups"), "mock.jpg", "mock.png")
+
+    report = asyncio.run(run_batch(images, str(tmp_path / "runs")))
+
+    jobs = report["jobs"]
+    assert [job["job_id"] for job in jobs] == ["mock.jpg", "mock.png"]
+    assert len({job["workspace"] for job in jobs}) == 2
+    assert all(os.path.exists(os.path.join(job["workspace"], "events.jsonl")) for job in jobs)
+
+def test_images_with_the_same_job_id_are_rejected(tmp_path):
+    images = mockups(str(tmp_path / "a"), "mock.png") + mockups(str(tmp_path / "b"), "mock.png")
+
+    with pytest.raises(ValueError, match="same job id 'mock.png'"):
+        asyncio.run(run_batch(images, str(tmp_path / "runs")))
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+from chainlit_ui import ChainlitUI
+
+async def tokens(schedule):
+    """Yield each token after its delay in seconds."""
+    for delay, token in schedule:
+        await asyncio.sleep(delay)
+        yield token
+
+async def coalesced(ui: ChainlitUI, schedule) -> list:
+    """Return (seconds since start, chunk) for each chunk _coalesce yields."""
+    started = time.monotonic()
+    return [(time.monotonic() - started, chunk) async for chunk in ui._coalesce(tokens(schedule))]
+
+def test_tokens_within_an_interval_are_joined():
+    ui = ChainlitUI(flush_interval=0.2)
+    chunks = asyncio.run(coalesced(ui, [(0, "a"), (0.01, "b"), (0.01, "c")]))
+
+    assert [chunk for _, chunk in chunks] == ["a", "bc"]
+
+def test_buffered_tokens_flush_when_the_interval_ends():
+    ui = ChainlitUI(flush_interval=0.1)
+    # "b" arrives just after "a", then the stream stalls before "c"
+    chunks = asyncio.run(coalesced(ui, [(0, "a"), (0.01, "b"), (0.5, "c")]))
+
+    assert [chunk for _, chunk in chunks] == ["a", "b", "c"]
+    flushed_at = chunks[1][0]
+    assert 0.09 <= flushed_at < 0.3
+
+def test_stream_errors_propagate():
+    ui = ChainlitUI(flush_interval=0.1)
+
+    async def failing():
+        yield "a"
+        await asyncio.sleep(0.01)
+        yield "b"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("stream failed")
+
+    async def run():
+        return [chunk async for chunk in ui._coalesce(failing())]
+
+    with pytest.raises(RuntimeError, match="stream failed"):
+        asyncio.run(run())
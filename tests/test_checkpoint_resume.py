@@ -0,0 +1,51 @@
+import asyncio
+
+import litellm
+import pytest
+
+from agents.messages import MessageList
+from agents.supervisor_agent import SupervisorAgent
+from batch_runner import EventLog
+
+CALL = '<function_call>{"name": "saveImage", "arguments": {"filename": "mockup.jpg"}}</function_call>'
+
+def history(*turns) -> MessageList:
+    return MessageList([{"role": "user", "content": "Build the page"}, *turns])
+
+def resume(agent: SupervisorAgent, messages: MessageList, monkeypatch) -> list:
+    """Run react_to and return the models it called."""
+    models = []
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        models.append(model)
+        raise AssertionError("the model should not be called")
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    events = EventLog()
+
+    async def run():
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+    return models
+
+@pytest.mark.parametrize("tag", ["loop_detected", "budget_exceeded"])
+def test_wrap_up_summary_is_not_resumed(monkeypatch, tmp_path, tag):
+    agent = SupervisorAgent(litellm_model="fake/model")
+    agent.artifacts_dir = str(tmp_path)
+    messages = history(
+        {"role": "user", "content": f"<{tag}>Stopping. Do not call functions or delegate.</{tag}>"},
+        {"role": "assistant", "content": f"So far the mockup was saved with {CALL}, the page is left to do."},
+    )
+
+    assert agent._unfinished_turn(messages) is None
+    assert resume(agent, messages, monkeypatch) == []
+    assert len(messages) == 3
+
+def test_turn_with_pending_action_is_resumed(tmp_path):
+    agent = SupervisorAgent(litellm_model="fake/model")
+    agent.artifacts_dir = str(tmp_path)
+    messages = history({"role": "assistant", "content": CALL})
+
+    assert agent._unfinished_turn(messages) == (CALL, 0)
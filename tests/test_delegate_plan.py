@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+
+from agents.messages import MessageList
+from agents.supervisor_agent import SupervisorAgent
+from batch_runner import EventLog
+
+PLAN = (
+    '<delegate_plan>{"tasks": ['
+    '{"id": "hero", "name": "PlanningAgent", "instructions": "Task hero"},'
+    '{"id": "footer", "name": "PlanningAgent", "instructions": "Task footer", "retries": 0}'
+    ']}</delegate_plan>'
+)
+
+def chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+
+class ScriptedProvider:
+    """litellm.acompletion stand-in: the Supervisor submits PLAN, delegated agents finish their task."""
+
+    def __init__(self):
+        self.delegated = []
+        self.fail = set()
+
+    async def __call__(self, model, messages, stream=True, **kwargs):
+        last = messages[-1]["content"]
+        if last.startswith("Task "):
+            self.delegated.append(last)
+            if last in self.fail:
+                raise litellm.ServiceUnavailableError("503 Service Unavailable", llm_provider="fake", model=model)
+            text = f"Finished {last}."
+        elif last.startswith("<delegate_plan_result>"):
+            text = "The page is built."
+        else:
+            text = PLAN
+
+        async def stream_chunks():
+            yield chunk(text)
+        return stream_chunks()
+
+def run_supervisor(artifacts_dir: str, state_dir: str):
+    agent = SupervisorAgent(litellm_model="fake/model")
+    agent.artifacts_dir = artifacts_dir
+    agent.task_state_dir = state_dir
+    events = EventLog()
+
+    async def run():
+        messages = MessageList([{"role": "user", "content": "Build the page"}])
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+
+def test_plan_state_is_scoped_to_the_run(monkeypatch, tmp_path):
+    provider = ScriptedProvider()
+    monkeypatch.setattr(litellm, "acompletion", provider)
+    state_dir = str(tmp_path / "tasks")
+
+    # The first run fails a task, so its plan state is kept for a resubmission
+    provider.fail = {"Task footer"}
+    run_supervisor(str(tmp_path / "a"), state_dir)
+    assert sorted(provider.delegated) == ["Task footer", "Task hero"]
+
+    # Another workspace submitting the same plan runs every task itself
+    provider.delegated.clear()
+    provider.fail = set()
+    run_supervisor(str(tmp_path / "b"), state_dir)
+    assert sorted(provider.delegated) == ["Task footer", "Task hero"]
+
+def test_resubmitted_plan_resumes_in_the_same_run(monkeypatch, tmp_path):
+    provider = ScriptedProvider()
+    monkeypatch.setattr(litellm, "acompletion", provider)
+    state_dir = str(tmp_path / "tasks")
+
+    provider.fail = {"Task footer"}
+    run_supervisor(str(tmp_path / "a"), state_dir)
+
+    provider.delegated.clear()
+    provider.fail = set()
+    run_supervisor(str(tmp_path / "a"), state_dir)
+    assert provider.delegated == ["Task footer"]
+
+WRITE_PLAN = (
+    '<delegate_plan>{"tasks": ['
+    '{"id": "page", "name": "ImplementationAgent", "instructions": "Task page", "retries": 1}'
+    ']}</delegate_plan>'
+)
+
+class WriteThenFailProvider:
+    """The delegated ImplementationAgent writes an artifact, then its provider goes down."""
+
+    def __init__(self):
+        self.delegated = 0
+        self.plan_result = None
+
+    async def __call__(self, model, messages, stream=True, **kwargs):
+        last = messages[-1]["content"]
+        if last == "Task page":
+            self.delegated += 1
+            text = '<function_call>{"name": "updateArtifact", "arguments": {"filename": "index.html", "contents": "<p>v1</p>"}}</function_call>'
+        elif last.startswith("<function_result>"):
+            raise litellm.ServiceUnavailableError("503 Service Unavailable", llm_provider="fake", model=model)
+        elif last.startswith("<delegate_plan_result>"):
+            self.plan_result = last
+            text = "Done."
+        else:
+            text = WRITE_PLAN
+
+        async def stream_chunks():
+            yield chunk(text)
+        return stream_chunks()
+
+def test_retry_does_not_repeat_side_effects_without_a_checkpoint(monkeypatch, tmp_path):
+    provider = WriteThenFailProvider()
+    monkeypatch.setattr(litellm, "acompletion", provider)
+
+    run_supervisor(str(tmp_path / "a"), str(tmp_path / "tasks"))
+
+    assert provider.delegated == 1
+    assert (tmp_path / "a" / "index.html").read_text() == "<p>v1</p>"
+    assert "was not restarted" in provider.plan_result
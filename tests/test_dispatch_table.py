@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+from agents.base_agent import BaseAgent
+from agents.tools import FunctionSpec, build_dispatch_table, side_effecting
+
+class Catalog(BaseAgent):
+    functions = ("get_reviews", "search", "save_note")
+
+    def __init__(self):
+        super().__init__(name="Catalog", system_prompt="", litellm_model="fake/model")
+
+    def get_reviews(self, movie_id: str, top_k: int = 3, rated: bool = False, min_rating: float = 0.0) -> str:
+        return json.dumps([movie_id, top_k, rated, min_rating])
+
+    def search(self, titles: list[int], options: dict = None) -> str:
+        return json.dumps([titles, options])
+
+    @side_effecting
+    def save_note(self, note) -> str:
+        return f"saved {note!r}"
+
+    def _helper(self) -> str:
+        return "private"
+
+def execute(agent, name, arguments):
+    call = json.dumps({"name": name, "arguments": arguments})
+    return asyncio.run(agent._execute_function(call))
+
+def error_of(result: str) -> dict:
+    assert result.startswith("Error: ")
+    return json.loads(result[len("Error: "):])
+
+def test_table_lists_only_the_exposed_functions():
+    table = Catalog._dispatch_table
+    assert list(table) == ["get_reviews", "search", "save_note"]
+    assert table["save_note"].side_effecting and not table["search"].side_effecting
+
+def test_functions_must_name_methods():
+    class Broken:
+        functions = ("missing",)
+
+    with pytest.raises(TypeError, match="'missing'"):
+        build_dispatch_table(Broken)
+
+@pytest.mark.parametrize("arguments, expected", [
+    ({"movie_id": 12}, ["12", 3, False, 0.0]),
+    ({"movie_id": "12", "top_k": "5", "rated": "true", "min_rating": "7.5"}, ["12", 5, True, 7.5]),
+    ({"movie_id": 12.5, "top_k": 2.0, "min_rating": 7}, ["12.5", 2, False, 7.0]),
+])
+def test_arguments_are_coerced_to_the_annotated_types(arguments, expected):
+    assert json.loads(execute(Catalog(), "get_reviews", arguments)) == expected
+
+def test_lists_accept_a_single_item_and_unannotated_parameters_anything():
+    agent = Catalog()
+    assert json.loads(execute(agent, "search", {"titles": "7"})) == [[7], None]
+    assert json.loads(execute(agent, "search", {"titles": [1, "2"], "options": {"a": 1}})) == [[1, 2], {"a": 1}]
+    assert execute(agent, "save_note", {"note": [1]}) == "saved [1]"
+
+def test_invalid_arguments_are_all_reported():
+    error = error_of(execute(Catalog(), "get_reviews", {"top_k": "many", "rated": 1, "extra": 0}))
+    assert error["error"] == "invalid_arguments"
+    assert error["problems"] == [
+        {"arg": "top_k", "problem": "expected integer"},
+        {"arg": "rated", "problem": "expected boolean"},
+        {"arg": "extra", "problem": "unexpected argument"},
+        {"arg": "movie_id", "problem": "missing"},
+    ]
+
+@pytest.mark.parametrize("name", ["_helper", "react_to", "missing"])
+def test_only_table_functions_can_be_called(name):
+    error = error_of(execute(Catalog(), name, {}))
+    assert error == {"error": "unknown_function", "function": name, "available": ["get_reviews", "search", "save_note"]}
+
+def test_spec_checks_single_arguments():
+    spec = FunctionSpec("get_reviews", Catalog.get_reviews)
+    assert spec.check_arg("top_k", "3") is None
+    assert spec.check_arg("top_k", True) == "expected integer"
+    assert spec.check_arg("limit", 3) == "unexpected argument"
+    assert spec.missing({"top_k": 3}) == ["movie_id"]
+    assert spec.bind(["12"]) == ({}, [{"arg": "arguments", "problem": "expected object"}])
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+
+from agents.event_bus import (
+    DELEGATION_END, DELEGATION_START, TAG_END, TAG_START, TOKEN, TOOL_RESULT, BusSink, EventBus
+)
+from agents.messages import MessageList
+from agents.stream_pipeline import StreamPipeline, TagParser
+from agents.supervisor_agent import SupervisorAgent
+from batch_runner import EventLog
+
+def test_subscribers_get_the_kinds_and_paths_they_asked_for():
+    bus = EventBus()
+    everything, results, below_planner = [], [], []
+    bus.subscribe(everything.append)
+    bus.subscribe(results.append, kinds=(TOOL_RESULT,))
+    bus.subscribe(below_planner.append, path=("Supervisor", "Planner:1"))
+
+    bus.publish(TOKEN, ("Supervisor",), None, "Hi")
+    bus.publish(TOOL_RESULT, ("Supervisor", "Planner:1"), "function_result", "ok")
+    bus.publish(TOKEN, ("Supervisor", "Planner:1", "Builder:2"), None, "deep")
+    bus.publish(TOKEN, ("Supervisor", "Planner:10"), None, "sibling")
+
+    assert [event.text for event in everything] == ["Hi", "ok", "deep", "sibling"]
+    assert [(event.kind, event.tag, event.text) for event in results] == [(TOOL_RESULT, "function_result", "ok")]
+    assert [event.text for event in below_planner] == ["ok", "deep"]
+
+def test_unsubscribed_callbacks_get_nothing_and_unheard_events_are_not_built():
+    bus = EventBus()
+    received = []
+    unsubscribe = bus.subscribe(received.append, kinds=(TOKEN,))
+    bus.publish(TOKEN, ("A",), None, "one")
+    unsubscribe()
+    bus.publish(TOKEN, ("A",), None, "two")
+    bus.publish(TAG_START, ("A",), "x", "<x>")
+
+    assert [event.text for event in received] == ["one"]
+    assert bus.published == 1
+
+def test_bus_sink_publishes_parsed_events():
+    bus = EventBus()
+    received = []
+    bus.subscribe(received.append)
+
+    async def tokens():
+        for token in ["Hi <thi", "nk>hmm</think> bye"]:
+            yield token
+
+    async def run():
+        async for _ in StreamPipeline(tokens(), TagParser(), sinks=[BusSink(bus, ("A",))]):
+            pass
+
+    asyncio.run(run())
+    assert [(event.kind, event.tag, event.text) for event in received] == [
+        (TOKEN, None, "Hi "),
+        (TAG_START, "think", "<think>"),
+        (TAG_END, "think", "hmm</think>"),
+        (TOKEN, None, " bye"),
+    ]
+    assert {event.path for event in received} == {("A",)}
+
+def chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+
+def test_delegated_agents_publish_their_own_tokens(monkeypatch):
+    async def acompletion(model, messages, stream=True, **kwargs):
+        last = messages[-1]["content"]
+        if last == "Plan the page":
+            text = "The plan is ready."
+        elif last.startswith("<delegate_agent_result>"):
+            text = "All done."
+        else:
+            text = '<delegate_agent>{"name": "PlanningAgent", "instructions": "Plan the page"}</delegate_agent>'
+
+        async def stream_chunks():
+            yield chunk(text)
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    agent = SupervisorAgent(litellm_model="fake/model")
+    agent.event_bus = EventBus()
+    received = []
+    agent.event_bus.subscribe(received.append)
+    events = EventLog()
+
+    async def run():
+        messages = MessageList([{"role": "user", "content": "Build the page"}])
+        return [token async for token in agent.react_to(
+            messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start
+        )]
+
+    yielded = "".join(asyncio.run(run()))
+
+    planner = ("SupervisorAgent", "PlanningAgent:delegate")
+    planner_tokens = "".join(event.text for event in received if event.kind == TOKEN and event.path == planner)
+    assert planner_tokens == "The plan is ready."
+    # The delegated agent's tokens aren't yielded again through the Supervisor
+    assert "The plan is ready." not in yielded.replace("<delegate_agent_result>The plan is ready.</delegate_agent_result>", "")
+    delegations = [(event.kind, event.text) for event in received if event.kind in (DELEGATION_START, DELEGATION_END)]
+    assert delegations == [(DELEGATION_START, "Plan the page"), (DELEGATION_END, "The plan is ready.")]
@@ -0,0 +1,133 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+from agents.messages import MessageList
+from agents.movie_agent import MovieAgent
+from agents.supervisor_agent import SupervisorAgent
+from agents.tools import StreamingCallParser, build_dispatch_table
+from batch_runner import EventLog
+
+class Functions:
+    functions = ("get_showtimes", "get_reviews")
+
+    def get_showtimes(self, title: str, location: str, days: int = 1) -> str:
+        return ""
+
+    def get_reviews(self, movie_id: int) -> str:
+        return ""
+
+TABLE = build_dispatch_table(Functions)
+
+def feed(*chunks) -> tuple[StreamingCallParser, bool]:
+    parser = StreamingCallParser(TABLE)
+    accepted = all(parser.feed(chunk) for chunk in chunks)
+    return parser, accepted
+
+def error_of(parser: StreamingCallParser) -> dict:
+    assert parser.error.startswith("Error: ")
+    return json.loads(parser.error[len("Error: "):])
+
+def test_valid_call_split_into_small_chunks():
+    text = '<function_call>{"name": "get_showtimes", "arguments": {"title": "Dune \\"Two\\"", "location": "Boston", "days": 2}}</function_call>'
+    parser, accepted = feed(*(text[i:i + 3] for i in range(0, len(text), 3)))
+
+    assert accepted
+    assert parser.close() == {"name": "get_showtimes", "arguments": {"title": 'Dune "Two"', "location": "Boston", "days": 2}}
+    assert parser.error is None
+
+@pytest.mark.parametrize("body", ['["get_showtimes"]', '"get_showtimes"', "42", "null"])
+def test_non_object_call_is_rejected(body):
+    parser, accepted = feed("<function_call>", " " + body, "</function_call>")
+
+    assert not accepted
+    assert parser.close() is None
+    assert error_of(parser)["error"] == "invalid_json"
+    assert "JSON object" in error_of(parser)["problem"]
+
+def test_unknown_function_is_rejected_once_its_name_is_complete():
+    parser, accepted = feed('<function_call>{"name": "buy_popcorn"', ', "arguments": {}}')
+
+    assert not accepted
+    assert parser.name == "buy_popcorn"
+    assert error_of(parser)["error"] == "unknown_function"
+    assert error_of(parser)["available"] == ["get_showtimes", "get_reviews"]
+
+def test_bad_argument_type_is_rejected_while_streaming():
+    parser = StreamingCallParser(TABLE)
+    assert parser.feed('<function_call>{"name": "get_reviews", "arguments": {"movie_id": ')
+    assert not parser.feed('"not a number", ')
+
+    assert error_of(parser)["error"] == "invalid_arguments"
+    assert error_of(parser)["problems"] == [{"arg": "movie_id", "problem": "expected integer"}]
+
+def test_unexpected_and_missing_arguments_are_rejected():
+    parser, accepted = feed('<function_call>{"name": "get_reviews", "arguments": {"id": 1}}')
+    assert not accepted
+    assert error_of(parser)["problems"] == [{"arg": "id", "problem": "unexpected argument"}]
+
+    parser, accepted = feed('<function_call>{"name": "get_showtimes", "arguments": {"title": "Dune"}}')
+    assert not accepted
+    assert error_of(parser)["problems"] == [{"arg": "location", "problem": "missing"}]
+
+def test_trailing_garbage_is_rejected():
+    parser, accepted = feed('<function_call>{"name": "get_reviews", "arguments": {"movie_id": 1}}', " oops</function_call>")
+
+    assert not accepted
+    assert error_of(parser)["error"] == "invalid_json"
+    assert "unexpected text" in error_of(parser)["problem"]
+
+def test_closing_tag_split_across_chunks_is_accepted():
+    parser, accepted = feed('<function_call>{"name": "get_reviews", "arguments": {"movie_id": 1}}\n</func', "tion_call>")
+
+    assert accepted
+    assert parser.close() == {"name": "get_reviews", "arguments": {"movie_id": 1}}
+
+def test_unterminated_call_is_rejected_at_close():
+    parser, accepted = feed('<function_call>{"name": "get_reviews", "arguments": {"movie_id": 1}')
+
+    assert accepted
+    assert parser.close() is None
+    assert error_of(parser)["error"] == "invalid_json"
+    assert error_of(parser)["problem"] == "unexpected end of input"
+
+@pytest.mark.parametrize("agent_class, body", [
+    (SupervisorAgent, '"saveImage"'),
+    (SupervisorAgent, '["saveImage"]'),
+    # MovieAgent dispatches read-only calls while the response streams
+    (MovieAgent, '["get_now_playing"]'),
+    (MovieAgent, '"get_now_playing"'),
+])
+def test_agents_answer_non_object_calls_with_an_error_result(monkeypatch, tmp_path, agent_class, body):
+    responses = iter([f"<function_call>{body}</function_call>", "Sorry, done."])
+    requests = []
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        requests.append(messages)
+        text = next(responses)
+
+        async def stream_chunks():
+            for start in range(0, len(text), 4):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[start:start + 4], tool_calls=None))], usage=None)
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    agent = agent_class(litellm_model="fake/model")
+    agent.artifacts_dir = str(tmp_path)
+    events = EventLog()
+    messages = MessageList([{"role": "user", "content": "Go"}])
+
+    async def run():
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+
+    results = [m["content"] for m in messages if m["role"] == "user" and m["content"].startswith("<function_result>")]
+    assert len(results) == 1
+    assert '"error":"invalid_json"' in results[0]
+    assert len(requests) == 2
+    assert messages[-1]["content"] == "Sorry, done."
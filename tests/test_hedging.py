@@ -0,0 +1,79 @@
+import asyncio
+
+from agents.hedging import HedgePolicy
+
+class FakeStream:
+    """A completion stream that records whether it was closed."""
+
+    def __init__(self, name, gate=None):
+        self.name = name
+        self.gate = gate
+        self.closed = False
+        self._chunks = iter([f"{name}-1", f"{name}-2"])
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.gate is not None:
+            await self.gate.wait()
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def aclose(self):
+        self.closed = True
+
+def opener(stream):
+    async def open_stream():
+        return stream
+    return open_stream
+
+def policy():
+    return HedgePolicy(initial_delay=0.01, max_hedge_ratio=1.0)
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+def test_fast_primary_is_not_hedged():
+    hedging = policy()
+    primary = FakeStream("primary")
+
+    async def run():
+        stream, hedge_won = await hedging.open(opener(primary), opener(FakeStream("hedge")))
+        return await collect(stream), hedge_won
+
+    assert asyncio.run(run()) == (["primary-1", "primary-2"], False)
+    assert hedging.stats()["hedges"] == 0
+
+def test_slow_primary_loses_to_the_hedge():
+    hedging = policy()
+    primary, hedge = FakeStream("primary", asyncio.Event()), FakeStream("hedge")
+
+    async def run():
+        stream, hedge_won = await hedging.open(opener(primary), opener(hedge))
+        chunks = await collect(stream)
+        await asyncio.gather(*hedging._discards)
+        return chunks, hedge_won
+
+    assert asyncio.run(run()) == (["hedge-1", "hedge-2"], True)
+    assert hedging.stats()["hedge_wins"] == 1
+
+def test_legs_finishing_together_close_the_loser():
+    hedging = policy()
+
+    async def run():
+        gate = asyncio.Event()
+        primary, hedge = FakeStream("primary", gate), FakeStream("hedge", gate)
+        # Both first chunks arrive on the same wake-up, after the hedge was sent
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        stream, hedge_won = await hedging.open(opener(primary), opener(hedge))
+        chunks = await collect(stream)
+        await asyncio.gather(*hedging._discards)
+        return chunks, hedge_won, primary, hedge
+
+    chunks, hedge_won, primary, hedge = asyncio.run(run())
+    assert (chunks, hedge_won) == (["primary-1", "primary-2"], False)
+    assert hedge.closed
+    assert not primary.closed
@@ -0,0 +1,69 @@
+import json
+import re
+
+import pytest
+
+from agents.json_stream import IncrementalJSONParser, JSONStreamError
+
+DOCUMENT = r'''{"name": "find_movie", "arguments": {"title": "Amélie \"Le fabuleux\"\n\\ 😀 😀",
+ "year": -2001, "rating": 7.25e-1, "tags": [true, false, null, 12, "a/b"], "empty": {}}}'''
+
+def parse(*chunks):
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+def test_whole_document_matches_json_loads():
+    assert parse(DOCUMENT) == json.loads(DOCUMENT)
+
+@pytest.mark.parametrize("split", range(1, len(DOCUMENT)))
+def test_every_chunk_boundary(split):
+    # Splits fall inside strings, escapes, \u sequences, numbers and literals
+    assert parse(DOCUMENT[:split], DOCUMENT[split:]) == json.loads(DOCUMENT)
+
+def test_one_character_chunks():
+    assert parse(*DOCUMENT) == json.loads(DOCUMENT)
+
+def test_number_split_across_chunks_at_the_top_level():
+    assert parse("12", "3.", "5e", "2") == 123.5e2
+
+def test_callbacks_report_keys_and_members_as_they_complete():
+    events = []
+    parser = IncrementalJSONParser(
+        on_key=lambda path, key: events.append(("key", path, key)),
+        on_member=lambda path, key, value: events.append(("member", path, key, value)),
+    )
+    parser.feed('{"name": "f", "arguments": {"a"')
+    assert events == [("key", (), "name"), ("member", (), "name", "f"), ("key", (), "arguments"), ("key", ("arguments",), "a")]
+    parser.feed(": 1}}")
+    assert events[-2:] == [("member", ("arguments",), "a", 1), ("member", (), "arguments", {"a": 1})]
+
+def test_feed_stops_at_the_end_of_the_value():
+    parser = IncrementalJSONParser()
+    text = '{"a": 1}  trailing'
+    assert parser.feed(text) == len('{"a": 1}')
+    assert parser.done
+
+@pytest.mark.parametrize("text, problem", [
+    ('{"a" 1}', "expected ':'"),
+    ('{"a": tru,', "invalid literal"),
+    ('{"a": "\\x"}', "invalid escape"),
+    ('{"a": "\\u12g4"}', "invalid \\u escape"),
+    ('{"a": 01}', "invalid number"),
+    ('{"a": 1 "b"', "expected ','"),
+    ('["a\n"]', "unescaped control character"),
+])
+def test_invalid_text_fails_at_the_first_bad_character(text, problem):
+    parser = IncrementalJSONParser()
+    with pytest.raises(JSONStreamError, match=re.escape(problem)) as error:
+        for c in text:
+            parser.feed(c)
+    assert error.value.position is not None
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a": "unterminated', '[1, 2', '{"a": tr', '"abc'])
+def test_close_rejects_an_unterminated_value(text):
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    with pytest.raises(JSONStreamError, match="unexpected end of input"):
+        parser.close()
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+
+from agents.base_agent import BaseAgent
+from agents.ledger import REPEATED_CALL_NOTE, RequestLedger, canonical_json, delegation_key, repeating_cycle
+from agents.messages import MessageList
+from agents.tools import side_effecting
+from batch_runner import EventLog
+
+def test_canonical_json_ignores_key_order_and_whitespace():
+    assert canonical_json('{"b": 1, "a": [1, 2]}') == canonical_json('{"a":[1,2],\n "b":1}') == '{"a":[1,2],"b":1}'
+    assert canonical_json("not  json\n at all") == "not json at all"
+
+def test_delegation_key_normalizes_instructions_and_attachments():
+    first = {"name": "ImplementationAgent", "instructions": "Build  the\nhero", "attachments": ["b.png", "a.png"]}
+    second = {"attachments": ["a.png", "b.png"], "instructions": "Build the hero", "name": "ImplementationAgent"}
+    assert delegation_key(first) == delegation_key(second)
+    assert delegation_key(first) != delegation_key({**second, "name": "PlanningAgent"})
+
+def test_repeating_cycle_finds_the_shortest_period():
+    a, b, c = ("a",), ("b",), ("c",)
+    assert repeating_cycle([c, a, a, a], max_period=3, repeats=3) == 1
+    assert repeating_cycle([c, a, b, a, b, a, b], max_period=3, repeats=3) == 2
+    assert repeating_cycle([a, b, a, b], max_period=3, repeats=3) is None
+    assert repeating_cycle([a, b, c, a, b, c, a, b, c], max_period=2, repeats=3) is None
+    assert repeating_cycle([], max_period=3, repeats=3) is None
+
+def test_ledger_joins_identical_calls_even_while_running():
+    ledger = RequestLedger()
+    started = []
+
+    async def lookup():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        first, first_repeated = ledger.call("key", lookup)
+        second, second_repeated = ledger.call("key", lookup)
+        other, _ = ledger.call("other", lookup)
+        return await first, first_repeated, await second, second_repeated, await other
+
+    assert asyncio.run(run()) == ("result", False, "result", True, "result")
+    assert len(started) == 2
+    assert ledger.as_dict()["repeated_calls"] == 1
+
+def test_ledger_keeps_the_first_delegation_result():
+    ledger = RequestLedger()
+    assert ledger.delegation_result("key") is None
+    ledger.record_delegation("key", "first")
+    ledger.record_delegation("key", "second")
+    assert ledger.delegation_result("key") == "first"
+    assert ledger.as_dict() == {"calls": 0, "repeated_calls": 0, "delegations": 1, "repeated_delegations": 1}
+
+class LoopingAgent(BaseAgent):
+    functions = ("lookup", "write")
+    loop_repeats = 3
+
+    def __init__(self):
+        super().__init__(name="Looping", system_prompt="Loop.", litellm_model="fake/model")
+        self.calls = []
+
+    def lookup(self, key: str) -> str:
+        """Look up a key."""
+        self.calls.append(("lookup", key))
+        return f"value of {key}"
+
+    @side_effecting
+    def write(self, key: str) -> str:
+        """Write a key."""
+        self.calls.append(("write", key))
+        return "written"
+
+def run_scripted(monkeypatch, agent, responses):
+    responses = iter(responses)
+    requests = []
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        requests.append(messages)
+        text = next(responses)
+
+        async def stream_chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    events = EventLog()
+    messages = MessageList([{"role": "user", "content": "Go"}])
+
+    async def run():
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+    return messages, requests
+
+def call(name: str, key: str) -> str:
+    return f'<function_call>{{"name": "{name}", "arguments": {{"key": "{key}"}}}}</function_call>'
+
+def test_repeated_read_only_calls_reuse_the_result_but_writes_run_again(monkeypatch):
+    agent = LoopingAgent()
+    messages, _ = run_scripted(monkeypatch, agent, [
+        call("lookup", "a"), call("write", "a"), call("lookup", "a"), call("write", "a"), "Done.",
+    ])
+
+    assert agent.calls == [("lookup", "a"), ("write", "a"), ("write", "a")]
+    results = [m["content"] for m in messages if m["content"].startswith("<function_result>")]
+    assert results[2] == f"<function_result>value of a{REPEATED_CALL_NOTE}</function_result>"
+
+def test_a_repeating_cycle_wraps_up_the_run(monkeypatch):
+    agent = LoopingAgent()
+    messages, requests = run_scripted(monkeypatch, agent, [call("write", "a")] * 3 + ["Summary: writing a repeats."])
+
+    assert agent.calls == [("write", "a")] * 3
+    assert len(requests) == 4
+    assert messages[-2]["content"].startswith("<loop_detected>The same action repeated 3 times.")
+    assert messages[-1]["content"] == "Summary: writing a repeats."
+
+def test_the_turn_limit_wraps_up_the_run(monkeypatch):
+    agent = LoopingAgent()
+    agent.max_react_iterations = 2
+    messages, requests = run_scripted(monkeypatch, agent, [call("write", "a"), call("write", "b"), "Summary."])
+
+    assert len(requests) == 3
+    assert messages[-2]["content"].startswith("<loop_detected>The limit of 2 turns")
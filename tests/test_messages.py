@@ -0,0 +1,52 @@
+import gc
+
+from agents import messages as messages_module
+from agents.messages import ImagePart, Message, MessageList, as_dicts, share_blob
+
+IMAGE_URL = "data:image/png;base64,iVBORw0KGgo="
+
+def multimodal(text: str = "Build this", url: str = IMAGE_URL) -> dict:
+    return {"role": "user", "content": [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": url}}]}
+
+def test_messages_expand_back_to_the_dicts_they_were_built_from():
+    dicts = [
+        {"role": "system", "content": "You build pages."},
+        multimodal(),
+        {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "https://example.com/a.png"}}]},
+        {"role": "assistant", "content": None},
+    ]
+    assert as_dicts(MessageList(dicts)) == dicts
+
+def test_message_reads_like_a_dict():
+    message = Message.from_dict(multimodal())
+    assert message["role"] == "user" and message.get("content") == multimodal()["content"]
+    assert message.get("name", "none") == "none"
+    assert "content" in message and "name" not in message
+    assert message.text == "Build this"
+    assert message.image_count == 1
+    assert Message.from_dict(message) is message
+
+def test_images_are_shared_between_messages():
+    history = MessageList([multimodal("first")])
+    history.append(multimodal("second"))
+    history.insert(0, {"role": "system", "content": "Hi"})
+    history.extend([multimodal("third")])
+
+    assert all(isinstance(message, Message) for message in history)
+    blobs = {id(message._content[1].blob) for message in history[1:]}
+    assert len(blobs) == 1
+    assert isinstance(history[1]._content[1], ImagePart)
+
+def test_blobs_are_dropped_with_their_last_message():
+    data = "aGVsbG8gd29ybGQ="
+    message = Message.from_dict(multimodal(url=f"data:image/jpeg;base64,{data}"))
+    blob_hash = message._content[1].blob.hash
+    assert share_blob(data) is message._content[1].blob
+
+    del message
+    gc.collect()
+    assert blob_hash not in messages_module._BLOBS
+
+def test_as_dicts_passes_plain_dicts_through():
+    plain = {"role": "user", "content": "Hi"}
+    assert as_dicts([plain, Message("assistant", "Hello")]) == [plain, {"role": "assistant", "content": "Hello"}]
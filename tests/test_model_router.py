@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+from agents.messages import MessageList
+from agents.model_router import ModelRouter
+from agents.supervisor_agent import SupervisorAgent
+from batch_runner import EventLog
+
+CONFIG = {
+    "tiers": {
+        "fast": ["fake/fast-a", "fake/fast-b"],
+        "strong": ["fake/strong-a"],
+    },
+    "default_tier": "strong",
+    "agents": {"MovieAgent": "fast"},
+    "rules": [{"agent": "SupervisorAgent", "last_message": "image", "tier": "fast"}],
+    "escalation": {"fast": "strong", "strong": "fast"},
+    "first_token_timeout": 1,
+}
+
+def chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+
+class FakeProvider:
+    """litellm.acompletion stand-in: streams `text`, or raises the error set for a model."""
+
+    def __init__(self, text: str = "Hello there", errors: dict = None):
+        self.text = text
+        self.errors = errors or {}
+        self.models = []
+
+    async def __call__(self, model, messages, stream=True, **kwargs):
+        self.models.append(model)
+        if model in self.errors:
+            raise self.errors[model]
+
+        async def stream_chunks():
+            for word in self.text.split(" "):
+                yield chunk(word + " ")
+        return stream_chunks()
+
+def rate_limited(model):
+    return litellm.RateLimitError("429 Too Many Requests", llm_provider="fake", model=model)
+
+def unavailable(model):
+    return litellm.ServiceUnavailableError("503 Service Unavailable", llm_provider="fake", model=model)
+
+async def read(stream) -> str:
+    return "".join([c.choices[0].delta.content async for c in stream])
+
+def test_select_tier_by_agent_and_turn():
+    router = ModelRouter(CONFIG)
+    image = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AA"}}]}]
+    text = [{"role": "user", "content": "Build it"}]
+
+    assert router.select_tier("SupervisorAgent", image) == "fast"
+    assert router.select_tier("SupervisorAgent", text) == "strong"
+    assert router.select_tier("MovieAgent", text) == "fast"
+    assert router.select_tier("PlanningAgent", image) == "strong"
+
+@pytest.mark.parametrize("error", [rate_limited, unavailable])
+def test_fails_over_to_next_model_of_tier(error):
+    provider = FakeProvider(errors={"fake/fast-a": error("fake/fast-a")})
+    router = ModelRouter(CONFIG, completion=provider)
+
+    async def run():
+        stream, model = await router.acompletion("fast", [{"role": "user", "content": "hi"}])
+        return await read(stream), model
+
+    text, model = asyncio.run(run())
+    assert (text, model) == ("Hello there ", "fake/fast-b")
+    assert provider.models == ["fake/fast-a", "fake/fast-b"]
+    stats = router.stats()["fast"]
+    assert (stats["requests"], stats["failures"], stats["failovers"], stats["escalations"]) == (2, 1, 1, 0)
+
+def test_escalates_when_every_model_of_tier_fails():
+    provider = FakeProvider(errors={"fake/fast-a": rate_limited("fake/fast-a"), "fake/fast-b": unavailable("fake/fast-b")})
+    router = ModelRouter(CONFIG, completion=provider)
+
+    async def run():
+        stream, model = await router.acompletion("fast", [{"role": "user", "content": "hi"}])
+        return await read(stream), model
+
+    text, model = asyncio.run(run())
+    assert model == "fake/strong-a"
+    assert provider.models == ["fake/fast-a", "fake/fast-b", "fake/strong-a"]
+    stats = router.stats()
+    assert stats["fast"]["escalations"] == 1
+    assert (stats["strong"]["requests"], stats["strong"]["failures"]) == (1, 0)
+
+def test_raises_last_error_once_escalation_is_exhausted():
+    provider = FakeProvider(errors={model: unavailable(model) for model in ("fake/fast-a", "fake/fast-b", "fake/strong-a")})
+    router = ModelRouter(CONFIG, completion=provider)
+
+    with pytest.raises(litellm.ServiceUnavailableError):
+        asyncio.run(router.acompletion("strong", [{"role": "user", "content": "hi"}]))
+    # strong escalates to fast, which must not escalate back to strong
+    assert provider.models == ["fake/strong-a", "fake/fast-a", "fake/fast-b"]
+
+def test_delegated_agents_use_the_delegating_agents_model(monkeypatch, tmp_path):
+    responses = iter([
+        '<delegate_agent>{"name": "PlanningAgent", "instructions": "Write a plan."}</delegate_agent>',
+        "The plan is ready.",
+        "Done.",
+    ])
+    models = []
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        models.append(model)
+        text = next(responses)
+
+        async def stream_chunks():
+            yield chunk(text)
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    agent = SupervisorAgent(litellm_model="fake/configured")
+    agent.artifacts_dir = str(tmp_path)
+
+    events = EventLog()
+
+    async def run():
+        messages = MessageList([{"role": "user", "content": "Plan a page"}])
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+    assert models == ["fake/configured"] * 3
@@ -0,0 +1,81 @@
+from movie_store import REVIEW_EXCERPT_CHARS, MovieStore
+
+MOVIES = [
+    {"id": 1, "title": "Dune: Part Two", "release_date": "2024-02-27", "overview": "Paul joins the Fremen."},
+    {"id": 2, "title": "Kung Fu Panda 4", "release_date": "2024-03-02"},
+    {"id": 3, "title": "Godzilla x Kong: The New Empire"},
+    {"title": "No id"},
+]
+
+def review(author, rating, created_at, content="Good."):
+    return {"author": author, "author_details": {"rating": rating}, "created_at": created_at, "content": content}
+
+def store_with_movies() -> MovieStore:
+    store = MovieStore()
+    store.add_movies(MOVIES, now_playing=True)
+    return store
+
+def test_movies_without_an_id_are_skipped():
+    store = store_with_movies()
+    assert [movie.id for movie in store.now_playing()] == [1, 2, 3]
+    assert store.get_movie("1").title == "Dune: Part Two"
+
+def test_later_pages_extend_the_now_playing_list():
+    store = store_with_movies()
+    store.add_movies([{"id": 2, "title": "Kung Fu Panda 4"}, {"id": 4, "title": "Ghostbusters"}], now_playing=True, append=True)
+    assert [movie.id for movie in store.now_playing()] == [1, 2, 3, 4]
+
+    store.add_movies([{"id": 4, "title": "Ghostbusters"}], now_playing=True)
+    assert [movie.id for movie in store.now_playing()] == [4]
+
+def test_search_tolerates_typos_and_partial_titles():
+    store = store_with_movies()
+    assert [movie.id for movie in store.search("dune part 2")][:1] == [1]
+    assert [movie.id for movie in store.search("Godzila Kong")][:1] == [3]
+    assert store.search("Oppenheimer") == []
+    assert store.search("!!") == []
+
+def test_match_titles_finds_whole_titles_only():
+    store = store_with_movies()
+    text = "Is Kung Fu Panda 4 better than Dune: Part Two? Not Kung Fu Panda 40."
+    assert store.match_titles(text) == {"Kung Fu Panda 4": 2, "Dune: Part Two": 1}
+    assert store.match_titles("Dune is a book") == {}
+
+def test_review_aggregate_ignores_duplicates_and_unrated_reviews():
+    store = store_with_movies()
+    store.add_reviews(1, [review("a", 9, "2024-03-01"), review("b", None, "2024-03-03")])
+    aggregate = store.add_reviews(1, [review("a", 9, "2024-03-01"), review("c", 4, "2024-03-02")])
+
+    assert (aggregate.count, aggregate.rated_count) == (3, 2)
+    assert (aggregate.average_rating, aggregate.min_rating, aggregate.max_rating) == (6.5, 4.0, 9.0)
+    assert aggregate.latest == "2024-03-03"
+    assert store.has_reviews(1) and not store.has_reviews(2)
+    assert store.review_aggregate(2) is None
+
+def test_long_reviews_are_kept_as_excerpts():
+    store = store_with_movies()
+    store.add_reviews(1, [review("a", 8, "2024-03-01", "x" * (REVIEW_EXCERPT_CHARS + 10))])
+
+    record = store.top_reviews(1)[0]
+    assert record.excerpt == "x" * REVIEW_EXCERPT_CHARS + "…"
+    assert record.content_length == REVIEW_EXCERPT_CHARS + 10
+
+def test_top_reviews_alternate_high_and_low_then_recent_unrated():
+    store = store_with_movies()
+    store.add_reviews(1, [
+        review("high", 10, "2024-03-01"),
+        review("mid", 6, "2024-03-02"),
+        review("low", 2, "2024-03-03"),
+        review("old", None, "2024-01-01"),
+        review("new", None, "2024-04-01"),
+    ])
+
+    assert [r.author for r in store.top_reviews(1, k=2)] == ["high", "low"]
+    assert [r.author for r in store.top_reviews(1, k=5)] == ["high", "low", "mid", "new", "old"]
+    assert store.top_reviews(2) == []
+
+def test_clear_empties_the_index():
+    store = store_with_movies()
+    store.clear()
+    assert store.now_playing() == []
+    assert store.search("Dune") == []
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+
+from agents.base_agent import BaseAgent
+from agents.messages import MessageList
+from agents.tools import ToolCallAssembler, build_tool_schema
+from batch_runner import EventLog
+
+def get_showtimes(title: str, location: str, days: int = 1, formats: list[str] = None) -> str:
+    """Get movie showtimes for a specific title and location.
+
+    Args:
+        title: Name of the movie
+        location: Location to search for showtimes,
+            as a city or zip code
+        days: Number of days to search
+        formats: Screen formats to include
+
+    Returns:
+        The showtimes
+    """
+
+def delta(index, name=None, arguments=None):
+    return SimpleNamespace(index=index, function=SimpleNamespace(name=name, arguments=arguments))
+
+def test_tool_schema_from_signature_and_docstring():
+    function = build_tool_schema(get_showtimes)["function"]
+
+    assert function["name"] == "get_showtimes"
+    assert function["description"] == "Get movie showtimes for a specific title and location."
+    parameters = function["parameters"]
+    assert parameters["required"] == ["title", "location"]
+    assert parameters["properties"] == {
+        "title": {"type": "string", "description": "Name of the movie"},
+        "location": {"type": "string", "description": "Location to search for showtimes, as a city or zip code"},
+        "days": {"type": "integer", "description": "Number of days to search"},
+        "formats": {"type": "array", "items": {"type": "string"}, "description": "Screen formats to include"},
+    }
+
+def test_assembler_turns_streamed_deltas_into_function_call_tags():
+    assembler = ToolCallAssembler()
+    text = assembler.feed([delta(0, "get_showtimes", '{"title": ')])
+    text += assembler.feed([delta(0, None, '"Dune"}')])
+    text += assembler.feed([delta(1, "get_now_playing", "")])
+    text += assembler.close()
+
+    assert text == (
+        '<function_call>{"name": "get_showtimes", "arguments": {"title": "Dune"}}</function_call>'
+        '<function_call>{"name": "get_now_playing", "arguments": {}}</function_call>'
+    )
+    assert assembler.close() == ""
+
+class ShowtimesAgent(BaseAgent):
+    native_tools = True
+    functions = ("get_showtimes",)
+
+    def __init__(self):
+        super().__init__(
+            name="Showtimes",
+            system_prompt="Find showtimes.\n<available_functions>[...]</available_functions>",
+            litellm_model="fake/model"
+        )
+
+    def get_showtimes(self, title: str, location: str) -> str:
+        """Get movie showtimes for a specific title and location.
+
+        Args:
+            title: Name of the movie
+            location: Location to search for showtimes
+        """
+        return f"{title} in {location}: 7pm"
+
+def test_native_tool_calls_run_through_the_function_call_protocol(monkeypatch):
+    requests = []
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        requests.append((messages, kwargs))
+
+        async def stream_chunks():
+            if len(requests) == 1:
+                for deltas in ([delta(0, "get_showtimes", '{"title": "Dune", ')], [delta(0, None, '"location": "Boston"}')]):
+                    yield SimpleNamespace(
+                        choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=deltas), finish_reason=None)],
+                        usage=None
+                    )
+            else:
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content="Dune plays at 7pm.", tool_calls=None), finish_reason="stop")],
+                    usage=None
+                )
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    monkeypatch.setattr(litellm, "supports_function_calling", lambda model: True)
+    agent = ShowtimesAgent()
+    events = EventLog()
+    messages = MessageList([{"role": "user", "content": "When is Dune on in Boston?"}])
+
+    async def run():
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+
+    first_messages, first_kwargs = requests[0]
+    assert [tool["function"]["name"] for tool in first_kwargs["tools"]] == ["get_showtimes"]
+    assert "<available_functions>" not in first_messages[0]["content"]
+    assert "<function_result>Dune in Boston: 7pm</function_result>" in [m["content"] for m in messages]
+    assert messages[-1]["content"] == "Dune plays at 7pm."
+
+def test_models_without_tool_support_use_the_xml_protocol(monkeypatch):
+    monkeypatch.setattr(litellm, "supports_function_calling", lambda model: False)
+    agent = ShowtimesAgent()
+    assert not agent._uses_native_tools("fake/model")
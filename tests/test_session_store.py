@@ -0,0 +1,88 @@
+import logging
+import os
+
+import pytest
+
+from agents.checkpoint import CheckpointStore
+from agents.session_store import SessionStore, SQLiteSessionStore
+
+IMAGE = {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,/9j/AAAA"}}
+
+@pytest.fixture(params=["sqlite", "files"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    return CheckpointStore(str(tmp_path / "checkpoints"))
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+def test_save_appends_and_round_trips_images(store):
+    messages = [{"role": "user", "content": [{"type": "text", "text": "Build this"}, IMAGE]}]
+    store.save("session", messages)
+    messages.append({"role": "assistant", "content": "Saved."})
+    store.save("session", messages)
+
+    assert store.load("session") == messages
+    assert store.load("session", start=1) == messages[1:]
+    assert store.load("other") is None
+
+def test_stale_history_is_not_saved(store, caplog):
+    newer = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    store.save("session", newer)
+
+    stale = [{"role": "user", "content": "Hi"}]
+    with caplog.at_level(logging.WARNING):
+        store.save("session", stale)
+
+    assert store.load("session") == newer
+    assert "newer than the one being saved" in caplog.text
+
+def test_delete_removes_the_path_and_everything_below_it(store):
+    paths = ["run", "run/1-a-PlanningAgent", "run/1-a-PlanningAgent/2-b-ImplementationAgent", "run/1-ab-Agent", "other"]
+    for path in paths:
+        store.save(path, [{"role": "user", "content": path}])
+
+    store.delete("run/1-a-PlanningAgent")
+
+    assert store.load("run/1-a-PlanningAgent") is None
+    assert store.load("run/1-a-PlanningAgent/2-b-ImplementationAgent") is None
+    # A sibling sharing a name prefix and the parent stay
+    assert store.load("run/1-ab-Agent") == [{"role": "user", "content": "run/1-ab-Agent"}]
+    assert store.load("run") == [{"role": "user", "content": "run"}]
+
+    store.delete("run")
+    assert store.load("run") is None
+    assert store.load("run/1-ab-Agent") is None
+    assert store.load("other") == [{"role": "user", "content": "other"}]
+
+def test_file_store_reads_back_only_after_someone_else_writes(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    ours, theirs = CheckpointStore(directory), CheckpointStore(directory)
+    messages = [{"role": "user", "content": "Hi"}]
+    ours.save("session", messages)
+
+    # Another process appends a turn and a torn write
+    history = messages + [{"role": "assistant", "content": "Hello"}]
+    theirs.save("session", history)
+    with open(ours._file("session"), "ab") as f:
+        f.write(b'{"r":"us')
+
+    # Our stale history is detected even though we wrote the file last time
+    ours.save("session", messages)
+    assert ours.load("session") == history
+
+    history.append({"role": "user", "content": "Thanks"})
+    ours.save("session", history)
+    assert theirs.load("session") == history
+
+def test_file_store_loads_histories_written_under_the_old_file_names(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    messages = [{"role": "user", "content": "Hi"}]
+    store.save("run/1-a-Agent", messages)
+    os.replace(store._file("run/1-a-Agent"), store._legacy_file("run/1-a-Agent"))
+
+    assert store.load("run/1-a-Agent") == messages
+    store.delete("run/1-a-Agent")
+    assert store.load("run/1-a-Agent") is None
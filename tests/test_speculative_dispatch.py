@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import litellm
+
+from agents.base_agent import BaseAgent
+from agents.messages import MessageList
+from agents.tools import side_effecting
+from batch_runner import EventLog
+
+class LookupAgent(BaseAgent):
+    speculative_dispatch = True
+    functions = ("lookup", "record")
+
+    def __init__(self):
+        super().__init__(name="Lookup", system_prompt="Look things up.", litellm_model="fake/model")
+        self.calls = []
+        self.lookup_started = threading.Event()
+        self.stream_finished = False
+
+    def lookup(self, key: str) -> str:
+        """Look up a key."""
+        self.calls.append(("lookup", key, self.stream_finished))
+        self.lookup_started.set()
+        return f"value of {key}"
+
+    @side_effecting
+    def record(self, note: str) -> str:
+        """Record a note."""
+        self.calls.append(("record", note, self.stream_finished))
+        return "recorded"
+
+def chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))], usage=None)
+
+def run_agent(monkeypatch, agent):
+    responses = iter(["calls", "Done."])
+
+    async def acompletion(model, messages, stream=True, **kwargs):
+        text = next(responses)
+
+        async def stream_chunks():
+            if text != "calls":
+                yield chunk(text)
+                return
+            yield chunk('<function_call>{"name": "lookup", "arguments": {"key": "a"}}</function_call>')
+            # Keep streaming until the lookup has started (or give up after a second)
+            for _ in range(100):
+                if agent.lookup_started.is_set():
+                    break
+                await asyncio.sleep(0.01)
+            yield chunk('<function_call>{"name": "record", "arguments": {"note": "b"}}</function_call>')
+            yield chunk("Waiting for the results.")
+            agent.stream_finished = True
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    events = EventLog()
+    messages = MessageList([{"role": "user", "content": "Go"}])
+
+    async def run():
+        async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+            pass
+
+    asyncio.run(run())
+    return messages
+
+def test_read_only_calls_start_while_the_response_streams(monkeypatch):
+    agent = LookupAgent()
+    messages = run_agent(monkeypatch, agent)
+
+    # The lookup ran before the stream ended; the side-effecting call waited for it
+    assert agent.calls == [("lookup", "a", False), ("record", "b", True)]
+    results = [m["content"] for m in messages if m["content"].startswith("<function_result>")]
+    assert results == ["<function_result>value of a</function_result>", "<function_result>recorded</function_result>"]
+
+def test_calls_wait_for_the_response_without_speculative_dispatch(monkeypatch):
+    monkeypatch.setattr(LookupAgent, "speculative_dispatch", False)
+    agent = LookupAgent()
+    run_agent(monkeypatch, agent)
+
+    assert agent.calls == [("lookup", "a", True), ("record", "b", True)]
@@ -0,0 +1,164 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from agents.response_cache import ResponseCache
+from agents.stream_pipeline import (
+    TAG_CLOSE, TAG_OPEN, TAG_TEXT, TEXT,
+    ActionTailStage, CacheStage, ProviderSource, QueueSink, StopAfterTags, StreamPipeline, StreamStage, TagParser,
+    UsageStage
+)
+from agents.usage import UsageMeter
+
+def chunk(content, finish_reason=None):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)]
+    )
+
+async def provider(chunks, error=None):
+    for item in chunks:
+        yield item
+    if error is not None:
+        raise error
+
+def cached_response(chunks, error=None):
+    cache = ResponseCache(directory=None)
+    source = ProviderSource(provider(chunks, error))
+    pipeline = StreamPipeline(source, stages=[CacheStage(cache, "key", "fake/model", source)])
+
+    async def run():
+        return [token async for token in pipeline]
+
+    if error is None:
+        asyncio.run(run())
+    else:
+        with pytest.raises(type(error)):
+            asyncio.run(run())
+    return cache.get("key")
+
+def test_finished_response_is_cached():
+    assert cached_response([chunk("Hello"), chunk(" world", "stop")]) == "Hello world"
+
+def test_response_cut_at_the_token_limit_is_not_cached():
+    assert cached_response([chunk("Hello"), chunk(" wor", "length")]) is None
+
+def test_failed_response_is_not_cached():
+    assert cached_response([chunk("Hello")], ConnectionError("reset")) is None
+
+RESPONSE = 'Let me check. <function_call>{"name": "a"}</function_call> Then a < b.'
+
+class Tokens:
+    """A token source that records whether its stream was closed."""
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.closed = False
+
+    async def __aiter__(self):
+        try:
+            for token in self.tokens:
+                yield token
+        finally:
+            self.closed = True
+
+def split(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+def run_pipeline(pipeline):
+    async def run():
+        return [token async for token in pipeline]
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("size", [1, 2, 5, 13, len(RESPONSE)])
+def test_tag_parser_events_cover_the_response_at_any_token_boundary(size):
+    parser = TagParser()
+    events = [event for token in split(RESPONSE, size) for event in parser.feed(token)] + parser.close()
+
+    assert "".join(event.text for event in events) == RESPONSE
+    assert all(RESPONSE[:event.end].endswith(event.text) for event in events)
+    tags = [(event.kind, event.tag) for event in events if event.tag is not None]
+    assert tags[0] == (TAG_OPEN, "function_call") and tags[-1] == (TAG_CLOSE, "function_call")
+    assert {kind for kind, _ in tags[1:-1]} <= {TAG_TEXT}
+    assert "".join(event.text for event in events if event.tag is not None) == '<function_call>{"name": "a"}</function_call>'
+    assert "".join(event.text for event in events if event.kind == TEXT) == "Let me check.  Then a < b."
+
+def test_unfinished_opening_tag_is_message_text_at_the_end():
+    parser = TagParser()
+    assert [event.text for event in parser.feed("a <b")] == ["a "]
+    assert [(event.kind, event.text) for event in parser.close()] == [(TEXT, "<b")]
+
+def test_pipeline_stops_just_after_the_tag_and_closes_the_source():
+    source = Tokens(split(RESPONSE, 10))
+    stop = StopAfterTags(("function_call",))
+    pipeline = StreamPipeline(source, TagParser(), [stop])
+
+    async def run():
+        tokens = [token async for token in pipeline]
+        # Closed by the pipeline, not left for the event loop to finalize
+        return tokens, source.closed
+
+    tokens, closed = asyncio.run(run())
+
+    assert closed
+    assert "".join(tokens) == 'Let me check. <function_call>{"name": "a"}</function_call>'
+    # The rest of the token the tag closed in is dropped, not yielded
+    assert pipeline.result.dropped == " T"
+    assert pipeline.result.stopped_by is stop and not pipeline.result.complete
+    assert stop.tag == "function_call"
+
+def test_pipeline_without_stages_passes_tokens_through():
+    pipeline = StreamPipeline(Tokens(["a", "<b>"]), TagParser(), [StopAfterTags(())])
+    assert run_pipeline(pipeline) == ["a", "<b>"]
+    assert pipeline.result is not None and pipeline.result.complete
+
+def test_only_enabled_stages_with_their_own_hooks_are_run():
+    class EndOnly(StreamStage):
+        def on_end(self, result):
+            pass
+
+    disabled = StopAfterTags(())
+    end_only = EndOnly()
+    pipeline = StreamPipeline(Tokens([]), TagParser(), [disabled, end_only])
+    assert pipeline._event_stages == [] and pipeline._end_stages == [end_only]
+
+def test_queue_sink_forwards_message_text_and_each_tag_to_its_own_stream():
+    streams = []
+
+    async def create_stream(name, callback):
+        queue = asyncio.Queue()
+        streams.append((name, queue))
+        return queue
+
+    async def run():
+        sink = QueueSink(create_stream, on_tag_start=None, on_message_start=None)
+        async for _ in StreamPipeline(Tokens(split(RESPONSE, 7)), TagParser(), sinks=[sink]):
+            pass
+        contents = []
+        for name, queue in streams:
+            parts = []
+            while (item := queue.get_nowait()) is not None:
+                parts.append(item)
+            contents.append((name, "".join(parts)))
+        return contents
+
+    assert asyncio.run(run()) == [
+        (None, "Let me check.  Then a < b."),
+        ("function_call", '<function_call>{"name": "a"}</function_call>'),
+    ]
+
+def test_usage_and_action_tail_are_recorded_for_a_stopped_turn():
+    meter = UsageMeter()
+    source = ProviderSource(provider([chunk(token) for token in split(RESPONSE, 10)]))
+    stages = [
+        StopAfterTags(("function_call",)),
+        ActionTailStage(meter, "gpt-4o", ("function_call",)),
+        UsageStage("Agent", "gpt-4o", [{"role": "user", "content": "Hi"}], source, meter),
+    ]
+
+    run_pipeline(StreamPipeline(source, TagParser(), stages))
+
+    assert meter.turns == 1 and meter.estimated_turns == 1
+    assert meter.completion_tokens > 0
+    assert (meter.action_turns, meter.stopped_turns) == (1, 1)
+    assert meter.dropped_tokens > 0
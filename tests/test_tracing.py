@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import litellm
+
+from agents.messages import MessageList
+from agents.supervisor_agent import SupervisorAgent
+from agents.tracing import LLM, MAX_MESSAGE_TEXT, TraceExporter, Tracer, summarize_messages
+from batch_runner import EventLog
+
+IMAGE_URL = "data:image/jpeg;base64," + "A" * 100000
+
+def image_message(text: str) -> dict:
+    return {"role": "user", "content": [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": IMAGE_URL}}]}
+
+def test_summarize_messages_keeps_roles_short_text_and_image_hashes():
+    summary = summarize_messages([
+        {"role": "system", "content": "x" * (MAX_MESSAGE_TEXT + 500)},
+        image_message("Build this"),
+        {"role": "assistant", "content": None},
+    ])
+
+    assert summary[0]["role"] == "system"
+    assert summary[0]["text"].startswith("x" * MAX_MESSAGE_TEXT)
+    assert summary[0]["text"].endswith(f"...({MAX_MESSAGE_TEXT + 500} chars)")
+    assert summary[1] == {
+        "role": "user",
+        "text": "Build this",
+        "images": [hashlib.sha256(IMAGE_URL.encode("utf-8")).hexdigest()[:16]],
+    }
+    assert summary[2] == {"role": "assistant", "text": ""}
+
+def test_llm_spans_store_message_summaries(monkeypatch, tmp_path):
+    async def acompletion(model, messages, stream=True, **kwargs):
+        async def stream_chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Nice mockup.", tool_calls=None))], usage=None)
+        return stream_chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    tracer = Tracer(TraceExporter([]))
+    agent = SupervisorAgent(litellm_model="fake/model")
+    agent.artifacts_dir = str(tmp_path)
+    agent.tracer = tracer
+    events = EventLog()
+
+    async def run():
+        async with tracer.trace("on_message") as trace:
+            messages = MessageList([image_message("What do you think?")])
+            async for _ in agent.react_to(messages, on_tag_start=events.on_tag_start, on_message_start=events.on_message_start):
+                pass
+        return trace
+
+    trace = asyncio.run(run())
+    tracer.exporter.close()
+
+    (span,) = [span for span in trace.spans if span.kind == LLM]
+    assert [m["role"] for m in span.inputs["messages"]] == ["system", "user"]
+    assert span.inputs["messages"][1]["images"] == [hashlib.sha256(IMAGE_URL.encode("utf-8")).hexdigest()[:16]]
+    assert IMAGE_URL not in repr(span.inputs)
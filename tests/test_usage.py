@@ -0,0 +1,37 @@
+import gc
+import weakref
+
+from agents import usage
+from agents.usage import count_text_tokens
+
+class Text(str):
+    """A str that can be weakly referenced, to check the cache doesn't hold on to it."""
+
+def test_token_counts_are_cached_without_keeping_the_text(monkeypatch):
+    calls = []
+
+    def token_counter(model, text):
+        calls.append(text)
+        return len(text.split())
+
+    monkeypatch.setattr(usage.litellm, "token_counter", token_counter)
+    text = Text("a long artifact " * 1000)
+    ref = weakref.ref(text)
+
+    assert count_text_tokens("fake/model", text) == 3000
+    assert count_text_tokens("fake/model", "a long artifact " * 1000) == 3000
+    assert len(calls) == 1
+
+    del text, calls[:]
+    gc.collect()
+    assert ref() is None
+
+def test_token_count_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(usage, "TOKEN_COUNT_CACHE_SIZE", 3)
+    monkeypatch.setattr(usage, "_TOKEN_COUNTS", usage.OrderedDict())
+    monkeypatch.setattr(usage.litellm, "token_counter", lambda model, text: 1)
+
+    for word in ("one", "two", "three", "four"):
+        count_text_tokens("fake/model", word)
+
+    assert len(usage._TOKEN_COUNTS) == 3